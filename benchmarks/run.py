@@ -0,0 +1,253 @@
+# benchmarks/run.py
+"""
+Offline performance benchmarks for the trading assistant.
+
+    python -m benchmarks.run                    # run and compare with baseline
+    python -m benchmarks.run --update-baseline  # record a new baseline
+    python -m benchmarks.run --latency-ms 40    # add simulated network latency
+
+All external services are replaced by the in-process fakes in
+benchmarks/stubs.py, so runs are repeatable and need no credentials.
+Exits with status 1 if any benchmark regressed beyond --tolerance.
+
+Baselines also store a calibration time: a fixed pure-Python workload
+timed on the machine that recorded them. Baseline figures are scaled by
+the ratio of this run's calibration to the recorded one, so a slower
+machine is not reported as a regression. A result must also be worse by
+an absolute margin (MIN_DELTA_MS, per benchmark) before it is flagged, so
+microsecond-scale benchmarks don't fail on timer noise.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import gemini, log, market_data, metrics
+from benchmarks.stubs import OfflineEnvironment
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+PROMPTS = [
+    "What is the price of INFY?",
+    "buy 1 TCS",
+    "show my portfolio",
+    "What is the price of SYM1500?",
+]
+
+
+def _timings(func, iterations, warmup=2):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _latency_result(samples):
+    ordered = sorted(samples)
+    return {
+        "kind": "latency",
+        "iterations": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+# Absolute slowdown (ms per call or per request) below which a result is never flagged
+DEFAULT_MIN_DELTA_MS = 0.5
+MIN_DELTA_MS = {
+    "isin_lookup_csv": 0.05,
+    "isin_lookup_fmp": 0.05,
+    "current_price": 0.1,
+    "candle_conversion": 2.0,
+    "assistant_price": 2.0,
+    "assistant_portfolio": 2.0,
+}
+CALIBRATION_KEY = "_calibration"
+
+
+def calibrate(iterations=15):
+    """Fastest ms of a fixed sort / dict / JSON workload; a proxy for this machine's single-thread speed."""
+    rng = random.Random(0)
+    values = [rng.random() for _ in range(20_000)]
+    rows = [{"key": f"NSE_EQ|{i}", "price": v} for i, v in enumerate(values[:2_000])]
+
+    def work():
+        sorted(values)
+        {row["key"]: row["price"] for row in rows}
+        json.loads(json.dumps(rows))
+
+    # The minimum: noise only ever adds time
+    return min(_timings(work, iterations)) * 1000
+
+
+# --- Benchmarks ---
+
+def bench_isin_lookup_csv(env, iterations):
+    # Worst case: symbol near the end of the bhavcopy
+    symbol = env.universe.instruments[-1]["symbol"]
+    return _latency_result(_timings(lambda: gemini.get_isin_from_csv_wrapper(symbol), iterations))
+
+
+def bench_isin_lookup_fmp(env, iterations):
+    return _latency_result(_timings(lambda: gemini.get_isin_for_symbol_wrapper("INFY"), iterations))
+
+
+def bench_candle_conversion(env, iterations):
+    # One month of 1-minute candles
+    candles = env.universe.candles(env.universe.instruments[0], 375 * 22)
+    return _latency_result(_timings(lambda: market_data.candles_to_frame(candles), iterations))
+
+
+def bench_current_price(env, iterations):
+    key = env.universe.instrument_key(env.universe.instruments[2])
+    return _latency_result(_timings(lambda: market_data.get_current_price(key), iterations))
+
+
+def bench_assistant_price(env, iterations):
+    return _latency_result(_timings(lambda: gemini.trading_assistant(PROMPTS[0]), iterations))
+
+
+def bench_assistant_portfolio(env, iterations):
+    return _latency_result(_timings(lambda: gemini.trading_assistant(PROMPTS[2]), iterations))
+
+
+def bench_assistant_throughput(env, iterations, concurrency=8):
+    total = max(iterations, concurrency) * 4
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(total)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(gemini.trading_assistant, prompts[:concurrency]))  # warm-up
+        start = time.perf_counter()
+        list(pool.map(gemini.trading_assistant, prompts))
+        elapsed = time.perf_counter() - start
+    return {"kind": "throughput", "requests": total, "concurrency": concurrency, "rps": total / elapsed}
+
+
+BENCHMARKS = {
+    "isin_lookup_csv": bench_isin_lookup_csv,
+    "isin_lookup_fmp": bench_isin_lookup_fmp,
+    "candle_conversion": bench_candle_conversion,
+    "current_price": bench_current_price,
+    "assistant_price": bench_assistant_price,
+    "assistant_portfolio": bench_assistant_portfolio,
+    "assistant_throughput": bench_assistant_throughput,
+}
+
+
+# --- Baseline comparison ---
+
+def _limit_ms(base_ms, tolerance, min_delta_ms):
+    return max(base_ms * (1 + tolerance), base_ms + min_delta_ms)
+
+
+def compare(results, baseline, tolerance, calibration=None):
+    """
+    Returns a list of (name, message) for every regression beyond both
+    `tolerance` (relative) and the benchmark's MIN_DELTA_MS. With this
+    run's `calibration` and one in the baseline, baseline figures are first
+    scaled to this machine's speed.
+    """
+    recorded = baseline.get(CALIBRATION_KEY, {}).get("ms")
+    scale = calibration / recorded if calibration and recorded else 1.0
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base.get("kind") != result["kind"]:
+            continue
+        min_delta = MIN_DELTA_MS.get(name, DEFAULT_MIN_DELTA_MS)
+        if result["kind"] == "latency":
+            # Medians: means are dominated by the odd GC pause at ms scale
+            expected = base["p50_ms"] * scale
+            limit = _limit_ms(expected, tolerance, min_delta)
+            if result["p50_ms"] > limit:
+                regressions.append((name, f"p50 {result['p50_ms']:.3f} ms > {limit:.3f} ms "
+                                          f"(baseline {base['p50_ms']:.3f}, scaled {expected:.3f})"))
+        else:
+            # Compared as time per request, so the absolute margin applies here too
+            expected = base["rps"] / scale
+            limit = 1000 / _limit_ms(1000 / expected, tolerance, min_delta)
+            if result["rps"] < limit:
+                regressions.append((name, f"{result['rps']:.1f} req/s < {limit:.1f} req/s "
+                                          f"(baseline {base['rps']:.1f}, scaled {expected:.1f})"))
+    return regressions
+
+
+def _format(result):
+    if result["kind"] == "latency":
+        return f"mean {result['mean_ms']:9.3f} ms  p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms"
+    return f"{result['rps']:9.1f} req/s  ({result['requests']} requests, concurrency {result['concurrency']})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--universe-size", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per fake API call")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--output", help="Also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    log.configure(level="WARNING")
+    metrics.reset()
+    latency = args.latency_ms / 1000
+    calibration = calibrate()
+    print(f"{'calibration':<24} {calibration:9.3f} ms")
+    results = {}
+    with OfflineEnvironment(args.universe_size, upstox_latency=latency,
+                            gemini_latency=latency, fmp_latency=latency) as env:
+        for name in args.only or BENCHMARKS:
+            func = BENCHMARKS[name]
+            if name == "assistant_throughput":
+                results[name] = func(env, args.iterations, args.concurrency)
+            else:
+                results[name] = func(env, args.iterations)
+            print(f"{name:<24} {_format(results[name])}")
+
+    print()
+    print(metrics.summary())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        baseline[CALIBRATION_KEY] = {"kind": "calibration", "ms": calibration}
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline found; run with --update-baseline to record one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, calibration)
+    if regressions:
+        print("\nRegressions:")
+        for name, message in regressions:
+            print(f"  {name}: {message}")
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
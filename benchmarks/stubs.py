@@ -0,0 +1,382 @@
+# benchmarks/stubs.py
+"""
+In-process stand-ins for Upstox, Gemini and FMP used by the benchmark suite.
+
+Each fake sits at the transport layer, so the real client libraries still
+do their usual work (request building, (de)serialisation):
+    - Upstox: replaces ApiClient.rest_client.pool_manager (urllib3)
+    - Gemini: an httpx.MockTransport handed to genai.Client
+    - FMP:    a requests transport adapter mounted on the gemini HTTP session
+
+OfflineEnvironment wires all of them into the src package and restores
+the originals on exit.
+"""
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httpx
+import requests
+from google import genai
+from google.genai import types
+
+from src import auth, gemini, risk
+
+WELL_KNOWN_SYMBOLS = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ICICIBANK", "SBIN", "ITC", "LT", "WIPRO", "AXISBANK"]
+
+
+class Universe:
+    """Deterministic synthetic instrument universe shared by all fakes."""
+
+    def __init__(self, size=2000, seed=7):
+        rng = random.Random(seed)
+        symbols = WELL_KNOWN_SYMBOLS + [f"SYM{i:04d}" for i in range(max(0, size - len(WELL_KNOWN_SYMBOLS)))]
+        self.instruments = []
+        for i, symbol in enumerate(symbols):
+            close = round(rng.uniform(50, 4000), 2)
+            self.instruments.append({
+                "symbol": symbol,
+                "isin": f"INE{i:06d}01X",
+                "prev_close": close,
+                "last_price": round(close * rng.uniform(0.93, 1.07), 2),
+                "volume": rng.randint(10_000, 5_000_000),
+            })
+        self.by_isin = {inst["isin"]: inst for inst in self.instruments}
+        self.by_symbol = {inst["symbol"]: inst for inst in self.instruments}
+
+    def instrument_key(self, inst):
+        return f"NSE_EQ|{inst['isin']}"
+
+    def lookup_key(self, key):
+        return self.by_isin.get(key.split("|", 1)[-1])
+
+    def write_bhavcopy(self, path):
+        """Writes an NSE bhavcopy-style CSV for the universe."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["SYMBOL", "SERIES", "OPEN", "HIGH", "LOW", "CLOSE", "LAST",
+                             "PREVCLOSE", "TOTTRDQTY", "TOTTRDVAL", "TIMESTAMP", "TOTALTRADES", "ISIN"])
+            for inst in self.instruments:
+                close = inst["prev_close"]
+                writer.writerow([inst["symbol"], "EQ", close, close, close, close, close, close,
+                                 inst["volume"], round(close * inst["volume"], 2), "03-MAY-2021", 1000, inst["isin"]])
+
+    def candles(self, inst, count, interval_seconds=60, end=None):
+        """Generates `count` deterministic OHLCV rows ending at `end` (newest first, like Upstox)."""
+        rng = random.Random(inst["isin"])
+        end = end or time.time()
+        price = inst["prev_close"]
+        rows = []
+        for i in range(count):
+            ts = time.strftime("%Y-%m-%dT%H:%M:%S+05:30", time.localtime(end - i * interval_seconds))
+            change = price * rng.uniform(-0.004, 0.004)
+            open_, close = price, price + change
+            high, low = max(open_, close) * 1.001, min(open_, close) * 0.999
+            rows.append([ts, round(open_, 2), round(high, 2), round(low, 2), round(close, 2), rng.randint(100, 10_000), 0])
+            price = close
+        return rows
+
+
+# --- Upstox ---
+
+class _FakeUrllib3Response:
+    def __init__(self, status, payload):
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+        self.data = json.dumps(payload).encode()
+        self._headers = {"Content-Type": "application/json"}
+
+    def getheaders(self):
+        return self._headers
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+
+class FakeUpstoxTransport:
+    """Drop-in for urllib3.PoolManager answering the Upstox REST endpoints we use."""
+
+    def __init__(self, universe, latency=0.0):
+        self.universe = universe
+        self.latency = latency
+        self.calls = 0
+        self._order_seq = 0
+        self._lock = threading.Lock()
+        self.orders = []
+
+    def request(self, method, url, fields=None, body=None, headers=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlparse(url)
+        path = parsed.path
+        query = dict(fields or [])
+        query.update({k: v[0] for k, v in parse_qs(parsed.query).items()})
+        try:
+            status, payload = self._route(method, path, query, json.loads(body) if body else None)
+        except KeyError as e:
+            status, payload = 400, {"status": "error", "errors": [{"message": f"Unknown instrument {e}"}]}
+        return _FakeUrllib3Response(status, payload)
+
+    def _quote_keys(self, query):
+        return [key for key in query.get("symbol", query.get("instrument_key", "")).split(",") if key]
+
+    def _route(self, method, path, query, body):
+        u = self.universe
+        if path.endswith("/market-quote/ltp"):
+            data = {}
+            for key in self._quote_keys(query):
+                inst = u.lookup_key(key)
+                if inst is None:
+                    raise KeyError(key)
+                data[f"NSE_EQ:{inst['symbol']}"] = {"last_price": inst["last_price"], "instrument_token": key}
+            return 200, {"status": "success", "data": data}
+        if path.endswith("/market-quote/quotes") or path.endswith("/market-quote/ohlc"):
+            data = {}
+            for key in self._quote_keys(query):
+                inst = u.lookup_key(key)
+                if inst is None:
+                    continue
+                last, prev = inst["last_price"], inst["prev_close"]
+                data[f"NSE_EQ:{inst['symbol']}"] = {
+                    "instrument_token": key, "symbol": inst["symbol"], "last_price": last,
+                    "volume": inst["volume"], "net_change": round(last - prev, 2),
+                    "ohlc": {"open": prev, "high": max(last, prev), "low": min(last, prev), "close": prev},
+                }
+            return 200, {"status": "success", "data": data}
+        match = re.search(r"/historical-candle/(?:intraday/)?([^/]+)/([^/]+)(?:/([^/]+))?(?:/([^/]+))?$", path)
+        if match:
+            inst = u.lookup_key(unquote(match.group(1)))
+            if inst is None:
+                raise KeyError(match.group(1))
+            interval = match.group(2)
+            step = {"1minute": 60, "30minute": 1800, "day": 86400, "week": 604800, "month": 2592000}.get(interval, 60)
+            count = 375 if interval == "1minute" else 250
+            return 200, {"status": "success", "data": {"candles": u.candles(inst, count, step)}}
+        if path.endswith("/order/place"):
+            with self._lock:
+                self._order_seq += 1
+                order_id = f"BENCH{self._order_seq:08d}"
+                self.orders.append(dict(body or {}, order_id=order_id))
+            return 200, {"status": "success", "data": {"order_id": order_id}}
+        if path.endswith("/order/details"):
+            with self._lock:
+                order = next((o for o in self.orders if o["order_id"] == query.get("order_id")), None)
+            if order is None:
+                return 400, {"status": "error", "errors": [{"message": "Order not found"}]}
+            inst = u.lookup_key(order["instrument_token"])
+            return 200, {"status": "success", "data": dict(
+                order, status="complete", filled_quantity=order["quantity"], trading_symbol=inst["symbol"],
+                average_price=order.get("price") or inst["last_price"])}
+        if path.endswith("/portfolio/long-term-holdings"):
+            holdings = []
+            for inst in u.instruments[:10]:
+                holdings.append({
+                    "isin": inst["isin"], "tradingsymbol": inst["symbol"], "trading_symbol": inst["symbol"],
+                    "company_name": inst["symbol"], "exchange": "NSE", "product": "D",
+                    "instrument_token": u.instrument_key(inst), "quantity": 10,
+                    "average_price": inst["prev_close"], "last_price": inst["last_price"],
+                    "close_price": inst["prev_close"],
+                    "pnl": round((inst["last_price"] - inst["prev_close"]) * 10, 2),
+                })
+            return 200, {"status": "success", "data": holdings}
+        return 404, {"status": "error", "errors": [{"message": f"No fake for {method} {path}"}]}
+
+
+# --- FMP ---
+
+class FakeFMPAdapter(requests.adapters.BaseAdapter):
+    """requests transport adapter answering the FMP /v3/search endpoint."""
+
+    def __init__(self, universe, latency=0.0):
+        super().__init__()
+        self.universe = universe
+        self.latency = latency
+
+    def send(self, request, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        query = {k: v[0] for k, v in parse_qs(urlparse(request.url).query).items()}
+        term = query.get("query", "").upper()
+        limit = int(query.get("limit", 10))
+        results = [
+            {"symbol": inst["symbol"], "name": inst["symbol"].title(), "exchangeShortName": "NSE", "isin": inst["isin"]}
+            for inst in self.universe.instruments if inst["symbol"].startswith(term)
+        ][:limit]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(results).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+# --- Gemini ---
+
+class ScriptedGemini:
+    """
+    Mimics the Gemini function-calling protocol with scripted tool-call sequences.
+
+    The scenario is picked from the first user message; the step within the
+    scenario is the number of function responses already in the conversation,
+    so the same fake serves many concurrent conversations.
+    """
+
+    def __init__(self, universe, latency=0.0):
+        self.universe = universe
+        self.latency = latency
+        self.calls = 0
+        self.caches = {}  # context cache name -> prefix token count
+        self._lock = threading.Lock()
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = json.loads(request.content)
+        if request.url.path.endswith("/cachedContents"):
+            return self._create_cache(body, len(request.content))
+        contents = body.get("contents", [])
+        user_text = " ".join(p.get("text", "") for p in contents[0].get("parts", [])) if contents else ""
+        results = [
+            part["functionResponse"].get("response", {})
+            for content in contents for part in content.get("parts", []) if "functionResponse" in part
+        ]
+        step = self.script(user_text, results)
+        if "call" in step:
+            name, args = step["call"]
+            parts = [{"functionCall": {"name": name, "args": args}}]
+        else:
+            parts = [{"text": step["text"]}]
+        prompt_tokens = max(1, len(request.content) // 4)
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 20}
+        if body.get("cachedContent"):
+            cached = self.caches.get(body["cachedContent"].rsplit("/", 1)[-1])
+            if cached is None:
+                return httpx.Response(404, json={"error": {"code": 404, "message": "CachedContent not found",
+                                                           "status": "NOT_FOUND"}})
+            usage["promptTokenCount"] += cached
+            usage["cachedContentTokenCount"] = cached
+        usage["totalTokenCount"] = usage["promptTokenCount"] + 20
+        return httpx.Response(200, json={
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP"}],
+            "usageMetadata": usage,
+        })
+
+    def _create_cache(self, body, size):
+        with self._lock:
+            name = f"bench{len(self.caches) + 1}"
+            self.caches[name] = max(1, size // 4)
+        return httpx.Response(200, json={
+            "name": f"cachedContents/{name}", "model": body.get("model"),
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600)),
+            "usageMetadata": {"totalTokenCount": self.caches[name]},
+        })
+
+    @staticmethod
+    def _symbol(text):
+        words = [w.strip("?.,!").upper() for w in text.split()]
+        for word in words:
+            if word in WELL_KNOWN_SYMBOLS or re.fullmatch(r"SYM\d{4}", word):
+                return word
+        return "RELIANCE"
+
+    def script(self, user_text, results):
+        lowered = user_text.lower()
+        symbol = self._symbol(user_text)
+        last = (results[-1].get("result") if results else None) or {}
+        if "portfolio" in lowered or "holdings" in lowered:
+            if not results:
+                return {"call": ("get_portfolio", {})}
+            return {"text": f"You hold {len(last) if isinstance(last, list) else 0} positions."}
+        if "buy" in lowered:
+            steps = [("get_isin_from_csv", lambda: {"symbol": symbol}),
+                     ("place_buy_order", lambda: {"symbol": last.get("nse_format", ""), "quantity": 1})]
+            if len(results) < len(steps):
+                name, args = steps[len(results)]
+                return {"call": (name, args())}
+            return {"text": f"Order placed for {symbol}: {last}"}
+        if "isin" in lowered:
+            if not results:
+                return {"call": ("get_isin_for_symbol", {"stock_symbol": symbol})}
+            return {"text": f"ISIN for {symbol}: {last}"}
+        # Default: price lookup
+        steps = [("get_isin_from_csv", lambda: {"symbol": symbol}),
+                 ("get_current_price", lambda: {"symbol": last.get("nse_format", "")})]
+        if len(results) < len(steps):
+            name, args = steps[len(results)]
+            return {"call": (name, args())}
+        return {"text": f"{symbol} is trading at {last}."}
+
+
+# --- Wiring ---
+
+class OfflineEnvironment:
+    """Context manager that points the src package at the fakes."""
+
+    def __init__(self, universe_size=2000, upstox_latency=0.0, gemini_latency=0.0, fmp_latency=0.0):
+        self.universe = Universe(universe_size)
+        self.upstox = FakeUpstoxTransport(self.universe, upstox_latency)
+        self.gemini = ScriptedGemini(self.universe, gemini_latency)
+        self.fmp = FakeFMPAdapter(self.universe, fmp_latency)
+        self._saved = {}
+        self._tmpdir = None
+
+    def __enter__(self):
+        self._tmpdir = tempfile.mkdtemp(prefix="tradegpt-bench-")
+        csv_path = os.path.join(self._tmpdir, "bhavcopy.csv")
+        self.universe.write_bhavcopy(csv_path)
+
+        self._saved = {
+            "load_config": auth.load_config,
+            "csv": gemini.BHAVCOPY_CSV_PATH,
+            "session": gemini._http_session,
+            "client": gemini._client,
+        }
+
+        # The fakes have no quota, so don't let the per-account rate budget or order-rate check throttle them
+        auth.load_config = lambda: {"access_token": "offline-benchmark-token", "rate_limit": 100000,
+                                    "risk": {"max_orders_per_minute": None}}
+        # Inserted first so other hooks (e.g. the recorder) wrap the fake
+        auth.client_hooks.insert(0, self._use_fake_transport)
+        auth.reset_clients()
+        risk.get_engine().reset()
+        gemini.BHAVCOPY_CSV_PATH = csv_path
+        session = requests.Session()
+        session.mount("https://financialmodelingprep.com", self.fmp)
+        gemini.set_http_session(session)
+        gemini.set_gemini_client(genai.Client(
+            api_key="offline-benchmark",
+            http_options=types.HttpOptions(httpx_client=httpx.Client(transport=self.gemini.transport())),
+        ))
+        return self
+
+    def _use_fake_transport(self, api_client):
+        api_client.rest_client.pool_manager = self.upstox
+
+    def __exit__(self, *exc):
+        auth.load_config = self._saved["load_config"]
+        auth.client_hooks.remove(self._use_fake_transport)
+        auth.reset_clients()
+        risk.get_engine().reset()
+        gemini.BHAVCOPY_CSV_PATH = self._saved["csv"]
+        gemini.set_http_session(self._saved["session"])
+        gemini.set_gemini_client(self._saved["client"])
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+        return False
@@ -0,0 +1,69 @@
+"""
+Downloads historical candles for many instruments into a local Parquet store.
+
+    python download_history.py --from 2020-01-01 --to 2024-12-31
+    python download_history.py --symbols INFY TCS --interval 1minute --from 2024-01-01
+    python download_history.py --limit 100 --format csv --workers 16
+
+Without --symbols every EQ instrument in the bhavcopy is downloaded. Re-run
+the same command to resume an interrupted download.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+
+from src import accounts, downloader, gemini, log, paths
+
+
+def _date(text):
+    return datetime.date.fromisoformat(text)
+
+
+def _print_progress(stats):
+    done = stats["done"] + stats["failed"] + stats["incomplete"]
+    total = done + stats["remaining"]
+    print(f"\r{done}/{total} jobs  {stats['rows_per_second']:,} rows/s  {stats['mb_per_second']} MB/s  "
+          f"{stats['failed']} failed, {stats['incomplete']} incomplete", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", nargs="*", help="Symbols or NSE_EQ|<isin> keys (default: the whole bhavcopy)")
+    parser.add_argument("--csv", default=gemini.BHAVCOPY_CSV_PATH, help="Instrument list (bhavcopy CSV)")
+    parser.add_argument("--limit", type=int, help="Only the first N instruments")
+    parser.add_argument("--interval", default="day", choices=sorted(downloader.MAX_SPAN_DAYS))
+    parser.add_argument("--from", dest="start", type=_date, default=None, help="First date (default: a year ago)")
+    parser.add_argument("--to", dest="end", type=_date, default=None, help="Last date (default: today)")
+    parser.add_argument("--out", default=None, help="Store directory (default: data/history)")
+    parser.add_argument("--format", default="parquet", choices=downloader.FORMATS)
+    parser.add_argument("--workers", type=int, default=downloader.DEFAULT_WORKERS)
+    parser.add_argument("--account", default=accounts.DEFAULT_ACCOUNT)
+    args = parser.parse_args(argv)
+
+    log.configure(level="WARNING")
+    end = args.end or datetime.date.today()
+    start = args.start or end - datetime.timedelta(days=365)
+    root = args.out or paths.data_dir("history")
+
+    try:
+        with accounts.use_account(args.account):
+            keys = downloader.universe_keys(args.csv, args.symbols, args.limit)
+            jobs = downloader.make_jobs(keys, start, end, args.interval)
+            runner = downloader.Downloader(root, args.interval, args.format, args.workers, progress=_print_progress)
+            print(f"{len(keys)} instruments, {len(jobs)} jobs -> {os.path.abspath(root)}", file=sys.stderr)
+            stats = runner.run(jobs)
+    except downloader.DownloadError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("\nInterrupted; progress is checkpointed, run the same command to resume.", file=sys.stderr)
+        return 130
+    print(file=sys.stderr)
+    print(json.dumps(stats, indent=2))
+    return 1 if stats["failed"] or stats["incomplete"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
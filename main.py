@@ -1,16 +1,59 @@
-from src import gemini, auth
+import atexit
+import os
+from src import gemini, auth, metrics, lazy, alerts, prefetch, orders, snapshot
+
+def print_order_update(order):
+    """Prints an order's final status (fill price or rejection reason)"""
+    if order["status"] not in orders.TERMINAL:
+        return
+    detail = f": {order.get('filled_quantity')} @ {order.get('average_price')}" if order["status"] == "complete" else ""
+    reason = f" ({order['status_message']})" if order.get("status_message") else ""
+    print(f"\n📬 Order {order['order_id']} {order['status']}{detail}{reason}")
 
 def main():
     """Main function to run the AI trading assistant"""
     print("🤖 AI Trading Assistant is starting...")
+
+    # TRADEGPT_RECORD / TRADEGPT_REPLAY switch on the traffic recorder
+    if os.environ.get("TRADEGPT_RECORD") or os.environ.get("TRADEGPT_REPLAY"):
+        from src import recorder
+        recorder.install_from_env()
+        print("📼 Recording/replaying API traffic")
     
     # Check if authentication is required
     if not auth.get_token():
         print("Authentication required. Opening browser...")
         auth.start_authentication()
     
+    # Import the Gemini/Upstox/pandas stack while the user types
+    lazy.preload_in_background()
+
+    # Reload the caches saved by the last run; they are saved again every few minutes and at exit
+    snapshotter, restored = snapshot.start_from_config(gemini.BHAVCOPY_CSV_PATH)
+    if snapshotter:
+        atexit.register(snapshotter.stop)
+        if "skipped" not in restored:
+            print(f"♻️  Restored {restored['quotes']} quotes, {restored['candles']} candle sets "
+                  f"from the last session in {restored['seconds']}s")
+
+    # Warm holdings/watchlist quotes and candles before the first question
+    prefetch.start_from_config(gemini.BHAVCOPY_CSV_PATH)
+
+    # Order status and fills are pushed over the portfolio stream
+    if auth.get_token():
+        orders.start_feed()
+        orders.get_book().listeners.append(print_order_update)
+
+    # Standing price alerts are checked in the background
+    alert_engine = alerts.get_engine()
+    alert_engine.listeners.append(lambda alert: print(
+        f"\n🔔 Alert: {alert['symbol']} is {alert['direction']} {alert['price']} "
+        f"(last {alert['triggered_price']})" + (f" - {alert['note']}" if alert.get('note') else "")))
+    if alert_engine.instruments():
+        alert_engine.start()
+
     print("🤖 AI Trading Assistant is ready!")
-    print("Type 'exit' to quit")
+    print("Type 'exit' to quit, 'metrics' for timing stats")
     
     while True:
         user_input = input("\n👤 You: ")
@@ -18,6 +61,10 @@ def main():
         if user_input.lower() == "exit":
             print("Goodbye!")
             break
+
+        if user_input.lower() == "metrics":
+            print(metrics.summary())
+            continue
         
         try:
             response = gemini.trading_assistant(user_input)
@@ -26,4 +73,10 @@ def main():
             print(f"\n🚨 Error: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # e.g. TRADEGPT_METRICS_PATH=metrics.prom or metrics.json
+        metrics_path = os.environ.get("TRADEGPT_METRICS_PATH")
+        if metrics_path:
+            metrics.write(metrics_path) 
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Runs a file of prompts through the trading assistant and writes the answers as JSONL.
+
+    python run_batch.py prompts.jsonl                      # -> prompts.results.jsonl
+    python run_batch.py prompts.jsonl -o eod.jsonl --concurrency 8
+    python run_batch.py orders.jsonl --allow-writes        # let prompts place orders/alerts
+
+Each input line is a prompt string or {"id", "prompt", "account", "symbols"};
+see src/batch.py. A summary (latency, tokens, deduplicated tool calls) is
+printed at the end.
+"""
+import argparse
+import json
+import os
+import sys
+
+from src import batch, lazy, log
+
+
+def _print_progress(done, total, record):
+    status = "error" if "error" in record else f"{record['latency_ms']:.0f} ms"
+    print(f"\r{done}/{total}  {record['id']}: {status}".ljust(60), end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("-o", "--output", help="Results file (default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=batch.DEFAULT_CONCURRENCY)
+    parser.add_argument("--allow-writes", action="store_true",
+                        help="Offer order and alert tools too (default: read-only tools only)")
+    args = parser.parse_args(argv)
+
+    log.configure(level="WARNING")
+    try:
+        prompts = batch.read_prompts(args.input)
+    except (OSError, batch.BatchError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+
+    lazy.preload_in_background()
+    print(f"{len(prompts)} prompts, concurrency {args.concurrency}"
+          + ("" if args.allow_writes else ", read-only tools"), file=sys.stderr)
+    with open(output_path, "w") as output:
+        summary = batch.run_batch(prompts, output, concurrency=args.concurrency,
+                                  read_only=not args.allow_writes, progress=_print_progress)
+    print(file=sys.stderr)
+    print(json.dumps(dict(summary, output=output_path), indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
-from src import auth
+import sys
+from src import accounts
 
 def main():
-    access_token = input("Enter your Upstox access token: ")
-    if auth.set_access_token(access_token):
+    # python set_token.py [account]; without an account the token goes to config/config.json
+    account = sys.argv[1] if len(sys.argv) > 1 else accounts.DEFAULT_ACCOUNT
+    if account == accounts.DEFAULT_ACCOUNT:
+        access_token = input("Enter your Upstox access token: ")
+    else:
+        access_token = input(f"Enter the Upstox access token for '{account}': ")
+    if accounts.get_pool().store.set_token(account, access_token):
         print("Access token set successfully!")
     else:
         print("Failed to set access token")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
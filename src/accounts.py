@@ -0,0 +1,315 @@
+# src/accounts.py
+"""
+Account-scoped Upstox clients, so one process can serve many traders.
+
+Tokens come from config/accounts.json (re-read when the file changes)
+
+    {"alice": {"access_token": "...", "rate_limit": 10}, "bob": {"access_token": "..."}}
+
+plus the "default" account, whose token is the access_token in
+config/config.json as before. The account for the current request is a
+context variable:
+
+    with accounts.use_account("alice"):
+        trading.get_portfolio()          # alice's holdings, alice's client
+
+Each account gets one ApiClient, created on first use and reused after
+that (an ApiClient owns a connection pool and a worker thread pool, so
+building one per call is expensive). The pool keeps at most MAX_CLIENTS,
+evicting the least recently used; clients idle for IDLE_TIMEOUT are
+dropped too. Every account's HTTP traffic passes through its own token
+bucket (rate_limit requests/second, default 50; the default account can set
+it in config.json too), so one busy trader cannot use up another's quota.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from . import auth, lazy, log, metrics, paths
+
+upstox_client = lazy.lazy_import("upstox_client")
+
+logger = log.get_logger(__name__)
+
+DEFAULT_ACCOUNT = "default"
+ACCOUNTS_PATH = os.path.join(paths.CONFIG_DIR, 'accounts.json')
+
+MAX_CLIENTS = 64
+IDLE_TIMEOUT = 1800.0
+# Requests per second per account (Upstox allows 50/s per user on standard APIs)
+DEFAULT_RATE_LIMIT = 50.0
+
+_current = contextvars.ContextVar("tradegpt_account", default=DEFAULT_ACCOUNT)
+
+
+# --- Current account ---
+
+def current():
+    """Name of the account the current request runs as."""
+    return _current.get()
+
+
+@contextmanager
+def use_account(name):
+    """Runs the enclosed block as account `name`."""
+    token = _current.set(name or DEFAULT_ACCOUNT)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def propagate(func):
+    """
+    Wraps `func` to run as the caller's account. Thread pools don't carry
+    context variables over, so wrap callables handed to executors.
+    """
+    name = current()
+    def run(*args, **kwargs):
+        with use_account(name):
+            return func(*args, **kwargs)
+    return run
+
+
+# --- Token store ---
+
+class TokenStore:
+    """Per-account settings from accounts.json, reloaded when the file changes."""
+
+    def __init__(self, path=ACCOUNTS_PATH):
+        self.path = path
+        self._stamp = None
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._stamp, self._accounts = None, {}
+            return
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            try:
+                with open(self.path) as f:
+                    self._accounts = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("accounts_load_failed", path=self.path, error=str(e))
+                return
+            self._stamp = stamp
+
+    def get(self, name):
+        """Settings dict for `name`, or None for an unknown account."""
+        if name == DEFAULT_ACCOUNT:
+            try:
+                config = auth.load_config()
+            except (OSError, ValueError):
+                return None
+            settings = dict(self._settings(name) or {})
+            settings["access_token"] = config.get("access_token")
+            for key in ("rate_limit", "burst", "risk"):
+                if config.get(key):
+                    settings[key] = config[key]
+            return settings
+        return self._settings(name)
+
+    def _settings(self, name):
+        self._reload()
+        return self._accounts.get(name)
+
+    def names(self):
+        self._reload()
+        return [DEFAULT_ACCOUNT] + [name for name in self._accounts if name != DEFAULT_ACCOUNT]
+
+    def set_token(self, name, access_token):
+        """Stores a token for `name` (the default account lives in config.json)."""
+        if name == DEFAULT_ACCOUNT:
+            return auth.set_access_token(access_token)
+        with self._lock:
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = {}
+            data.setdefault(name, {})["access_token"] = access_token.strip()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp, self.path)
+        return True
+
+
+# --- Rate budgets ---
+
+class TokenBucket:
+    """Blocking token bucket: `rate` requests per second, bursts up to `burst` (default: one second's worth)."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes one token, sleeping until one is available; returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return waited
+                delay = (1.0 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimitedPoolManager:
+    """Wraps an ApiClient's urllib3 PoolManager so each request spends from a bucket."""
+
+    def __init__(self, inner, bucket, account):
+        self.inner = inner
+        self.bucket = bucket
+        self.account = account
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def request(self, *args, **kwargs):
+        waited = self.bucket.acquire()
+        if waited:
+            metrics.observe("upstox_rate_limit_wait_seconds", waited, account=self.account)
+        return self.inner.request(*args, **kwargs)
+
+
+# --- Client pool ---
+
+class _Entry:
+    __slots__ = ("client", "token", "bucket", "last_used")
+
+    def __init__(self, client, token, bucket):
+        self.client = client
+        self.token = token
+        self.bucket = bucket
+        self.last_used = time.monotonic()
+
+
+class ClientPool:
+    """One ApiClient per account, LRU-bounded and safe to share across threads."""
+
+    def __init__(self, store=None, max_clients=MAX_CLIENTS, idle_timeout=IDLE_TIMEOUT):
+        self.store = store or TokenStore()
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()  # account -> _Entry, least recently used first
+        self._lock = threading.Lock()
+        self._creating = {}  # account -> Lock, so concurrent first calls build one client
+
+    def get(self, account=None):
+        """Returns the ApiClient for `account` (default: the current one), or None without a token."""
+        account = account or current()
+        settings = self.store.get(account)
+        token = (settings or {}).get("access_token")
+        if not token:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(account)
+            if entry is not None:
+                self._entries.move_to_end(account)
+                entry.last_used = time.monotonic()
+                if entry.token != token:
+                    # Refreshed token: the client reads it per request, no reconnect needed
+                    entry.client.configuration.access_token = token
+                    entry.token = token
+                entry.bucket.rate = float(settings.get("rate_limit") or DEFAULT_RATE_LIMIT)
+                metrics.record_cache("upstox_clients", True)
+                return entry.client
+            creating = self._creating.setdefault(account, threading.Lock())
+
+        with creating:
+            with self._lock:
+                entry = self._entries.get(account)
+                if entry is not None:
+                    return entry.client
+            metrics.record_cache("upstox_clients", False)
+            entry = self._build(account, token, settings)
+            with self._lock:
+                self._entries[account] = entry
+                self._creating.pop(account, None)
+                evicted = self._evict()
+        for name, old in evicted:
+            self._close(name, old)
+        return entry.client
+
+    def _build(self, account, token, settings):
+        configuration = upstox_client.Configuration()
+        configuration.access_token = token
+        api_client = upstox_client.ApiClient(configuration)
+        for hook in auth.client_hooks:
+            hook(api_client)
+        bucket = TokenBucket(settings.get("rate_limit") or DEFAULT_RATE_LIMIT, settings.get("burst"))
+        api_client.rest_client.pool_manager = RateLimitedPoolManager(
+            api_client.rest_client.pool_manager, bucket, account)
+        logger.debug("upstox_client_created", account=account)
+        return _Entry(api_client, token, bucket)
+
+    def _evict(self):
+        evicted = []
+        now = time.monotonic()
+        for name in list(self._entries):
+            over = len(self._entries) > self.max_clients
+            if not over and now - self._entries[name].last_used < self.idle_timeout:
+                break
+            evicted.append((name, self._entries.pop(name)))
+        return evicted
+
+    @staticmethod
+    def _close(name, entry):
+        # Only the async worker pool is closed; a request still using the
+        # connection pool finishes normally and the pool is garbage collected
+        try:
+            entry.client.pool.close()
+        except Exception:
+            pass
+        logger.debug("upstox_client_evicted", account=name)
+
+    def clear(self):
+        """Drops every pooled client (e.g. after client_hooks changed)."""
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for name, entry in entries:
+            self._close(name, entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process-wide ClientPool."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ClientPool()
+    return _pool
+
+
+def get_client(account=None):
+    """Pooled ApiClient for `account` (default: the current account), or None."""
+    return get_pool().get(account)
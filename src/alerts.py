@@ -0,0 +1,354 @@
+# src/alerts.py
+"""
+Standing price alerts ("tell me when INFY crosses 1500").
+
+Each instrument has an AlertBook holding two sorted threshold arrays:
+"above" alerts fire once the price is >= their threshold, "below" alerts
+once it is <= theirs. A price update bisects each array once and pops the
+crossed prefix/suffix, so a tick costs O(log n + k) for k triggered alerts
+no matter how many are standing.
+
+The AlertEngine keeps the books, persists every alert to
+data/alerts/alerts.json and runs a daemon thread that, while the market is
+open, fetches batched quotes for every instrument with an active alert,
+under the account that owns the alert. Outside market hours it sleeps
+until the next session boundary. Any other quote source can feed it
+through on_price(). Changes only mark the store dirty; a
+saver thread rewrites it (tmp file + os.replace) at most every SAVE_DELAY
+seconds, outside the lock, so adds and price checks never wait on disk.
+flush() writes pending changes immediately and runs at exit.
+
+Each alert belongs to the account that created it (accounts.current());
+listing and cancelling only see the caller's alerts. Stores written before
+alerts had an account load them as the default account's.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from . import accounts, log, market_data, market_hours, metrics, paths
+
+logger = log.get_logger(__name__)
+
+STORE_VERSION = 1
+# Seconds between quote polls; TRADEGPT_ALERT_INTERVAL overrides
+DEFAULT_INTERVAL = 5.0
+# Triggered/cancelled alerts kept for listing
+HISTORY_LIMIT = 200
+# Seconds a change may wait before the store is rewritten; changes in between are written together
+SAVE_DELAY = 1.0
+
+DIRECTIONS = ("above", "below")
+
+
+class AlertBook:
+    """Sorted thresholds for one instrument."""
+
+    __slots__ = ("above_prices", "above_ids", "below_prices", "below_ids")
+
+    def __init__(self):
+        self.above_prices, self.above_ids = [], []
+        self.below_prices, self.below_ids = [], []
+
+    def add(self, direction, price, alert_id):
+        prices, ids = self._side(direction)
+        i = bisect.bisect_right(prices, price)
+        prices.insert(i, price)
+        ids.insert(i, alert_id)
+
+    def remove(self, direction, price, alert_id):
+        prices, ids = self._side(direction)
+        lo, hi = bisect.bisect_left(prices, price), bisect.bisect_right(prices, price)
+        for i in range(lo, hi):
+            if ids[i] == alert_id:
+                del prices[i], ids[i]
+                return True
+        return False
+
+    def crossed(self, price):
+        """Removes and returns the ids of every alert crossed at `price`."""
+        fired = []
+        # Above: thresholds <= price, a prefix of the ascending array
+        k = bisect.bisect_right(self.above_prices, price)
+        if k:
+            fired.extend(self.above_ids[:k])
+            del self.above_prices[:k], self.above_ids[:k]
+        # Below: thresholds >= price, a suffix
+        k = bisect.bisect_left(self.below_prices, price)
+        if k < len(self.below_prices):
+            fired.extend(self.below_ids[k:])
+            del self.below_prices[k:], self.below_ids[k:]
+        return fired
+
+    def _side(self, direction):
+        if direction == "above":
+            return self.above_prices, self.above_ids
+        return self.below_prices, self.below_ids
+
+    def __len__(self):
+        return len(self.above_ids) + len(self.below_ids)
+
+
+class AlertEngine:
+    """Owns all alerts, their persistence and the polling thread."""
+
+    def __init__(self, path=None, interval=None, quote_source=None):
+        self.path = path or os.path.join(paths.data_dir("alerts"), "alerts.json")
+        self.interval = interval or float(os.environ.get("TRADEGPT_ALERT_INTERVAL", DEFAULT_INTERVAL))
+        # Alerts want every poll to see a fresh price, not a cached quote
+        self.quote_source = quote_source or (lambda keys: market_data.get_quotes(keys, refresh=True))
+        self.listeners = []  # called with each triggered alert dict
+        self._alerts = {}  # id -> alert dict (active ones only)
+        self._books = {}  # instrument key -> AlertBook
+        self._history = deque(maxlen=HISTORY_LIMIT)
+        self._lock = threading.RLock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._dirty = False
+        self._saver = None
+        self._wake = threading.Event()
+        self._save_lock = threading.Lock()
+        self._load()
+        atexit.register(self.flush)
+
+    # --- Alert management ---
+
+    def add(self, instrument_key, price, direction, symbol=None, note=None):
+        """Creates an alert for the current account and returns it."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}")
+        price = float(price)
+        if price <= 0:
+            raise ValueError("Alert price must be positive")
+        alert = {
+            "id": uuid.uuid4().hex[:8],
+            "account": accounts.current(),
+            "instrument_key": instrument_key,
+            "symbol": symbol or instrument_key,
+            "direction": direction,
+            "price": price,
+            "note": note,
+            "status": "active",
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._insert(alert)
+            self._save()
+        logger.info("alert_created", id=alert["id"], account=alert["account"], instrument=instrument_key, direction=direction, price=price)
+        return dict(alert)
+
+    def cancel(self, alert_id):
+        """Cancels one of the current account's active alerts; returns it, or None if there is no such alert."""
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            if alert is None or alert["account"] != accounts.current():
+                return None
+            del self._alerts[alert_id]
+            book = self._books[alert["instrument_key"]]
+            book.remove(alert["direction"], alert["price"], alert_id)
+            if not len(book):
+                del self._books[alert["instrument_key"]]
+            alert["status"] = "cancelled"
+            self._history.append(alert)
+            self._save()
+        return dict(alert)
+
+    def list(self, status="active"):
+        """The current account's alerts with `status` (active, triggered, cancelled or all), newest first."""
+        account = accounts.current()
+        with self._lock:
+            alerts = [a for a in list(self._alerts.values()) + list(self._history) if a["account"] == account]
+        if status != "all":
+            alerts = [a for a in alerts if a["status"] == status]
+        return sorted((dict(a) for a in alerts), key=lambda a: a.get("triggered_at") or a["created_at"], reverse=True)
+
+    def instruments(self):
+        """Instrument keys with at least one active alert."""
+        with self._lock:
+            return list(self._books)
+
+    def instruments_by_account(self):
+        """{account: instrument keys} for active alerts; a key alerted by several accounts is listed once."""
+        grouped, seen = {}, set()
+        with self._lock:
+            for alert in self._alerts.values():
+                key = alert["instrument_key"]
+                if key not in seen:
+                    seen.add(key)
+                    grouped.setdefault(alert["account"], []).append(key)
+        return grouped
+
+    def _insert(self, alert):
+        self._alerts[alert["id"]] = alert
+        book = self._books.get(alert["instrument_key"])
+        if book is None:
+            book = self._books[alert["instrument_key"]] = AlertBook()
+        book.add(alert["direction"], alert["price"], alert["id"])
+
+    # --- Evaluation ---
+
+    def on_price(self, instrument_key, price):
+        """Feeds one price; returns the alerts it triggered."""
+        if price is None or instrument_key not in self._books:
+            return []
+        with self._lock:
+            book = self._books.get(instrument_key)
+            ids = book.crossed(price) if book is not None else None
+            if not ids:
+                return []
+            if not len(book):
+                self._books.pop(instrument_key, None)
+            now = time.time()
+            fired = []
+            for alert_id in ids:
+                alert = self._alerts.pop(alert_id)
+                alert.update(status="triggered", triggered_at=now, triggered_price=price)
+                self._history.append(alert)
+                fired.append(dict(alert))
+            self._save()
+        metrics.inc("alerts_triggered_total", len(fired))
+        for alert in fired:
+            logger.info("alert_triggered", id=alert["id"], instrument=instrument_key,
+                        direction=alert["direction"], price=alert["price"], last_price=price)
+            for listener in list(self.listeners):
+                try:
+                    listener(alert)
+                except Exception:
+                    logger.error("alert_listener_failed", id=alert["id"], exc_info=True)
+        return fired
+
+    def on_quotes(self, quotes):
+        """Feeds {instrument_key: quote} as returned by market_data.get_quotes."""
+        fired = []
+        for key, quote in quotes.items():
+            fired.extend(self.on_price(key, quote.get("last_price")))
+        return fired
+
+    def check(self):
+        """Fetches quotes for every instrument with an active alert, as the alert's account, and evaluates them."""
+        grouped = self.instruments_by_account()
+        if not grouped:
+            return []
+        fired = []
+        with metrics.timer("alert_check_seconds"):
+            for account, keys in grouped.items():
+                with accounts.use_account(account):
+                    quotes = self.quote_source(keys)
+                if "error" in quotes:
+                    logger.warning("alert_quotes_failed", account=account, error=quotes["error"])
+                    continue
+                fired.extend(self.on_quotes(quotes))
+        return fired
+
+    # --- Background loop ---
+
+    def start(self):
+        """Starts the polling thread (idempotent)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="price-alerts", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not market_hours.is_open():
+                # Prices don't move while the market is closed; sleep until the next phase boundary
+                self._stop.wait(market_hours.seconds_until_change())
+                continue
+            try:
+                self.check()
+            except Exception:
+                logger.error("alert_check_failed", exc_info=True)
+            self._stop.wait(self.interval)
+
+    # --- Persistence ---
+
+    def _save(self):
+        """Marks the store dirty (called with the lock held); the saver thread writes it."""
+        self._dirty = True
+        if self._saver is None or not self._saver.is_alive():
+            self._saver = threading.Thread(target=self._save_loop, name="alerts-save", daemon=True)
+            self._saver.start()
+        self._wake.set()
+
+    def _save_loop(self):
+        while True:
+            self._wake.wait()
+            # Let a burst of changes land, then write them in one go
+            time.sleep(SAVE_DELAY)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes pending changes to the store now."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                # Copies, so triggers can update alerts while the file is written
+                data = {"version": STORE_VERSION, "active": [dict(a) for a in self._alerts.values()],
+                        "history": [dict(a) for a in self._history]}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning("alerts_save_failed", path=self.path, error=str(e))
+                with self._lock:
+                    self._dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("alerts_load_failed", path=self.path, error=str(e))
+            return
+        if data.get("version") != STORE_VERSION:
+            logger.warning("alerts_version_mismatch", path=self.path, version=data.get("version"))
+            return
+        for alert in data.get("active", []):
+            alert.setdefault("account", accounts.DEFAULT_ACCOUNT)
+            self._insert(alert)
+        for alert in data.get("history", []):
+            alert.setdefault("account", accounts.DEFAULT_ACCOUNT)
+            self._history.append(alert)
+        logger.debug("alerts_loaded", active=len(self._alerts), history=len(self._history))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Returns the process-wide AlertEngine, loading saved alerts on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = AlertEngine()
+    return _engine
+
+
+def set_engine(engine):
+    """Replaces the process-wide AlertEngine (e.g. one with a different store)."""
+    global _engine
+    _engine = engine
@@ -0,0 +1,257 @@
+# src/analytics.py
+"""
+Portfolio risk analytics over cached daily history.
+
+Daily closes of every holding (plus the benchmark index, when Upstox has
+it) are aligned on common dates into one T x N matrix of simple returns
+over the last WINDOW sessions. From it, with plain NumPy:
+
+    covariance / correlation   from running sums (see ReturnMatrix)
+    volatility                 per holding and for the weighted portfolio, annualized
+    risk contributions         w_i (C w)_i / w'Cw, the share of variance each holding adds
+    beta                       to the benchmark, per holding and for the portfolio
+    historical VaR / ES        1-day loss quantiles of the portfolio's daily returns
+    drawdown                   max and current, on the portfolio's return path
+    concentration              largest weight, HHI and effective number of holdings
+
+Returns are kept per account in a ReturnMatrix holding the window plus
+the sums sum(r) and sum(r r'). When a new daily bar arrives only its row
+is added (and the oldest dropped), an O(N^2) update instead of
+recomputing X'X; the matrix is rebuilt only when the set of holdings
+changes. Finished reports are cached until the holdings or the latest bar
+change.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import accounts, cache, lazy, log, market_data, metrics, trading
+
+np = lazy.lazy_import("numpy")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+BENCHMARK = "NSE_INDEX|Nifty 50"
+# Calendar days of candles requested (the prefetcher keeps the same range warm)
+HISTORY_DAYS = 365
+# Daily returns kept in the window, and sessions per year for annualizing
+WINDOW = 250
+TRADING_DAYS = 252
+MIN_OBSERVATIONS = 20
+# Pairs listed when the full correlation matrix would be too large to return
+MAX_MATRIX = 10
+TOP_PAIRS = 5
+FETCH_WORKERS = 8
+
+_reports = cache.TTLCache("portfolio_risk", maxsize=64, ttl=15 * 60)
+_matrices = {}  # account -> ReturnMatrix
+_lock = threading.Lock()
+
+
+class ReturnMatrix:
+    """Aligned daily returns for fixed columns, with running sums for the covariance."""
+
+    def __init__(self, columns, dates, returns, window=WINDOW):
+        self.columns = tuple(columns)
+        self.window = window
+        self.dates = list(dates[-window:])
+        self.returns = np.array(returns[-window:], dtype=float)
+        self.sum = self.returns.sum(axis=0)
+        self.cross = self.returns.T @ self.returns
+
+    def extend(self, dates, returns):
+        """Appends rows for later dates, dropping the oldest beyond the window; returns rows added."""
+        added = 0
+        for date, row in zip(dates, np.asarray(returns, dtype=float)):
+            if self.dates and date <= self.dates[-1]:
+                continue
+            self.dates.append(date)
+            self.returns = np.vstack([self.returns, row])
+            self.sum += row
+            self.cross += np.outer(row, row)
+            added += 1
+        while len(self.dates) > self.window:
+            old = self.returns[0]
+            self.sum -= old
+            self.cross -= np.outer(old, old)
+            self.returns = self.returns[1:]
+            self.dates.pop(0)
+        return added
+
+    def __len__(self):
+        return len(self.dates)
+
+    def covariance(self):
+        n = len(self.dates)
+        return (self.cross - np.outer(self.sum, self.sum) / n) / (n - 1)
+
+
+def _closes(keys):
+    """DataFrame of daily closes (index: date, columns: keys) on common dates, and keys without history."""
+    fetch = accounts.propagate(lambda key: market_data.get_candles(key, interval="day", days=HISTORY_DAYS))
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(keys))) as pool:
+        frames = list(pool.map(fetch, keys))
+    series, missing = {}, []
+    for key, frame in zip(keys, frames):
+        if isinstance(frame, dict) or len(frame) < 2:
+            missing.append(key)
+            continue
+        series[key] = pd.Series(frame["close"].to_numpy(dtype=float),
+                                index=frame["timestamp"].astype(str).str[:10])
+    if not series:
+        return None, missing
+    closes = pd.concat(series, axis=1, join="inner").sort_index()
+    return closes[~closes.index.duplicated(keep="last")], missing
+
+
+def _matrix_for(account, columns, closes):
+    """The account's ReturnMatrix for `columns`, extended with new bars or rebuilt."""
+    returns = closes.pct_change().iloc[1:]
+    dates = list(returns.index)
+    values = returns.to_numpy()
+    with _lock:
+        matrix = _matrices.get(account)
+        if matrix is not None and matrix.columns == tuple(columns) and matrix.dates and matrix.dates[-1] in returns.index:
+            added = matrix.extend(dates, values)
+            metrics.inc("portfolio_risk_updates_total", kind="incremental" if added else "unchanged")
+            return matrix
+        matrix = _matrices[account] = ReturnMatrix(columns, dates, values)
+    metrics.inc("portfolio_risk_updates_total", kind="rebuild")
+    return matrix
+
+
+def _holdings_table(holdings):
+    rows = {}
+    for h in holdings:
+        key = h.get("instrument_token")
+        value = (h.get("quantity") or 0) * (h.get("last_price") or 0.0)
+        if key and value > 0:
+            row = rows.setdefault(key, {"symbol": h.get("tradingsymbol") or key, "value": 0.0})
+            row["value"] += value
+    return rows
+
+
+def _drawdown(returns):
+    path = np.cumprod(1.0 + returns)
+    peaks = np.maximum.accumulate(np.concatenate([[1.0], path]))[1:]
+    drawdowns = path / peaks - 1.0
+    return float(drawdowns.min()), float(drawdowns[-1])
+
+
+def compute(matrix, keys, values, symbols, confidence=0.95, has_benchmark=False):
+    """The risk report for holdings `keys` worth `values` over `matrix` (see module docstring)."""
+    n = len(keys)
+    cov = matrix.covariance()
+    weights = np.asarray(values, dtype=float)
+    total = weights.sum()
+    weights = weights / total
+    asset_cov = cov[:n, :n]
+
+    port_var = float(weights @ asset_cov @ weights)
+    port_vol = float(np.sqrt(max(port_var, 0.0)))
+    vols = np.sqrt(np.diag(asset_cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = asset_cov / np.outer(vols, vols)
+    contrib = weights * (asset_cov @ weights) / port_var if port_var > 0 else np.zeros(n)
+
+    port_returns = matrix.returns[:, :n] @ weights
+    tail = np.quantile(port_returns, 1.0 - confidence)
+    losses = port_returns[port_returns <= tail]
+    max_dd, current_dd = _drawdown(port_returns)
+    hhi = float(np.sum(weights ** 2))
+
+    holdings = []
+    for i, key in enumerate(keys):
+        holdings.append({
+            "symbol": symbols[i],
+            "instrument_token": key,
+            "weight_pct": round(float(weights[i]) * 100, 2),
+            "volatility_pct": round(float(vols[i]) * TRADING_DAYS ** 0.5 * 100, 2),
+            "risk_contribution_pct": round(float(contrib[i]) * 100, 2),
+        })
+
+    report = {
+        "as_of": matrix.dates[-1],
+        "observations": len(matrix),
+        "portfolio_value": round(float(total), 2),
+        "volatility_pct": round(port_vol * TRADING_DAYS ** 0.5 * 100, 2),
+        "var": {
+            "confidence_pct": round(confidence * 100, 1),
+            "one_day_pct": round(float(-tail) * 100, 2),
+            "one_day_amount": round(float(-tail) * float(total), 2),
+            "expected_shortfall_pct": round(float(-losses.mean()) * 100, 2) if len(losses) else None,
+        },
+        "max_drawdown_pct": round(max_dd * 100, 2),
+        "current_drawdown_pct": round(current_dd * 100, 2),
+        "concentration": {
+            "largest_weight_pct": round(float(weights.max()) * 100, 2),
+            "hhi": round(hhi, 4),
+            "effective_holdings": round(1.0 / hhi, 2),
+        },
+    }
+    if n > 1:
+        upper = np.triu_indices(n, k=1)
+        pair_corr = corr[upper]
+        pair_weight = (weights[:, None] * weights[None, :])[upper]
+        report["average_correlation"] = round(float(np.average(pair_corr, weights=pair_weight)), 3)
+        if n <= MAX_MATRIX:
+            report["correlation"] = {symbols[i]: {symbols[j]: round(float(corr[i, j]), 3) for j in range(n)}
+                                     for i in range(n)}
+        else:
+            order = np.argsort(pair_corr)[::-1][:TOP_PAIRS]
+            report["most_correlated"] = [
+                {"pair": [symbols[upper[0][k]], symbols[upper[1][k]]], "correlation": round(float(pair_corr[k]), 3)}
+                for k in order]
+    if has_benchmark:
+        bench_var = cov[n, n]
+        betas = cov[:n, n] / bench_var if bench_var > 0 else np.full(n, np.nan)
+        report["beta"] = round(float(weights @ betas), 3)
+        for i, row in enumerate(holdings):
+            row["beta"] = round(float(betas[i]), 3)
+    report["holdings"] = sorted(holdings, key=lambda h: h["weight_pct"], reverse=True)
+    return report
+
+
+def portfolio_risk(confidence=0.95, benchmark=BENCHMARK, refresh=False):
+    """
+    Risk report for the current account's holdings (see module docstring),
+    or an error dict. Cached until the holdings or the latest daily bar change.
+    """
+    if not 0.5 < confidence < 1:
+        return {"error": "confidence must be between 0.5 and 1 (e.g. 0.95)"}
+    holdings = trading.get_portfolio()
+    if isinstance(holdings, dict):
+        return holdings
+    table = _holdings_table(holdings)
+    if not table:
+        return {"error": "No holdings with a market value to analyse"}
+
+    with metrics.timer("portfolio_risk_seconds"):
+        keys = sorted(table)
+        closes, missing = _closes(keys + ([benchmark] if benchmark else []))
+        has_benchmark = bool(benchmark) and benchmark not in missing
+        keys = [key for key in keys if key not in missing]
+        if closes is None or not keys:
+            return {"error": "No daily history available for the holdings"}
+        columns = keys + ([benchmark] if has_benchmark else [])
+        closes = closes[columns]
+        if len(closes) <= MIN_OBSERVATIONS:
+            return {"error": f"Only {len(closes) - 1} aligned daily returns; need more than {MIN_OBSERVATIONS}"}
+
+        account = accounts.current()
+        signature = (account, tuple((k, round(table[k]["value"], 2)) for k in keys), closes.index[-1],
+                     confidence, has_benchmark)
+        report = None if refresh else _reports.get(signature)
+        if report is None:
+            matrix = _matrix_for(account, columns, closes)
+            report = compute(matrix, keys, [table[k]["value"] for k in keys],
+                             [table[k]["symbol"] for k in keys], confidence, has_benchmark)
+            excluded = [table[k]["symbol"] for k in missing if k in table]
+            if excluded:
+                report["excluded"] = excluded
+            if benchmark and not has_benchmark:
+                report["note"] = f"No history for benchmark {benchmark}; beta omitted"
+            _reports.set(signature, report)
+            logger.info("portfolio_risk", account=account, holdings=len(keys), observations=report["observations"],
+                        volatility_pct=report["volatility_pct"], var_pct=report["var"]["one_day_pct"])
+    return report
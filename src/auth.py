@@ -1,30 +1,47 @@
 import json
-import webbrowser
-from flask import Flask, request
-import upstox_client
-from upstox_client.api import LoginApi
 import os
-import time
+from . import accounts
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.json')
 
 def load_config():
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.json')
-    with open(config_path, 'r') as f:
+    with open(CONFIG_PATH, 'r') as f:
         return json.load(f)
 
+# Callables applied to every new ApiClient, e.g. to swap its transport
+# (see src/recorder.py and benchmarks/stubs.py)
+client_hooks = []
+
 def get_upstox_client():
-    config = load_config()
-    if 'access_token' in config and config['access_token']:
-        configuration = upstox_client.Configuration()
-        configuration.access_token = config['access_token']
-        return upstox_client.ApiClient(configuration)
-    return None
+    """Pooled ApiClient for the current account (see src/accounts.py), or None without a token"""
+    return accounts.get_client()
+
+def reset_clients():
+    """Drops pooled clients so the next call builds them with the current client_hooks"""
+    accounts.get_pool().clear()
 
 def get_token():
+    if accounts.current() != accounts.DEFAULT_ACCOUNT:
+        return (accounts.get_pool().store.get(accounts.current()) or {}).get('access_token')
     config = load_config()
     return config.get('access_token')
 
+def set_access_token(access_token):
+    """Stores the access token in config/config.json"""
+    try:
+        config = load_config()
+    except FileNotFoundError:
+        config = {}
+    except json.JSONDecodeError:
+        return False
+    config['access_token'] = access_token.strip()
+    os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
+    with open(CONFIG_PATH, 'w') as f:
+        json.dump(config, f, indent=4)
+    return True
+
 def refresh_token(refresh_token):
     pass
 
 def start_authentication():
-    pass 
\ No newline at end of file
+    pass
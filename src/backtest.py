@@ -0,0 +1,338 @@
+# src/backtest.py
+"""
+Vectorised backtests of simple long-only strategies over cached candles.
+
+Strategies turn price arrays into a 0/1 "want to be long" signal with
+whole-array NumPy operations. Trades open on a 0->1 transition and close on
+1->0 at that bar's close; optional stop-loss / take-profit exits are found
+per trade with one array scan each, so the Python-level work is O(trades),
+not O(bars). Fees are charged on every entry and exit.
+
+Parameter sweeps put the price arrays in shared memory once and fan the
+grid out over a process pool.
+"""
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import lazy, log, market_data, metrics
+
+np = lazy.lazy_import("numpy")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+# Bars per year used to annualise returns and Sharpe
+# Most daily (or 30-minute) history one Upstox request returns
+MAX_DAYS = 365
+BARS_PER_YEAR = {"day": 252, "week": 52, "month": 12, "30minute": 252 * 13, "1minute": 252 * 375}
+
+# Default parameters per strategy, and the grids explored by sweep()
+STRATEGIES = {
+    "sma_crossover": {
+        "defaults": {"fast": 10, "slow": 30},
+        "grid": {"fast": [5, 10, 15, 20], "slow": [30, 50, 100, 200]},
+    },
+    "ema_crossover": {
+        "defaults": {"fast": 12, "slow": 26},
+        "grid": {"fast": [5, 9, 12, 20], "slow": [26, 50, 100]},
+    },
+    "rsi_threshold": {
+        "defaults": {"period": 14, "lower": 30, "upper": 70},
+        "grid": {"period": [7, 14, 21], "lower": [20, 25, 30, 35], "upper": [60, 65, 70, 80]},
+    },
+    "breakout": {
+        "defaults": {"lookback": 20, "exit_lookback": 10},
+        "grid": {"lookback": [10, 20, 55], "exit_lookback": [5, 10, 20]},
+    },
+}
+
+
+# --- Indicators ---
+
+def sma(values, period):
+    """Simple moving average; NaN until `period` values are available."""
+    out = np.full(values.shape, np.nan)
+    if period <= len(values):
+        csum = np.cumsum(np.insert(values, 0, 0.0))
+        out[period - 1:] = (csum[period:] - csum[:-period]) / period
+    return out
+
+
+def ema(values, period):
+    """Exponential moving average seeded with the first value."""
+    return pd.Series(values).ewm(span=period, adjust=False).mean().to_numpy()
+
+
+def rsi(close, period):
+    """Wilder's RSI (simple-average approximation); NaN during warm-up."""
+    delta = np.diff(close, prepend=close[0])
+    gains = sma(np.clip(delta, 0, None), period)
+    losses = sma(np.clip(-delta, 0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = gains / losses
+        out = 100.0 - 100.0 / (1.0 + rs)
+    out[(losses == 0) & ~np.isnan(gains)] = 100.0
+    return out
+
+
+def rolling_max(values, window):
+    """Max over the previous `window` bars, excluding the current one."""
+    out = np.full(values.shape, np.nan)
+    if window < len(values):
+        view = np.lib.stride_tricks.sliding_window_view(values, window)[:-1]
+        out[window:] = view.max(axis=1)
+    return out
+
+
+def rolling_min(values, window):
+    """Min over the previous `window` bars, excluding the current one."""
+    out = np.full(values.shape, np.nan)
+    if window < len(values):
+        view = np.lib.stride_tricks.sliding_window_view(values, window)[:-1]
+        out[window:] = view.min(axis=1)
+    return out
+
+
+def _latch(enter, leave):
+    """Turns enter/leave event masks into a held 0/1 state (leave wins ties)."""
+    events = np.where(leave, -1, np.where(enter, 1, 0))
+    idx = np.where(events != 0, np.arange(len(events)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    state = events[idx]
+    return (state == 1).astype(np.int8)
+
+
+# --- Signals ---
+
+def signal(strategy, prices, params):
+    """Returns the 0/1 long signal for `strategy` over OHLC `prices` (4 x n array)."""
+    close, high, low = prices[3], prices[1], prices[2]
+    if strategy in ("sma_crossover", "ema_crossover"):
+        if params["fast"] >= params["slow"]:
+            raise ValueError("fast period must be shorter than slow period")
+        average = sma if strategy == "sma_crossover" else ema
+        fast, slow = average(close, params["fast"]), average(close, params["slow"])
+        with np.errstate(invalid="ignore"):
+            return np.nan_to_num(fast > slow).astype(np.int8)
+    if strategy == "rsi_threshold":
+        value = rsi(close, params["period"])
+        with np.errstate(invalid="ignore"):
+            return _latch(value < params["lower"], value > params["upper"])
+    if strategy == "breakout":
+        with np.errstate(invalid="ignore"):
+            return _latch(close > rolling_max(high, params["lookback"]),
+                          close < rolling_min(low, params["exit_lookback"]))
+    raise ValueError(f"Unknown strategy '{strategy}'. Available: {', '.join(STRATEGIES)}")
+
+
+# --- Simulation ---
+
+def simulate(prices, sig, stop_loss=None, take_profit=None, fee_bps=3.0,
+             capital=100000.0, bars_per_year=252):
+    """
+    Runs the long-only simulation for signal `sig` over OHLC `prices`.
+    stop_loss / take_profit are fractions of the entry price (0.05 = 5%).
+    Returns a dict of compact metrics.
+    """
+    open_, high, low, close = prices
+    n = len(close)
+    fee = fee_bps / 10000.0
+    if n < 2:
+        raise ValueError("Need at least two candles to backtest")
+
+    # Trades from signal transitions; a signal still on at the end is closed on the last bar
+    edges = np.diff(np.concatenate(([0], sig.astype(np.int8), [0])))
+    entries = np.flatnonzero(edges == 1)
+    exits = np.minimum(np.flatnonzero(edges == -1), n - 1)
+    keep = exits > entries
+    entries, exits = entries[keep], exits[keep]
+    entry_prices = close[entries]
+    exit_prices = close[exits].copy()
+    stopped = np.zeros(len(entries), dtype=bool)
+
+    if stop_loss or take_profit:
+        for i, (e, x) in enumerate(zip(entries, exits)):
+            window = slice(e + 1, x + 1)
+            hit = np.zeros(x - e, dtype=bool)
+            if stop_loss:
+                stop_price = entry_prices[i] * (1 - stop_loss)
+                sl_hit = low[window] <= stop_price
+                hit |= sl_hit
+            if take_profit:
+                tp_price = entry_prices[i] * (1 + take_profit)
+                hit |= high[window] >= tp_price
+            if hit.any():
+                k = e + 1 + int(np.argmax(hit))
+                # Stop checked first within a bar (conservative); gaps fill at the open
+                if stop_loss and low[k] <= stop_price:
+                    exit_prices[i] = min(stop_price, open_[k])
+                else:
+                    exit_prices[i] = max(tp_price, open_[k])
+                exits[i] = k
+                stopped[i] = True
+
+    # Per-bar strategy returns: long over (entry, exit], exit bar marked at the exit price
+    delta = np.zeros(n + 1)
+    np.add.at(delta, entries + 1, 1)
+    np.add.at(delta, exits + 1, -1)
+    position = np.cumsum(delta)[:n]
+    bar_returns = np.zeros(n)
+    bar_returns[1:] = close[1:] / close[:-1] - 1.0
+    strat_returns = position * bar_returns
+    strat_returns[exits] = exit_prices / close[exits - 1] - 1.0
+
+    # Fees: one charge per entry and per exit, applied multiplicatively
+    fee_events = np.zeros(n)
+    np.add.at(fee_events, entries, 1)
+    np.add.at(fee_events, exits, 1)
+    equity = np.cumprod(1.0 + strat_returns) * (1.0 - fee) ** np.cumsum(fee_events)
+
+    trade_returns = exit_prices / entry_prices * (1 - fee) ** 2 - 1.0
+    peak = np.maximum.accumulate(equity)
+    drawdown = equity / peak - 1.0
+    years = n / bars_per_year
+    total_return = equity[-1] - 1.0
+    std = strat_returns.std()
+    return {
+        "total_return_pct": round(float(total_return) * 100, 2),
+        # Annualising less than a quarter of data gives meaningless numbers
+        "cagr_pct": round((float(equity[-1]) ** (1 / years) - 1) * 100, 2) if years >= 0.25 and equity[-1] > 0 else None,
+        "sharpe": round(float(strat_returns.mean() / std * math.sqrt(bars_per_year)), 2) if std > 0 else 0.0,
+        "max_drawdown_pct": round(float(drawdown.min()) * 100, 2),
+        "trades": int(len(entries)),
+        "win_rate_pct": round(float((trade_returns > 0).mean()) * 100, 1) if len(entries) else 0.0,
+        "avg_trade_pct": round(float(trade_returns.mean()) * 100, 2) if len(entries) else 0.0,
+        "stopped_trades": int(stopped.sum()),
+        "exposure_pct": round(float(position.mean()) * 100, 1),
+        # Each bar's fees come off the equity after that bar's return
+        "fees_paid": round(float(capital * np.sum(equity / (1.0 - fee) ** fee_events - equity)), 2),
+        "final_equity": round(float(capital * equity[-1]), 2),
+        "pnl": round(float(capital * total_return), 2),
+        "buy_and_hold_pct": round(float(close[-1] / close[0] - 1) * 100, 2),
+    }
+
+
+def _prices_from_frame(frame):
+    return np.ascontiguousarray(frame[["open", "high", "low", "close"]].to_numpy(dtype=float).T)
+
+
+def _resolve_params(strategy, params):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'. Available: {', '.join(STRATEGIES)}")
+    resolved = dict(STRATEGIES[strategy]["defaults"])
+    resolved.update({k: v for k, v in (params or {}).items() if v is not None})
+    unknown = set(resolved) - set(STRATEGIES[strategy]["defaults"])
+    if unknown:
+        raise ValueError(f"Unknown parameters for {strategy}: {', '.join(sorted(unknown))}")
+    return {k: int(v) if float(v).is_integer() else float(v) for k, v in resolved.items()}
+
+
+def _load_prices(symbol, interval, days):
+    if interval in ("day", "30minute") and days > MAX_DAYS:
+        return {"error": f"At most {MAX_DAYS} days of {interval} candles are available per request, not {days}"}
+    frame = market_data.get_candles(symbol, interval=interval, days=days)
+    if isinstance(frame, dict):
+        return frame
+    if len(frame) < 2:
+        return {"error": f"Not enough candles for {symbol} ({len(frame)})"}
+    return _prices_from_frame(frame)
+
+
+@metrics.timed("backtest_seconds")
+def run_backtest(symbol, strategy, params=None, interval="day", days=365,
+                 stop_loss=None, take_profit=None, fee_bps=3.0, capital=100000.0):
+    """Backtests one parameter set; returns metrics or {'error': ...}."""
+    try:
+        resolved = _resolve_params(strategy, params)
+        prices = _load_prices(symbol, interval, days)
+        if isinstance(prices, dict):
+            return prices
+        result = simulate(prices, signal(strategy, prices, resolved), stop_loss, take_profit,
+                          fee_bps, capital, BARS_PER_YEAR.get(interval, 252))
+    except ValueError as e:
+        return {"error": str(e)}
+    result.update({"symbol": symbol, "strategy": strategy, "params": resolved,
+                   "interval": interval, "bars": int(prices.shape[1])})
+    return result
+
+
+# --- Parameter sweeps ---
+
+# Set only inside process-pool workers (see _attach_shared)
+_worker_prices = None
+_worker_shm = None
+
+
+def _attach_shared(name, shape):
+    """Process-pool initializer: maps the shared price block into this worker."""
+    global _worker_prices, _worker_shm
+    from multiprocessing import shared_memory
+    # Workers report to the parent's resource tracker, which unlinks the block once
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_prices = np.ndarray(shape, dtype=np.float64, buffer=_worker_shm.buf)
+
+
+def _sweep_one(job, prices=None):
+    strategy, params, options = job
+    # In-process sweeps pass their own array; pool workers use the shared block
+    prices = _worker_prices if prices is None else prices
+    try:
+        result = simulate(prices, signal(strategy, prices, params), **options)
+    except ValueError as e:
+        return {"params": params, "error": str(e)}
+    result["params"] = params
+    return result
+
+
+def _grid(strategy, grid):
+    grid = grid or STRATEGIES[strategy]["grid"]
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield _resolve_params(strategy, dict(zip(names, values)))
+
+
+@metrics.timed("backtest_sweep_seconds")
+def sweep(symbol, strategy, grid=None, interval="day", days=365, stop_loss=None,
+          take_profit=None, fee_bps=3.0, rank_by="sharpe", top=5, workers=None):
+    """
+    Runs every parameter combination in `grid` (default: the strategy's grid)
+    across a process pool and returns the `top` results ranked by `rank_by`.
+    """
+    from multiprocessing import shared_memory
+
+    try:
+        jobs_params = list(_grid(strategy, grid))
+    except ValueError as e:
+        return {"error": str(e)}
+    prices = _load_prices(symbol, interval, days)
+    if isinstance(prices, dict):
+        return prices
+    options = {"stop_loss": stop_loss, "take_profit": take_profit, "fee_bps": fee_bps,
+               "bars_per_year": BARS_PER_YEAR.get(interval, 252)}
+    jobs = [(strategy, params, options) for params in jobs_params]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+
+    if workers <= 1 or len(jobs) < 4:
+        # Not worth a pool; run in-process against the local arrays
+        results = [_sweep_one(job, prices) for job in jobs]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=prices.nbytes)
+        try:
+            np.ndarray(prices.shape, dtype=prices.dtype, buffer=shm.buf)[:] = prices
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared,
+                                     initargs=(shm.name, prices.shape)) as pool:
+                results = list(pool.map(_sweep_one, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    ok = [r for r in results if "error" not in r]
+    ok.sort(key=lambda r: (r.get(rank_by) is not None, r.get(rank_by) or 0), reverse=True)
+    logger.info("backtest_sweep", symbol=symbol, strategy=strategy, combinations=len(jobs), workers=workers)
+    return {
+        "symbol": symbol, "strategy": strategy, "interval": interval, "bars": int(prices.shape[1]),
+        "combinations": len(jobs), "ranked_by": rank_by, "top": ok[:top],
+        "failed": len(results) - len(ok),
+    }
@@ -0,0 +1,173 @@
+# src/batch.py
+"""
+Runs many prompts through trading_assistant at once (see run_batch.py).
+
+Input is JSONL, one prompt per line, either a bare string or an object:
+
+    "How did INFY do this week?"
+    {"id": "infy-week", "prompt": "How did INFY do this week?", "account": "alice"}
+    {"id": "eod", "prompt": "Summarise {symbol}'s day", "symbols": ["INFY", "TCS", "HDFCBANK"]}
+
+A "symbols" list expands the prompt once per symbol ({symbol} in the text).
+Prompts run on a bounded thread pool and share the process-wide quote,
+candle and prompt caches. Within a batch, identical read-only tool calls
+(same tool, arguments and account) run once; concurrent duplicates wait
+for the first call and later ones reuse its result for CALL_TTL seconds.
+Order and alert tools are withheld unless the batch allows writes.
+
+Each result is written as one JSONL line as soon as it finishes:
+id, prompt, response or error, latency_ms and the request's token stats.
+"""
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from . import accounts, gemini, log, metrics
+
+logger = log.get_logger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+# Seconds a tool result is shared between prompts of a batch
+CALL_TTL = 60.0
+
+STAT_FIELDS = ("calls", "prompt_tokens", "response_tokens", "cached_tokens", "saved_tokens", "intents", "tools")
+
+
+class BatchError(ValueError):
+    """The input file has a malformed line."""
+
+
+class ToolCallCache:
+    """Single-flight memo of tool results keyed by (account, tool, arguments)."""
+
+    def __init__(self, ttl=CALL_TTL):
+        self.ttl = ttl
+        self.calls = 0
+        self.hits = 0
+        self._entries = {}  # key -> (started at, Future)
+        self._lock = threading.Lock()
+
+    def call(self, name, args, func):
+        key = (accounts.current(), name, json.dumps(args, sort_keys=True, default=str))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (not entry[1].done() or now - entry[0] < self.ttl):
+                self.hits += 1
+                future, owner = entry[1], False
+            else:
+                self.calls += 1
+                future, owner = Future(), True
+                self._entries[key] = (now, future)
+        if not owner:
+            metrics.inc("batch_tool_calls_deduplicated_total", tool=name)
+            return future.result()
+        try:
+            result = func(**args)
+        except BaseException as e:
+            self._forget(key, future)
+            future.set_exception(e)
+            raise
+        if isinstance(result, dict) and "error" in result:
+            # Don't pin failures; the next prompt tries again
+            self._forget(key, future)
+        future.set_result(result)
+        return result
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._entries.get(key, (None, None))[1] is future:
+                del self._entries[key]
+
+
+def read_prompts(path):
+    """Parses the input JSONL into [{"id", "prompt", "account"}], expanding symbol lists."""
+    prompts = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise BatchError(f"{path}:{number}: not valid JSON ({e})")
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+                raise BatchError(f"{path}:{number}: expected a string or an object with a \"prompt\"")
+            base_id = str(item.get("id", number))
+            symbols = item.get("symbols")
+            if symbols:
+                for symbol in symbols:
+                    prompts.append({"id": f"{base_id}:{symbol}", "prompt": item["prompt"].replace("{symbol}", symbol),
+                                    "account": item.get("account")})
+            else:
+                prompts.append({"id": base_id, "prompt": item["prompt"], "account": item.get("account")})
+    return prompts
+
+
+def run_one(item, read_only=True, tool_cache=None):
+    """Runs one prompt; returns its result record."""
+    stats = {}
+    start = time.perf_counter()
+    record = {"id": item["id"], "prompt": item["prompt"]}
+    if item.get("account"):
+        record["account"] = item["account"]
+    try:
+        with accounts.use_account(item.get("account") or accounts.current()):
+            record["response"] = gemini.trading_assistant(item["prompt"], stats=stats, read_only=read_only,
+                                                          tool_cache=tool_cache)
+    except Exception as e:
+        logger.error("batch_prompt_failed", id=item["id"], exc_info=True)
+        record["error"] = str(e)
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    record.update({field: stats[field] for field in STAT_FIELDS if field in stats})
+    return record
+
+
+def run_batch(prompts, output, concurrency=DEFAULT_CONCURRENCY, read_only=True, progress=None):
+    """
+    Runs `prompts` (from read_prompts) with at most `concurrency` in flight,
+    appending each result to the open text file `output` as JSONL. Returns
+    a summary: counts, latency percentiles, token totals, deduplicated calls.
+    """
+    tool_cache = ToolCallCache()
+    start = time.perf_counter()
+    latencies, failed, done = [], 0, 0
+    totals = dict.fromkeys(("calls", "prompt_tokens", "response_tokens", "cached_tokens"), 0)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(accounts.propagate(run_one), item, read_only, tool_cache) for item in prompts]
+        for future in as_completed(futures):
+            record = future.result()
+            output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+            done += 1
+            latencies.append(record["latency_ms"])
+            failed += "error" in record
+            for field in totals:
+                totals[field] += record.get(field) or 0
+            if progress:
+                progress(done, len(prompts), record)
+
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    summary = {
+        "prompts": len(prompts),
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "prompts_per_second": round(len(prompts) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered), 1) if ordered else None,
+            "p50": ordered[len(ordered) // 2] if ordered else None,
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else None,
+        },
+        "tool_calls": tool_cache.calls,
+        "tool_calls_deduplicated": tool_cache.hits,
+        **totals,
+    }
+    logger.info("batch_finished", prompts=len(prompts), failed=failed, seconds=summary["seconds"],
+                deduplicated=tool_cache.hits)
+    return summary
@@ -0,0 +1,82 @@
+# src/cache.py
+"""Small thread-safe in-memory caches with hit/miss metrics."""
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire after `ttl` seconds.
+    Lookups are counted in cache_hits_total / cache_misses_total{cache=name}.
+    """
+
+    def __init__(self, name, maxsize=256, ttl=300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                metrics.record_cache(self.name, True)
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+        metrics.record_cache(self.name, False)
+        return default
+
+    def get_many(self, keys):
+        """Returns {key: value} for the live entries among `keys` (one lock, one metric update)."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key, _MISSING)
+                if entry is _MISSING:
+                    continue
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    found[key] = entry[1]
+                else:
+                    del self._data[key]
+        if found:
+            metrics.inc("cache_hits_total", len(found), cache=self.name)
+        if len(keys) > len(found):
+            metrics.inc("cache_misses_total", len(keys) - len(found), cache=self.name)
+        return found
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        """Returns [(key, value, seconds left)] for the live entries, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value, expires_at - now) for key, (expires_at, value) in self._data.items()
+                    if expires_at > now]
+
+    def invalidate(self, key=None):
+        """Drops one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
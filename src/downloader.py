@@ -0,0 +1,315 @@
+# src/downloader.py
+"""
+Bulk historical-candle downloader behind download_history.py.
+
+The requested instruments x date range is cut into jobs of at most
+MAX_SPAN_DAYS[interval] days each (the most Upstox returns per request for
+that interval). Jobs run on a thread pool through the account's pooled
+client, so they share its token bucket and stay within the rate limit;
+429s and transient errors are retried with backoff.
+
+Each finished job is written as one file in a Hive-style partitioned tree
+
+    <root>/interval=day/instrument=NSE_EQ_INE009A01021/2023-01-01_2023-12-31.parquet
+
+(tmp file + os.replace, so a file is either complete or absent) and
+recorded in <root>/interval=<interval>/_checkpoint.json. A re-run with the
+same arguments skips recorded jobs, so an interrupted download resumes
+where it stopped. A job whose candles start or end well inside its range
+(a response cut short) is reported as incomplete and left out of the
+checkpoint, so the next run fetches it again. Parquet needs pyarrow (or
+fastparquet); csv works with pandas alone.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import accounts, auth, lazy, log, market_data, metrics
+
+upstox_client = lazy.lazy_import("upstox_client")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+# Longest range Upstox serves in one historical-candle request, per interval
+# (HistoryApi: 1minute 1 month, 30minute and day 1 year, week and month 10 years)
+MAX_SPAN_DAYS = {"1minute": 30, "30minute": 365, "day": 365, "week": 3650, "month": 3650}
+# Days a job's first/last candle may sit inside its range (weekends, holidays, bar alignment)
+EDGE_SLACK_DAYS = {"1minute": 7, "30minute": 7, "day": 7, "week": 14, "month": 62}
+FORMATS = ("parquet", "csv")
+CHECKPOINT_VERSION = 1
+DEFAULT_WORKERS = 8
+RETRIES = 4
+# Seconds between checkpoint writes (always written at the end as well)
+CHECKPOINT_EVERY = 2.0
+
+
+class DownloadError(ValueError):
+    """Bad arguments or a missing optional dependency."""
+
+
+# --- Jobs ---
+
+def split_range(start, end, span_days):
+    """Consecutive (from, to) date pairs covering start..end, each at most span_days long."""
+    ranges = []
+    while start <= end:
+        stop = min(end, start + datetime.timedelta(days=span_days - 1))
+        ranges.append((start, stop))
+        start = stop + datetime.timedelta(days=1)
+    return ranges
+
+
+def make_jobs(instrument_keys, start, end, interval):
+    """[(instrument_key, from_date, to_date)] for every instrument and sub-range."""
+    if interval not in MAX_SPAN_DAYS:
+        raise DownloadError(f"Unsupported interval '{interval}', use one of {', '.join(MAX_SPAN_DAYS)}")
+    if start > end:
+        raise DownloadError("Start date is after end date")
+    ranges = split_range(start, end, MAX_SPAN_DAYS[interval])
+    return [(key, a, b) for key in instrument_keys for a, b in ranges]
+
+
+def job_id(job):
+    key, start, end = job
+    return f"{key}/{start.isoformat()}/{end.isoformat()}"
+
+
+def missing_edge(frame, start, end, interval, today=None):
+    """
+    Describes how `frame` falls short of start..end, or returns None if it
+    covers the range. Empty frames count as covered (holidays, not yet listed).
+    """
+    if not len(frame):
+        return None
+    slack = datetime.timedelta(days=EDGE_SLACK_DAYS[interval])
+    first, last = frame["timestamp"].iloc[0].date(), frame["timestamp"].iloc[-1].date()
+    if first - start > slack:
+        return f"candles start {first.isoformat()}, {(first - start).days} days after {start.isoformat()}"
+    end = min(end, today or datetime.date.today())
+    if end - last > slack:
+        return f"candles end {last.isoformat()}, {(end - last).days} days before {end.isoformat()}"
+    return None
+
+
+def partition_dir(root, interval, instrument_key):
+    safe = instrument_key.replace("|", "_").replace("/", "_")
+    return os.path.join(root, f"interval={interval}", f"instrument={safe}")
+
+
+# --- Output ---
+
+def check_format(fmt):
+    """Raises DownloadError if `fmt` can't be written in this environment."""
+    if fmt not in FORMATS:
+        raise DownloadError(f"Unsupported format '{fmt}', use one of {', '.join(FORMATS)}")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            try:
+                import fastparquet  # noqa: F401
+            except ImportError:
+                raise DownloadError("Parquet output needs pyarrow (pip install pyarrow); "
+                                    "or use --format csv") from None
+
+
+def write_frame(frame, path, fmt):
+    """Writes `frame` to `path` atomically; returns the bytes written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if fmt == "parquet":
+            frame.to_parquet(tmp, index=False)
+        else:
+            frame.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return os.path.getsize(path)
+
+
+class Checkpoint:
+    """Finished jobs for one store/interval, saved as JSON (atomic replace)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}  # job id -> {"rows", "file"}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("checkpoint_unreadable", path=path, error=str(e))
+            return
+        if data.get("version") == CHECKPOINT_VERSION:
+            self.done = data.get("done", {})
+
+    def record(self, jid, rows, file):
+        with self._lock:
+            self.done[jid] = {"rows": rows, "file": file}
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= CHECKPOINT_EVERY
+        if due:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": CHECKPOINT_VERSION, "done": dict(self.done)}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+
+
+# --- Download ---
+
+def fetch_candles(api_client, instrument_key, interval, start, end):
+    """One historical-candle request with retries; returns an oldest-first DataFrame."""
+    history_api = upstox_client.HistoryApi(api_client)
+    delay = 1.0
+    for attempt in range(RETRIES + 1):
+        try:
+            with metrics.timer("upstox_request_seconds", endpoint="historical_candle"):
+                response = history_api.get_historical_candle_data1(
+                    instrument_key, interval, end.isoformat(), start.isoformat(), '2.0')
+            candles = (response.data.candles if response and response.data else None) or []
+            frame = market_data.candles_to_frame(candles).iloc[::-1].reset_index(drop=True)
+            frame["timestamp"] = pd.to_datetime(frame["timestamp"])
+            return frame
+        except upstox_client.rest.ApiException as e:
+            # 429 (rate limit) and 5xx are worth another try, anything else isn't
+            if attempt == RETRIES or not (e.status == 429 or (e.status or 0) >= 500):
+                raise
+            logger.debug("download_retry", instrument=instrument_key, status=e.status, attempt=attempt + 1)
+            time.sleep(delay)
+            delay *= 2
+
+
+class Downloader:
+    """Runs download jobs concurrently with checkpointing and progress stats."""
+
+    def __init__(self, root, interval="day", fmt="parquet", workers=DEFAULT_WORKERS, progress=None):
+        check_format(fmt)
+        self.root = root
+        self.interval = interval
+        self.fmt = fmt
+        self.workers = workers
+        self.progress = progress  # called with the stats dict every second or so
+        self.checkpoint = Checkpoint(os.path.join(root, f"interval={interval}", "_checkpoint.json"))
+        self._stop = threading.Event()
+        self.stats = {}
+
+    def stop(self):
+        """Asks a running download to stop after the jobs in flight."""
+        self._stop.set()
+
+    def run(self, jobs):
+        """Runs `jobs` (skipping checkpointed ones); returns the throughput report."""
+        pending = [job for job in jobs if job_id(job) not in self.checkpoint.done]
+        api_client = auth.get_upstox_client()
+        if not api_client:
+            raise DownloadError("Authentication required (run set_token.py)")
+        start = time.perf_counter()
+        self.stats = {"jobs": len(jobs), "skipped": len(jobs) - len(pending), "done": 0, "failed": 0,
+                      "incomplete": 0, "rows": 0, "bytes": 0, "errors": []}
+        last_report = 0.0
+
+        def work(job):
+            if self._stop.is_set():
+                return None
+            key, a, b = job
+            frame = fetch_candles(api_client, key, self.interval, a, b)
+            path = os.path.join(partition_dir(self.root, self.interval, key), f"{a.isoformat()}_{b.isoformat()}.{self.fmt}")
+            size = write_frame(frame, path, self.fmt) if len(frame) else 0
+            return len(frame), size, os.path.relpath(path, self.root) if size else None, \
+                missing_edge(frame, a, b, self.interval)
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {}
+        try:
+            futures = {pool.submit(accounts.propagate(work), job): job for job in pending}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    if len(self.stats["errors"]) < 20:
+                        self.stats["errors"].append(f"{job_id(job)}: {e}")
+                    logger.warning("download_failed", job=job_id(job), error=str(e).splitlines()[0] if str(e) else repr(e))
+                    continue
+                if result is None:
+                    continue
+                rows, size, file, short = result
+                self.stats["rows"] += rows
+                self.stats["bytes"] += size
+                if short:
+                    # Written, but not checkpointed: a re-run asks for the range again
+                    self.stats["incomplete"] += 1
+                    if len(self.stats["errors"]) < 20:
+                        self.stats["errors"].append(f"{job_id(job)}: incomplete, {short}")
+                    logger.warning("download_incomplete", job=job_id(job), detail=short)
+                    continue
+                # Empty ranges (holidays, pre-listing) are recorded too, so they aren't re-requested
+                self.checkpoint.record(job_id(job), rows, file)
+                self.stats["done"] += 1
+                if self.progress and time.perf_counter() - last_report >= 1.0:
+                    last_report = time.perf_counter()
+                    self.progress(self._report(start, len(pending)))
+        except KeyboardInterrupt:
+            self._stop.set()
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self.checkpoint.save()
+            self.stats = self._report(start, len(pending))
+            logger.info("download_finished", **{k: v for k, v in self.stats.items() if k != "errors"})
+        return self.stats
+
+    def _report(self, start, pending):
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        stats = dict(self.stats)
+        stats.update(
+            remaining=pending - stats["done"] - stats["failed"] - stats["incomplete"],
+            seconds=round(elapsed, 2),
+            jobs_per_second=round(stats["done"] / elapsed, 1),
+            rows_per_second=round(stats["rows"] / elapsed),
+            mb_per_second=round(stats["bytes"] / elapsed / 1e6, 2),
+        )
+        return stats
+
+
+def universe_keys(csv_path, symbols=None, limit=None):
+    """Instrument keys for `symbols` (names or NSE_EQ|ISIN keys), or every EQ instrument in the bhavcopy."""
+    from . import screener
+    universe = screener.get_universe(csv_path)
+    if symbols:
+        by_symbol = dict(zip(universe["symbol"], universe["instrument_key"]))
+        keys = []
+        for symbol in symbols:
+            if "|" in symbol:
+                keys.append(symbol)
+            elif symbol.upper() in by_symbol:
+                keys.append(by_symbol[symbol.upper()])
+            else:
+                raise DownloadError(f"Unknown symbol '{symbol}'")
+    else:
+        keys = list(universe["instrument_key"])
+    return keys[:limit] if limit else keys
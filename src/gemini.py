@@ -1,29 +1,73 @@
 # src/gemini.py
-import google.genai as genai
-# Explicitly import necessary types
-from google.genai.types import (
-    Tool, FunctionDeclaration, FunctionResponse, Part,
-    GenerateContentConfig, Content # Added Content for history management
-)
 import json
 import os
-import csv
-import requests
+import threading
+import time
 from . import market_data, trading # Assuming these modules exist
+from . import metrics
+from . import log
+from . import lazy
+from . import instruments
+from . import backtest
+from . import screener
+from . import alerts
+from . import intents
+from . import orders
+from . import cache
+from . import analytics
+
+# Heavy dependencies are imported on first use (see src/lazy.py)
+genai = lazy.lazy_import("google.genai")
+types = lazy.lazy_import("google.genai.types")
+genai_errors = lazy.lazy_import("google.genai.errors")
+requests = lazy.lazy_import("requests")
+
+logger = log.get_logger(__name__)
+
+# Local NSE bhavcopy used for symbol -> ISIN lookups
+BHAVCOPY_CSV_PATH = os.path.join(os.path.dirname(__file__), '..', 'NSE-cm03MAY2021bhav.csv')
+
+# Shared HTTP session for FMP calls (keeps connections alive between tool calls)
+_http_session = None
+
+def get_http_session():
+    """Returns the shared requests session, creating it on first use."""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+    return _http_session
+
+def set_http_session(session):
+    """Replaces the shared requests session (e.g. one with custom adapters mounted)."""
+    global _http_session
+    _http_session = session
 
 # --- Function Definitions for Gemini ---
 # (Keep your wrapper functions: get_market_data_wrapper, etc.)
 # ... (wrapper functions remain the same) ...
-def get_market_data_wrapper(symbol: str, days: int = 30):
+# Bars returned to the model per get_market_data call (the most recent ones)
+MAX_MARKET_DATA_BARS = 120
+
+def get_market_data_wrapper(symbol: str, days: int = 30, interval: str = "1d"):
     """
     Retrieves historical market data for a given NSE stock symbol.
     Input:
        - symbol: NSE stock symbol (format: NSE_EQ|<isin_code>)
        - days: Number of days of historical data (default 30)
+       - interval: Bar size: 1m, 5m, 15m, 30m, 1h, 1d, 1w or 1mo (default 1d)
     Returns: Historical market data for analysis.
     """
-    print(f"--- Calling get_market_data(symbol={symbol}, days={days}) ---")
-    return market_data.get_market_data(symbol=symbol, days=days)
+    logger.debug("tool_invoked", tool="get_market_data", symbol=symbol, days=days, interval=interval)
+    bars = market_data.get_market_data(symbol=symbol, timeframe=interval, days=int(days))
+    if isinstance(bars, dict):
+        return bars
+    recent = bars.tail(MAX_MARKET_DATA_BARS)
+    return {
+        "symbol": symbol,
+        "interval": market_data.normalize_interval(interval),
+        "total_bars": len(bars),
+        "bars": recent.to_dict("records"),
+    }
 
 def place_buy_order_wrapper(symbol: str, quantity: int):
     """
@@ -33,7 +77,7 @@ def place_buy_order_wrapper(symbol: str, quantity: int):
        - quantity: Number of shares to buy
     Returns: Order confirmation details.
     """
-    print(f"--- Calling place_buy_order(symbol={symbol}, quantity={quantity}) ---")
+    logger.info("tool_invoked", tool="place_buy_order", symbol=symbol, quantity=quantity)
     return trading.place_buy_order(symbol=symbol, quantity=quantity)
 
 def place_sell_order_wrapper(symbol: str, quantity: int):
@@ -44,7 +88,7 @@ def place_sell_order_wrapper(symbol: str, quantity: int):
        - quantity: Number of shares to sell
     Returns: Order confirmation details.
     """
-    print(f"--- Calling place_sell_order(symbol={symbol}, quantity={quantity}) ---")
+    logger.info("tool_invoked", tool="place_sell_order", symbol=symbol, quantity=quantity)
     return trading.place_sell_order(symbol=symbol, quantity=quantity)
 
 def get_portfolio_wrapper():
@@ -52,7 +96,7 @@ def get_portfolio_wrapper():
     Retrieves the current user's portfolio holdings.
     Returns: Current portfolio holdings.
     """
-    print("--- Calling get_portfolio() ---")
+    logger.debug("tool_invoked", tool="get_portfolio")
     return trading.get_portfolio()
 
 def get_current_price_wrapper(symbol: str):
@@ -62,10 +106,13 @@ def get_current_price_wrapper(symbol: str):
        - symbol: NSE stock symbol (format: NSE_EQ|<isin_code>)
     Returns: Current market price.
     """
-    print(f"--- Calling get_current_price(symbol={symbol}) ---")
+    logger.debug("tool_invoked", tool="get_current_price", symbol=symbol)
     return market_data.get_current_price(symbol=symbol)
 
 
+# ISINs found on FMP keyed by (symbol, exchange); ISINs don't change, misses aren't kept
+_isin_cache = cache.TTLCache("isin", maxsize=4096, ttl=7 * 86400)
+
 def get_isin_for_symbol_wrapper(stock_symbol: str, exchange: str = None):
     """
     Retrieves the ISIN for a given stock symbol using the FMP API.
@@ -95,19 +142,22 @@ def get_isin_for_symbol_wrapper(stock_symbol: str, exchange: str = None):
     if exchange:
         params['exchange'] = exchange
 
-    print(f"--- Executing Tool: get_isin_for_symbol ---")
-    print(f"   Symbol: {stock_symbol}, Exchange: {exchange}")
+    logger.debug("tool_invoked", tool="get_isin_for_symbol", symbol=stock_symbol, exchange=exchange)
+    cached = _isin_cache.get((stock_symbol, exchange))
+    if cached is not None:
+        return {"isin": cached}
 
     try:
-        response = requests.get(api_url, params=params)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        with metrics.timer("fmp_request_seconds", endpoint="search"):
+            response = get_http_session().get(api_url, params=params)
+            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
         data = response.json()
 
         if not data:
             not_found_msg = f"No results found for symbol '{stock_symbol}'"
             if exchange:
                 not_found_msg += f" on exchange '{exchange}'"
-            print(f"   Result: {not_found_msg}")
+            logger.debug("isin_not_found", symbol=stock_symbol, reason=not_found_msg)
             return {"error": not_found_msg}
 
         # Find the exact match if possible, preferring the specified exchange
@@ -124,166 +174,205 @@ def get_isin_for_symbol_wrapper(stock_symbol: str, exchange: str = None):
 
 
         if found_isin:
-            print(f"   Result: Found ISIN {found_isin}")
+            logger.debug("isin_found", symbol=stock_symbol, isin=found_isin)
+            _isin_cache.set((stock_symbol, exchange), found_isin)
             return {"isin": found_isin}
         else:
             not_found_msg = f"ISIN not found within results for exact symbol '{stock_symbol}'"
             if exchange:
                  not_found_msg += f" on exchange '{exchange}'"
-            print(f"   Result: {not_found_msg}")
+            logger.debug("isin_not_found", symbol=stock_symbol, reason=not_found_msg)
             return {"error": not_found_msg}
 
     except requests.exceptions.HTTPError as http_err:
         error_msg = f"API request failed: {http_err}"
-        print(f"   Error: {error_msg}")
+        logger.warning("tool_failed", tool="get_isin_for_symbol", error=error_msg)
         return {"error": error_msg}
     except requests.exceptions.RequestException as req_err:
         error_msg = f"API connection error: {req_err}"
-        print(f"   Error: {error_msg}")
+        logger.warning("tool_failed", tool="get_isin_for_symbol", error=error_msg)
         return {"error": error_msg}
     except ValueError as json_err: # Includes JSONDecodeError
         error_msg = f"Failed to parse API response: {json_err}"
-        print(f"   Error: {error_msg}")
+        logger.warning("tool_failed", tool="get_isin_for_symbol", error=error_msg)
         return {"error": error_msg}
     except Exception as e:
         error_msg = f"An unexpected error occurred: {e}"
-        print(f"   Error: {error_msg}")
+        logger.warning("tool_failed", tool="get_isin_for_symbol", error=error_msg)
         return {"error": error_msg}
     
 def get_isin_from_csv_wrapper(symbol: str):
     """
     Retrieves the ISIN code for a given NSE stock symbol from the local CSV file.
     """
-    csv_path = os.path.join(os.path.dirname(__file__), '..', 'NSE-cm03MAY2021bhav.csv')
+    csv_path = BHAVCOPY_CSV_PATH
     
-    print(f"--- Executing Tool: get_isin_from_csv ---")
-    print(f"   Symbol: {symbol}")
+    logger.debug("tool_invoked", tool="get_isin_from_csv", symbol=symbol)
     
     try:
-        # Check if file exists
-        if not os.path.exists(csv_path):
-            error_msg = f"CSV file not found at {csv_path}"
-            print(f"   Error: {error_msg}")
-            return {"error": error_msg}
-        
-        # Read the CSV file
-        symbol = symbol.upper()  # Convert to uppercase for case-insensitive comparison
-        
-        # First check the file format by examining the first few lines
-        with open(csv_path, 'r') as file:
-            first_lines = [file.readline().strip() for _ in range(5)]
-        
-        # Check if this is a semicolon or comma separated file
-        delimiter = ',' if ',' in first_lines[0] else ';'
-        
-        # Try to open and read the file with the correct delimiter
-        with open(csv_path, 'r') as file:
-            sample = file.read(4096)  # Read a sample to determine format
-            
-            # Reset file pointer
-            file.seek(0)
-            
-            # Try different delimiters if comma doesn't work
-            if delimiter == ',' and sample.count(',') < 5:
-                if sample.count(';') > 5:
-                    delimiter = ';'
-                elif sample.count('\t') > 5:
-                    delimiter = '\t'
-            
-            # Create reader with detected delimiter
-            csv_reader = csv.reader(file, delimiter=delimiter)
-            
-            # Try to read headers
-            headers = next(csv_reader)
-            print(f"   Using delimiter: '{delimiter}'")
-            print(f"   Headers found: {headers}")
-            
-            # Since we don't know the structure, let's try to find columns with 'SYMBOL' or 'ISIN' in them
-            symbol_idx = None
-            isin_idx = None
-            
-            # Try to find the symbol column
-            for i, col in enumerate(headers):
-                if symbol.upper() in col.upper():
-                    # If the symbol itself is in a header, this might be a column-name style CSV
-                    continue
-                    
-                if any(keyword in col.upper() for keyword in ['SYMBOL', 'NAME', 'TICKER']):
-                    symbol_idx = i
-                    print(f"   Found symbol column: {col} at index {i}")
-                    break
-            
-            # Try to find the ISIN column
-            for i, col in enumerate(headers):
-                if 'ISIN' in col.upper() or 'CODE' in col.upper():
-                    isin_idx = i
-                    print(f"   Found ISIN column: {col} at index {i}")
-                    break
-            
-            # If we couldn't find columns by name, try to determine by examining data
-            if symbol_idx is None or isin_idx is None:
-                print("   Trying to determine columns by data patterns...")
-                
-                # Read a few rows to analyze
-                rows = [next(csv_reader) for _ in range(10) if csv_reader]
-                
-                # Look for columns that match ISIN pattern (12 alphanumeric chars)
-                for i, col in enumerate(headers):
-                    # Check if column values match ISIN pattern
-                    isin_pattern = all(len(row[i]) == 12 and row[i].isalnum() for row in rows if i < len(row))
-                    if isin_pattern:
-                        isin_idx = i
-                        print(f"   Found likely ISIN column at index {i}")
-                        break
-                
-                # Look for columns that might be symbols (typically shorter, all caps)
-                if symbol_idx is None:
-                    for i, col in enumerate(headers):
-                        # Skip ISIN column if already found
-                        if i == isin_idx:
-                            continue
-                        # Check if column values look like symbols
-                        symbol_pattern = all(len(row[i]) < 20 and not row[i].isdigit() for row in rows if i < len(row))
-                        if symbol_pattern:
-                            symbol_idx = i
-                            print(f"   Found likely symbol column at index {i}")
-                            break
-            
-            # If still not found, print detailed debug info
-            if symbol_idx is None or isin_idx is None:
-                print("   Could not identify columns automatically. File contents sample:")
-                file.seek(0)
-                for i, line in enumerate(file):
-                    if i < 5:  # Print first 5 lines
-                        print(f"   Line {i}: {line.strip()}")
-                
-                error_msg = "CSV file format is not valid, couldn't identify symbol and ISIN columns"
-                print(f"   Error: {error_msg}")
-                return {"error": error_msg}
-            
-            # Reset file pointer to search for the symbol
-            file.seek(0)
-            next(csv_reader)  # Skip header row
-            
-            # Search for the symbol
-            for row in csv_reader:
-                if len(row) > max(symbol_idx, isin_idx):
-                    csv_symbol = row[symbol_idx].strip().upper()
-                    if csv_symbol == symbol:
-                        isin = row[isin_idx]
-                        print(f"   Result: Found ISIN {isin} for symbol {symbol}")
-                        return {"isin": isin, "symbol": symbol, "nse_format": f"NSE_EQ|{isin}"}
-            
-            # Symbol not found
-            error_msg = f"Symbol '{symbol}' not found in CSV file"
-            print(f"   Result: {error_msg}")
-            return {"error": error_msg}
-            
+        # Parsed once, then served from memory / the on-disk snapshot
+        index = instruments.get_index(csv_path)
+    except FileNotFoundError:
+        error_msg = f"CSV file not found at {csv_path}"
+        logger.warning("tool_failed", tool="get_isin_from_csv", error=error_msg)
+        return {"error": error_msg}
+    except instruments.CsvFormatError as e:
+        logger.warning("tool_failed", tool="get_isin_from_csv", error=str(e), path=csv_path)
+        return {"error": str(e)}
     except Exception as e:
         error_msg = f"Error reading CSV file: {str(e)}"
-        print(f"   Error: {error_msg}")
+        logger.warning("tool_failed", tool="get_isin_from_csv", error=error_msg)
         return {"error": error_msg}
 
+    result = index.lookup(symbol)
+    if result:
+        logger.debug("isin_found", symbol=result["symbol"], isin=result["isin"])
+        return result
+
+    # Symbol not found
+    error_msg = f"Symbol '{symbol.upper()}' not found in CSV file"
+    logger.debug("isin_not_found", symbol=symbol)
+    return {"error": error_msg}
+
+def _backtest_params(fast, slow, period, lower, upper, lookback, exit_lookback):
+    return {"fast": fast, "slow": slow, "period": period, "lower": lower, "upper": upper,
+            "lookback": lookback, "exit_lookback": exit_lookback}
+
+def _pct(value):
+    return value / 100.0 if value else None
+
+def run_backtest_wrapper(symbol: str, strategy: str, fast: int = None, slow: int = None,
+                         period: int = None, lower: float = None, upper: float = None,
+                         lookback: int = None, exit_lookback: int = None, days: int = 365,
+                         stop_loss_pct: float = None, take_profit_pct: float = None):
+    """
+    Backtests a strategy on daily candles for an NSE stock.
+    Input:
+       - symbol: NSE stock symbol (format: NSE_EQ|<isin_code>)
+       - strategy: sma_crossover, ema_crossover, rsi_threshold or breakout
+       - strategy parameters (only those relevant to the strategy; defaults otherwise)
+       - stop_loss_pct / take_profit_pct: optional exits in percent of the entry price
+    Returns: Compact performance metrics.
+    """
+    logger.debug("tool_invoked", tool="run_backtest", symbol=symbol, strategy=strategy)
+    params = _backtest_params(fast, slow, period, lower, upper, lookback, exit_lookback)
+    params = {k: v for k, v in params.items() if k in backtest.STRATEGIES.get(strategy, {}).get("defaults", params)}
+    return backtest.run_backtest(symbol, strategy, params, days=days,
+                                 stop_loss=_pct(stop_loss_pct), take_profit=_pct(take_profit_pct))
+
+def optimize_backtest_wrapper(symbol: str, strategy: str, days: int = 365,
+                              stop_loss_pct: float = None, take_profit_pct: float = None,
+                              rank_by: str = "sharpe"):
+    """
+    Sweeps a strategy's default parameter grid and returns the best settings.
+    Input:
+       - symbol: NSE stock symbol (format: NSE_EQ|<isin_code>)
+       - strategy: sma_crossover, ema_crossover, rsi_threshold or breakout
+       - rank_by: metric to rank by (sharpe, total_return_pct, max_drawdown_pct, win_rate_pct)
+    Returns: The top parameter sets with their metrics.
+    """
+    logger.debug("tool_invoked", tool="optimize_backtest", symbol=symbol, strategy=strategy)
+    return backtest.sweep(symbol, strategy, days=days, stop_loss=_pct(stop_loss_pct),
+                          take_profit=_pct(take_profit_pct), rank_by=rank_by, top=3)
+
+def screen_stocks_wrapper(filter: str, sort_by: str = "change_pct", ascending: bool = False, limit: int = 20):
+    """
+    Screens every NSE equity in the local instrument list with one filter expression.
+    Input:
+       - filter: condition over screener columns, e.g. "change_pct > 5 and volume_ratio > 1"
+       - sort_by / ascending: ranking column and direction (default: biggest gainers first)
+       - limit: number of results (max 100)
+    Returns: Universe size, match count and the top matches.
+    """
+    logger.debug("tool_invoked", tool="screen_stocks", filter=filter, sort_by=sort_by)
+    return screener.screen(filter, BHAVCOPY_CSV_PATH, sort_by=sort_by, ascending=ascending, limit=limit)
+
+def create_price_alert_wrapper(symbol: str, price: float, direction: str = None,
+                               stock_name: str = None, note: str = None):
+    """
+    Creates a standing price alert that fires when the stock crosses a price.
+    Input:
+       - symbol: NSE stock symbol (format: NSE_EQ|<isin_code>)
+       - price: Threshold price
+       - direction: "above" or "below"; inferred from the current price when omitted
+         (required when the threshold equals the current price)
+    Returns: The created alert.
+    """
+    logger.debug("tool_invoked", tool="create_price_alert", symbol=symbol, price=price, direction=direction)
+    if direction is None:
+        current = market_data.get_current_price(symbol)
+        if isinstance(current, dict):
+            return current
+        if price == current:
+            return {"error": f"{price} is the current price; pass direction 'above' or 'below'"}
+        direction = "above" if price > current else "below"
+    engine = alerts.get_engine()
+    try:
+        alert = engine.add(symbol, price, direction, symbol=stock_name, note=note)
+    except ValueError as e:
+        return {"error": str(e)}
+    engine.start()
+    return alert
+
+def list_price_alerts_wrapper(status: str = "active"):
+    """
+    Lists price alerts.
+    Input:
+       - status: active, triggered, cancelled or all (default active)
+    Returns: Matching alerts, newest first.
+    """
+    logger.debug("tool_invoked", tool="list_price_alerts", status=status)
+    return {"alerts": alerts.get_engine().list(status)}
+
+def cancel_price_alert_wrapper(alert_id: str):
+    """
+    Cancels an active price alert.
+    Input:
+       - alert_id: Id returned when the alert was created
+    Returns: The cancelled alert.
+    """
+    logger.debug("tool_invoked", tool="cancel_price_alert", alert_id=alert_id)
+    alert = alerts.get_engine().cancel(alert_id)
+    if alert is None:
+        return {"error": f"No active alert with id '{alert_id}'"}
+    return alert
+
+# Longest a single tool call may block waiting for a fill
+MAX_ORDER_WAIT_SECONDS = 30
+
+def get_order_status_wrapper(order_id: str = None, wait_seconds: float = 0):
+    """
+    Reports order status and fills from the live order book.
+    Input:
+       - order_id: Order id returned when the order was placed; omit to list today's orders
+       - wait_seconds: Wait up to this long (max 30) for the order to complete, reject or cancel
+    Returns: The order (status, filled quantity, average price, status history) or the order list.
+    """
+    logger.debug("tool_invoked", tool="get_order_status", order_id=order_id, wait_seconds=wait_seconds)
+    book = orders.get_book()
+    if not order_id:
+        return {"orders": book.list(limit=20)}
+    order = book.get(order_id)
+    if order is None:
+        # Placed before the order stream was connected
+        order = orders.fetch_order(order_id)
+        if "error" in order:
+            return order
+    if wait_seconds and order["status"] not in orders.TERMINAL:
+        order = book.wait_for_fill(order_id, timeout=min(float(wait_seconds), MAX_ORDER_WAIT_SECONDS)) or order
+    return order
+
+def get_portfolio_risk_wrapper(confidence: float = 95):
+    """
+    Computes risk analytics for the whole portfolio from daily history.
+    Input:
+       - confidence: VaR confidence level in percent (e.g. 95 or 99)
+    Returns: Volatility, historical VaR and expected shortfall, drawdown, beta, correlations and concentration.
+    """
+    logger.debug("tool_invoked", tool="get_portfolio_risk", confidence=confidence)
+    confidence = float(confidence)
+    return analytics.portfolio_risk(confidence=confidence / 100 if confidence > 1 else confidence)
+
 # --- Gemini Configuration and Interaction ---
 
 def load_gemini_api_key():
@@ -294,12 +383,10 @@ def load_gemini_api_key():
             config = json.load(f)
         api_key = config.get("gemini_api_key")
         if not api_key:
-            print("Warning: gemini_api_key not found in config.json. "
-                  "Ensure GOOGLE_API_KEY environment variable is set.")
+            logger.warning("gemini_api_key_missing", hint="Ensure GOOGLE_API_KEY environment variable is set.")
         return api_key
     except FileNotFoundError:
-        print(f"Info: Config file not found at {config_path}. "
-              "Ensure GOOGLE_API_KEY environment variable is set.")
+        logger.info("config_not_found", path=config_path, hint="Ensure GOOGLE_API_KEY environment variable is set.")
         return None
     except json.JSONDecodeError:
         raise ValueError(f"Error decoding JSON from {config_path}")
@@ -311,31 +398,51 @@ def setup_environment_api_key():
     api_key = load_gemini_api_key()
     if not os.getenv('GOOGLE_API_KEY'):
         if api_key:
-            print("Info: Setting GOOGLE_API_KEY environment variable from config file.")
+            logger.debug("gemini_api_key_from_config")
             os.environ['GOOGLE_API_KEY'] = api_key
         else:
             raise ValueError("Gemini API Key configuration error: "
                              "Set the GOOGLE_API_KEY environment variable or "
                              "provide 'gemini_api_key' in config/config.json.")
-    print("Gemini client configured (using GOOGLE_API_KEY environment variable).")
+    logger.debug("gemini_configured")
+
 
+_client = None
 
-# Define the function declarations
+def get_gemini_client():
+    """Returns the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        setup_environment_api_key()
+        _client = genai.Client()
+    return _client
+
+def set_gemini_client(client):
+    """Replaces the shared Gemini client (e.g. with one using a custom transport)."""
+    global _client
+    _client = client
+    # Context caches belong to the previous client's project
+    _prompt_caches.clear()
+
+
+# Define the function declarations (plain data; turned into a Tool on first use)
 function_declarations = [
-    FunctionDeclaration(
+    dict(
         name="get_market_data",
         description="Retrieves historical market data for a given NSE stock symbol.",
         parameters={
             "type": "object",
             "properties": {
                 'symbol': {"type": "string", "description": "NSE stock symbol (format: NSE_EQ|<isin_code>)"},
-                'days': {"type": "integer", "description": "Number of days of historical data (default 30)"}
+                'days': {"type": "integer", "description": "Number of days of historical data (default 30; at most 30 for intraday intervals)"},
+                'interval': {"type": "string", "enum": ["1m", "5m", "15m", "30m", "1h", "1d", "1w", "1mo"],
+                             "description": "Bar size (default 1d). Switching interval for the same stock and days is free."}
             },
             "required": ['symbol']
         }
     ),
     # ... (other function declarations remain the same) ...
-    FunctionDeclaration(
+    dict(
         name="place_buy_order",
         description="Places a buy order for a specified quantity of an NSE stock.",
         parameters={
@@ -347,7 +454,7 @@ function_declarations = [
             "required": ['symbol', 'quantity']
         }
     ),
-    FunctionDeclaration(
+    dict(
         name="place_sell_order",
         description="Places a sell order for a specified quantity of an NSE stock.",
         parameters={
@@ -359,12 +466,12 @@ function_declarations = [
             "required": ['symbol', 'quantity']
         }
     ),
-    FunctionDeclaration(
+    dict(
         name="get_portfolio",
         description="Retrieves the current user's portfolio holdings.",
         parameters={"type": "object", "properties": {}}
     ),
-    FunctionDeclaration(
+    dict(
         name="get_current_price",
         description="Retrieves the current market price for a given NSE stock symbol.",
         parameters={
@@ -375,7 +482,7 @@ function_declarations = [
             "required": ['symbol']
         }
     ),
-    FunctionDeclaration(
+    dict(
         name= "get_isin_for_symbol",
         description= "Retrieves the International Securities Identification Number (ISIN) for a given stock ticker symbol using the Financial Modeling Prep (FMP) API. Can optionally filter by a specific stock exchange.",
         parameters= {
@@ -393,7 +500,7 @@ function_declarations = [
         "required": ['stock_symbol']
       }
     ),
-    FunctionDeclaration(
+    dict(
         name="get_isin_from_csv",
         description="Retrieves the ISIN code for a given NSE stock symbol from the local database.",
         parameters={
@@ -406,10 +513,155 @@ function_declarations = [
             },
             "required": ['symbol']
         }
+    ),
+    dict(
+        name="screen_stocks",
+        description="Scans all NSE equities at once with a filter expression over live quote data and returns the ranked matches. Use this instead of looking up prices one stock at a time when the user asks which stocks meet a condition.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'filter': {"type": "string", "description": (
+                    "Condition using comparisons combined with and/or/not, e.g. 'change_pct > 5 and volume > avg_volume_20d'. Columns: "
+                    + "; ".join(f"{name} ({desc})" for name, desc in {**screener.QUOTE_COLUMNS, **screener.HISTORY_COLUMNS}.items())
+                    + "; symbol (text, e.g. symbol == 'INFY').")},
+                'sort_by': {"type": "string", "description": "Column to rank by (default change_pct)"},
+                'ascending': {"type": "boolean", "description": "Rank smallest first (default false, i.e. largest first)"},
+                'limit': {"type": "integer", "description": "Number of results to return (default 20, max 100)"}
+            },
+            "required": ['filter']
+        }
+    ),
+    dict(
+        name="create_price_alert",
+        description="Creates a standing alert that notifies the user when an NSE stock's price crosses a threshold. Alerts are checked in the background and survive restarts.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'symbol': {"type": "string", "description": "NSE stock symbol (format: NSE_EQ|<isin_code>)"},
+                'price': {"type": "number", "description": "Threshold price"},
+                'direction': {"type": "string", "enum": ["above", "below"],
+                              "description": "Fire when the price rises to/above or falls to/below the threshold. Omit to infer from the current price; required when the threshold equals it."},
+                'stock_name': {"type": "string", "description": "Ticker to show in notifications (e.g. 'INFY')"},
+                'note': {"type": "string", "description": "Optional reminder text"}
+            },
+            "required": ['symbol', 'price']
+        }
+    ),
+    dict(
+        name="list_price_alerts",
+        description="Lists the user's price alerts.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'status': {"type": "string", "enum": ["active", "triggered", "cancelled", "all"],
+                           "description": "Which alerts to list (default active)"}
+            }
+        }
+    ),
+    dict(
+        name="cancel_price_alert",
+        description="Cancels an active price alert by its id.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'alert_id': {"type": "string", "description": "Alert id from create_price_alert or list_price_alerts"}
+            },
+            "required": ['alert_id']
+        }
+    ),
+    dict(
+        name="get_order_status",
+        description="Returns the live status of an order placed earlier (open, complete, rejected, cancelled), its filled quantity, average fill price and status history, or lists today's orders when no order id is given.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'order_id': {"type": "string", "description": "Order id returned by place_buy_order/place_sell_order"},
+                'wait_seconds': {"type": "number", "description": "Wait up to this many seconds (max 30) for the order to finish before answering"}
+            }
+        }
+    ),
+    dict(
+        name="get_portfolio_risk",
+        description="Analyses the risk of the user's whole portfolio from a year of daily history: annualized volatility (portfolio and per holding), each holding's share of portfolio risk, 1-day historical Value at Risk and expected shortfall, max and current drawdown, beta to the Nifty 50, correlations between holdings and concentration (largest weight, effective number of holdings).",
+        parameters={
+            "type": "object",
+            "properties": {
+                'confidence': {"type": "number", "description": "VaR confidence level in percent, e.g. 95 (default) or 99"}
+            }
+        }
+    ),
+    dict(
+        name="run_backtest",
+        description="Backtests a long-only trading strategy on historical daily candles of an NSE stock and returns performance metrics (return, CAGR, Sharpe, max drawdown, trades, win rate, fees, buy-and-hold comparison).",
+        parameters={
+            "type": "object",
+            "properties": {
+                'symbol': {"type": "string", "description": "NSE stock symbol (format: NSE_EQ|<isin_code>)"},
+                'strategy': {"type": "string", "enum": list(backtest.STRATEGIES),
+                             "description": "sma_crossover/ema_crossover use fast and slow; rsi_threshold uses period, lower and upper; breakout uses lookback and exit_lookback"},
+                'fast': {"type": "integer", "description": "Fast moving-average period"},
+                'slow': {"type": "integer", "description": "Slow moving-average period"},
+                'period': {"type": "integer", "description": "RSI period"},
+                'lower': {"type": "number", "description": "RSI level to buy below"},
+                'upper': {"type": "number", "description": "RSI level to sell above"},
+                'lookback': {"type": "integer", "description": "Breakout: buy on a close above the high of this many bars"},
+                'exit_lookback': {"type": "integer", "description": "Breakout: sell on a close below the low of this many bars"},
+                'days': {"type": "integer", "description": "Days of history to test (default 365, at most 365)"},
+                'stop_loss_pct': {"type": "number", "description": "Optional stop loss in percent below entry"},
+                'take_profit_pct': {"type": "number", "description": "Optional take profit in percent above entry"}
+            },
+            "required": ['symbol', 'strategy']
+        }
+    ),
+    dict(
+        name="optimize_backtest",
+        description="Tries a grid of parameter settings for a trading strategy on an NSE stock and returns the best-performing settings with their metrics.",
+        parameters={
+            "type": "object",
+            "properties": {
+                'symbol': {"type": "string", "description": "NSE stock symbol (format: NSE_EQ|<isin_code>)"},
+                'strategy': {"type": "string", "enum": list(backtest.STRATEGIES)},
+                'days': {"type": "integer", "description": "Days of history to test (default 365, at most 365)"},
+                'stop_loss_pct': {"type": "number", "description": "Optional stop loss in percent below entry"},
+                'take_profit_pct': {"type": "number", "description": "Optional take profit in percent above entry"},
+                'rank_by': {"type": "string", "enum": ["sharpe", "total_return_pct", "max_drawdown_pct", "win_rate_pct"],
+                            "description": "Metric to rank settings by (default sharpe)"}
+            },
+            "required": ['symbol', 'strategy']
+        }
     )
 
 ]
 
+_tools = {}
+
+def get_tools(names=None):
+    """
+    Builds the Gemini Tool list for the declarations in `names` (all when None),
+    once per distinct subset.
+    """
+    key = None if names is None else frozenset(names)
+    tools = _tools.get(key)
+    if tools is None:
+        declarations = [d for d in function_declarations if key is None or d["name"] in key]
+        tools = [types.Tool(function_declarations=declarations)]
+        _tools[key] = tools
+    return tools
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+_declaration_tokens = {}
+
+def prefix_tokens(names=None):
+    """Estimated tokens of the system prompt plus the declarations in `names` (all when None)."""
+    if not _declaration_tokens:
+        for d in function_declarations:
+            _declaration_tokens[d["name"]] = estimate_tokens(json.dumps(d))
+    selected = _declaration_tokens if names is None else [n for n in names if n in _declaration_tokens]
+    return estimate_tokens(system_prompt_text) + sum(_declaration_tokens[n] for n in selected)
+
 # Map function names to actual Python functions
 available_functions = {
     "get_market_data": get_market_data_wrapper,
@@ -418,7 +670,15 @@ available_functions = {
     "get_portfolio": get_portfolio_wrapper,
     "get_current_price": get_current_price_wrapper,
     "get_isin_for_symbol":get_isin_for_symbol_wrapper,
-    "get_isin_from_csv": get_isin_from_csv_wrapper
+    "get_isin_from_csv": get_isin_from_csv_wrapper,
+    "screen_stocks": screen_stocks_wrapper,
+    "create_price_alert": create_price_alert_wrapper,
+    "list_price_alerts": list_price_alerts_wrapper,
+    "cancel_price_alert": cancel_price_alert_wrapper,
+    "get_order_status": get_order_status_wrapper,
+    "get_portfolio_risk": get_portfolio_risk_wrapper,
+    "run_backtest": run_backtest_wrapper,
+    "optimize_backtest": optimize_backtest_wrapper
 }
 
 # System prompt (can be included in the 'contents' or potentially a separate param if supported)
@@ -431,46 +691,173 @@ Before calling any function that requires a stock symbol, you MUST find the accu
  get_isin_from_csv - Look up symbol in local database (faster, NSE symbols only), VERY IMPORTANT:search for the exact symbol given by the user ONLY
 Example: If the user asks about Reliance and csv search reveals ISIN INE002A01018, use "NSE_EQ|INE002A01018" in function calls.
 
-Use the available functions to fulfill user requests for market data, trading, portfolio information, and current prices. Always use the correct NSE_EQ|<isin_code> format for symbols.
+Use the available functions to fulfill user requests for market data, trading, portfolio information, current prices, price alerts, stock screening and strategy backtests. Stock screens cover all NSE equities and need no ISIN lookup. Always use the correct NSE_EQ|<isin_code> format for symbols.
 
 After executing a function, present the result clearly to the user, along with any relevant analysis or confirmation. If search fails to find an ISIN, inform the user.
 """
 
-def trading_assistant(user_input):
-    """Process user input using client.models.generate_content."""
-    setup_environment_api_key()
-    client = genai.Client()
+# --- Context caching ---
+# The static prefix (system prompt + declarations) is registered with Gemini's
+# context cache and referenced by name instead of being re-sent. Explicit caches
+# have a minimum size, so small tool subsets are sent inline.
+CONTEXT_CACHE_MIN_TOKENS = 1024
+CONTEXT_CACHE_TTL = 3600
+
+_prompt_caches = {}  # (model, tool subset) -> (cache name, expires at) or False if unavailable
+_prompt_cache_lock = threading.Lock()
+
+def get_prompt_cache(client, model_id, names, tools):
+    """Returns the context-cache name for this prefix, creating it if needed, or None."""
+    if os.environ.get("TRADEGPT_CONTEXT_CACHE", "1") == "0":
+        return None
+    key = (model_id, None if names is None else frozenset(names))
+    entry = _prompt_caches.get(key)
+    if entry is False:
+        return None
+    if entry and entry[1] > time.time() + 60:
+        return entry[0]
+    with _prompt_cache_lock:
+        entry = _prompt_caches.get(key)
+        if entry is False:
+            return None
+        if entry and entry[1] > time.time() + 60:
+            return entry[0]
+        if prefix_tokens(names) < CONTEXT_CACHE_MIN_TOKENS:
+            _prompt_caches[key] = False
+            return None
+        try:
+            cached = client.caches.create(
+                model=model_id,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt_text,
+                    tools=tools,
+                    ttl=f"{CONTEXT_CACHE_TTL}s",
+                    display_name="tradegpt-prefix",
+                )
+            )
+        except Exception as e:
+            # Not supported for this model/key, or the prefix is too small
+            logger.info("context_cache_unavailable", model=model_id, error=str(e))
+            _prompt_caches[key] = False
+            return None
+        _prompt_caches[key] = (cached.name, time.time() + CONTEXT_CACHE_TTL)
+        logger.info("context_cache_created", model=model_id, name=cached.name, tools=len(tools[0].function_declarations))
+        return cached.name
+
+def drop_prompt_cache(model_id, names):
+    """Forgets a cache entry (e.g. after Gemini reported it missing or expired)."""
+    _prompt_caches.pop((model_id, None if names is None else frozenset(names)), None)
+
+def _generate(client, model_id, conversation, names, tools):
+    cache_name = get_prompt_cache(client, model_id, names, tools)
+    if cache_name:
+        try:
+            return client.models.generate_content(
+                model=model_id,
+                contents=conversation,
+                config=types.GenerateContentConfig(cached_content=cache_name)
+            )
+        except genai_errors.ClientError as e:
+            if not _is_cache_error(e):
+                raise
+            # Expired or deleted cache: rebuild it on the next call, answer this one inline
+            logger.warning("context_cache_failed", name=cache_name, error=str(e))
+            drop_prompt_cache(model_id, names)
+    return client.models.generate_content(
+        model=model_id,
+        contents=conversation,
+        config=types.GenerateContentConfig(
+            tools=tools,
+            system_instruction=system_prompt_text
+        )
+    )
+
+def _is_cache_error(error):
+    """True for the 4xx Gemini returns when `cached_content` is missing or expired."""
+    if error.code == 404:
+        return True
+    return error.code in (400, 403) and "cache" in str(error).lower()
+
+def _record_token_usage(response, model_id, stats=None):
+    """Records prompt/response/cached token counts reported by Gemini."""
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return
+    prompt_tokens = usage.prompt_token_count or 0
+    response_tokens = usage.candidates_token_count or 0
+    cached_tokens = getattr(usage, 'cached_content_token_count', None) or 0
+    metrics.inc("gemini_prompt_tokens_total", prompt_tokens, model=model_id)
+    metrics.inc("gemini_response_tokens_total", response_tokens, model=model_id)
+    metrics.observe("gemini_prompt_tokens", prompt_tokens, buckets=metrics.TOKEN_BUCKETS, model=model_id)
+    metrics.observe("gemini_response_tokens", response_tokens, buckets=metrics.TOKEN_BUCKETS, model=model_id)
+    if cached_tokens:
+        metrics.inc("gemini_cached_tokens_total", cached_tokens, model=model_id)
+    if stats is not None:
+        stats["prompt_tokens"] += prompt_tokens
+        stats["response_tokens"] += response_tokens
+        stats["cached_tokens"] += cached_tokens
+
+def _finish_stats(stats, model_id, names):
+    """Adds the estimated saving from tool subsetting and records it."""
+    # Cached tokens are still sent and billed (at the cached rate); they stay in stats["cached_tokens"]
+    trimmed = (prefix_tokens() - prefix_tokens(names)) * stats["calls"]
+    stats["saved_tokens"] = trimmed
+    metrics.inc("gemini_prompt_tokens_saved_total", trimmed, model=model_id, source="tool_subset")
+    logger.debug("token_stats", **stats)
+
+@metrics.timed("assistant_request_seconds")
+def trading_assistant(user_input, stats=None, read_only=False, tool_cache=None):
+    """
+    Process user input using client.models.generate_content.
+    If `stats` is a dict it is filled with per-request token accounting:
+    calls, prompt/response/cached tokens, intents, tools sent and saved_tokens
+    (the estimated size of the declarations not sent; cached tokens are still
+    billed, so they are only reported as cached_tokens).
+    With `read_only`, order and alert tools are neither offered nor run.
+    `tool_cache` (e.g. a batch.ToolCallCache) shares read-only tool results
+    between requests.
+    """
+    client = get_gemini_client()
     model_id = "gemini-2.5-flash-preview-04-17"
 
-    # Tool Configuration
-    function_tool = Tool(function_declarations=function_declarations)
-    all_tools = [function_tool]
+    # Tool Configuration: only the declarations the request's intent needs
+    found_intents, tool_names = intents.select_tools(
+        user_input, read_only=read_only, all_names=[d["name"] for d in function_declarations])
+    all_tools = get_tools(tool_names)
+    if stats is None:
+        stats = {}
+    stats.update(calls=0, prompt_tokens=0, response_tokens=0, cached_tokens=0,
+                 intents=sorted(found_intents), tools=len(all_tools[0].function_declarations))
 
-    print(f"\nUser Input: {user_input}")
+    logger.debug("user_input", chars=len(user_input), text=lambda: user_input[:200])
+    try:
+        return _run_conversation(client, model_id, user_input, tool_names, all_tools, stats,
+                                 blocked=intents.WRITE_TOOLS if read_only else (), tool_cache=tool_cache)
+    finally:
+        _finish_stats(stats, model_id, tool_names)
 
+def _run_conversation(client, model_id, user_input, tool_names, all_tools, stats, blocked=(), tool_cache=None):
+    """Runs the function-calling loop for one request; tools in `blocked` are refused."""
     # Initialize conversation history
     conversation = [
         {"role": "user", "parts": [{"text": user_input}]}
     ]
 
+    response = None
     while True:
         try:
-            response = client.models.generate_content(
-                model=model_id,
-                contents=conversation,
-                config=GenerateContentConfig(
-                    tools=all_tools,
-                    system_instruction=system_prompt_text
-                )
-            )
+            with metrics.timer("gemini_request_seconds", model=model_id):
+                response = _generate(client, model_id, conversation, tool_names, all_tools)
+            stats["calls"] += 1
+            _record_token_usage(response, model_id, stats)
 
             if not response or not response.candidates:
-                print("Error: Empty response from Gemini")
+                logger.warning("gemini_empty_response")
                 return "I apologize, but I received an empty response. Please try again."
 
             candidate = response.candidates[0]
             if not candidate.content or not candidate.content.parts:
-                print("Error: Empty content/parts in response")
+                logger.warning("gemini_empty_parts")
                 return "I apologize, but I received an invalid response. Please try again."
 
             first_part = candidate.content.parts[0]
@@ -481,11 +868,11 @@ def trading_assistant(user_input):
                 function_call = first_part.function_call
                 function_name = function_call.name
                 args = function_call.args
-                print(f"Gemini requested function call: {function_name}({dict(args)})")
+                logger.info("function_call", tool=function_name, args=lambda: dict(args))
 
-                if function_name not in available_functions:
+                if function_name not in available_functions or function_name in blocked:
                     error_msg = f"Function '{function_name}' is not available"
-                    print(f"Error: {error_msg}")
+                    logger.warning("tool_blocked" if function_name in blocked else "unknown_function", tool=function_name)
                     conversation.append({
                         "role": "function",
                         "parts": [{
@@ -498,7 +885,14 @@ def trading_assistant(user_input):
                     continue
 
                 try:
-                    function_response_data = available_functions[function_name](**dict(args))
+                    with metrics.timer("tool_call_seconds", tool=function_name):
+                        if tool_cache is not None and function_name not in intents.WRITE_TOOLS:
+                            function_response_data = tool_cache.call(
+                                function_name, dict(args), available_functions[function_name])
+                        else:
+                            function_response_data = available_functions[function_name](**dict(args))
+                    if isinstance(function_response_data, dict) and "error" in function_response_data:
+                        metrics.inc("tool_call_errors_total", tool=function_name)
                     conversation.append({
                         "role": "function",
                         "parts": [{
@@ -508,10 +902,10 @@ def trading_assistant(user_input):
                             }
                         }]
                     })
-                    print(f"Function {function_name} executed successfully")
+                    logger.debug("function_done", tool=function_name)
                 except Exception as e:
                     error_msg = f"Error executing {function_name}: {str(e)}"
-                    print(f"Error: {error_msg}")
+                    logger.error("function_failed", tool=function_name, exc_info=True)
                     conversation.append({
                         "role": "function",
                         "parts": [{
@@ -530,14 +924,13 @@ def trading_assistant(user_input):
                     final_text += part.text
 
             if not final_text.strip():
-                print("Warning: Empty text response")
+                logger.warning("gemini_empty_text")
                 return "I apologize, but I couldn't generate a proper response. Please try again."
 
-            print(f"Gemini Final Response: {final_text}")
+            logger.debug("final_response", chars=len(final_text), text=lambda: final_text)
             return final_text
 
         except Exception as e:
             error_msg = f"Error processing response: {str(e)}"
-            print(error_msg)
-            print(f"Raw response: {response}")
+            logger.error("response_processing_failed", exc_info=True, raw_response=lambda: response)
             return f"I encountered an error while processing your request: {error_msg}"
\ No newline at end of file
@@ -0,0 +1,177 @@
+# src/instruments.py
+"""
+Symbol -> ISIN index over the local NSE bhavcopy CSV.
+
+The CSV is parsed once and the result is snapshotted (pickle) under the
+cache directory, keyed by the CSV's path, size and mtime. Later processes
+load the snapshot instead of re-parsing, and every lookup is a dict hit.
+"""
+import csv
+import hashlib
+import os
+import pickle
+import threading
+
+from . import log, metrics, paths
+
+logger = log.get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class CsvFormatError(ValueError):
+    """The CSV has no recognisable symbol and ISIN columns."""
+
+
+class InstrumentIndex:
+    """Parsed bhavcopy rows with a symbol lookup table."""
+
+    def __init__(self, headers, rows, symbol_idx, isin_idx):
+        self.headers = headers
+        self.rows = rows
+        self.symbol_idx = symbol_idx
+        self.isin_idx = isin_idx
+        self.by_symbol = {}
+        for i, row in enumerate(rows):
+            # First row wins, as with a top-to-bottom scan
+            self.by_symbol.setdefault(row[symbol_idx].strip().upper(), i)
+
+    def lookup(self, symbol):
+        """Returns {'isin', 'symbol', 'nse_format'} or None."""
+        i = self.by_symbol.get(symbol.strip().upper())
+        if i is None:
+            return None
+        isin = self.rows[i][self.isin_idx]
+        return {"isin": isin, "symbol": symbol.strip().upper(), "nse_format": f"NSE_EQ|{isin}"}
+
+    def records(self):
+        """Yields every row as a dict keyed by the CSV headers."""
+        for row in self.rows:
+            yield dict(zip(self.headers, row))
+
+    def __len__(self):
+        return len(self.by_symbol)
+
+
+def _detect_delimiter(path):
+    with open(path, 'r') as file:
+        first_line = file.readline()
+        file.seek(0)
+        sample = file.read(4096)
+    delimiter = ',' if ',' in first_line else ';'
+    # Try different delimiters if comma doesn't work
+    if delimiter == ',' and sample.count(',') < 5:
+        if sample.count(';') > 5:
+            delimiter = ';'
+        elif sample.count('\t') > 5:
+            delimiter = '\t'
+    return delimiter
+
+
+def _detect_columns(headers, rows):
+    """Finds the symbol and ISIN columns by header name, then by data patterns."""
+    symbol_idx = None
+    isin_idx = None
+    for i, col in enumerate(headers):
+        if any(keyword in col.upper() for keyword in ['SYMBOL', 'NAME', 'TICKER']):
+            symbol_idx = i
+            break
+    for i, col in enumerate(headers):
+        if 'ISIN' in col.upper() or 'CODE' in col.upper():
+            isin_idx = i
+            break
+
+    sample = rows[:10]
+    if isin_idx is None:
+        # ISINs are 12 alphanumeric characters
+        for i in range(len(headers)):
+            if sample and all(len(row[i]) == 12 and row[i].isalnum() for row in sample if i < len(row)):
+                isin_idx = i
+                break
+    if symbol_idx is None:
+        # Symbols are short and not purely numeric
+        for i in range(len(headers)):
+            if i == isin_idx:
+                continue
+            if sample and all(len(row[i]) < 20 and not row[i].isdigit() for row in sample if i < len(row)):
+                symbol_idx = i
+                break
+    if symbol_idx is None or isin_idx is None:
+        raise CsvFormatError("CSV file format is not valid, couldn't identify symbol and ISIN columns")
+    return symbol_idx, isin_idx
+
+
+def parse_csv(path):
+    """Parses a bhavcopy-style CSV into an InstrumentIndex."""
+    delimiter = _detect_delimiter(path)
+    with open(path, 'r', newline='') as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        headers = [h.strip() for h in next(reader)]
+        rows = [row for row in reader if row]
+    symbol_idx, isin_idx = _detect_columns(headers, rows)
+    width = max(symbol_idx, isin_idx)
+    rows = [row for row in rows if len(row) > width]
+    logger.debug("csv_parsed", path=path, rows=len(rows), delimiter=delimiter,
+                 symbol_column=headers[symbol_idx], isin_column=headers[isin_idx])
+    return InstrumentIndex(headers, rows, symbol_idx, isin_idx)
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _snapshot_path(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(paths.cache_dir("instruments"), f"{digest}.pickle")
+
+
+def _load_snapshot(path, stamp):
+    try:
+        with open(_snapshot_path(path), 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if data.get("version") != SNAPSHOT_VERSION or data.get("stamp") != stamp:
+        return None
+    return InstrumentIndex(data["headers"], data["rows"], data["symbol_idx"], data["isin_idx"])
+
+
+def _write_snapshot(path, stamp, index):
+    target = _snapshot_path(path)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    data = {"version": SNAPSHOT_VERSION, "stamp": stamp, "headers": index.headers,
+            "rows": index.rows, "symbol_idx": index.symbol_idx, "isin_idx": index.isin_idx}
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, target)
+    except OSError as e:
+        logger.warning("instrument_snapshot_failed", path=target, error=str(e))
+
+
+def get_index(path):
+    """
+    Returns the InstrumentIndex for `path`, from memory, the on-disk
+    snapshot or a fresh parse, in that order. Raises FileNotFoundError
+    or CsvFormatError.
+    """
+    stamp = _stamp(path)
+    cached = _indexes.get(stamp[0])
+    if cached is not None and cached[0] == stamp:
+        metrics.record_cache("instrument_index", True)
+        return cached[1]
+    with _lock:
+        cached = _indexes.get(stamp[0])
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        metrics.record_cache("instrument_index", False)
+        index = _load_snapshot(path, stamp)
+        if index is None:
+            index = parse_csv(path)
+            _write_snapshot(path, stamp, index)
+        _indexes[stamp[0]] = (stamp, index)
+        return index
@@ -0,0 +1,77 @@
+# src/intents.py
+"""
+Keyword intent classification used to pick which tool declarations are
+sent to Gemini with a request.
+
+Sending every declaration on every call costs prompt tokens on each turn of
+the function-calling loop; most questions need two or three tools. A request
+that matches no intent gets the full tool set, so an unusual phrasing costs
+tokens, not capability.
+"""
+import re
+
+# Tool names per intent
+INTENT_TOOLS = {
+    "portfolio": ["get_portfolio"],
+    "trade": ["place_buy_order", "place_sell_order", "get_portfolio", "get_current_price", "get_order_status"],
+    "orders": ["get_order_status"],
+    "price": ["get_current_price"],
+    "history": ["get_market_data"],
+    "screen": ["screen_stocks"],
+    "alerts": ["create_price_alert", "list_price_alerts", "cancel_price_alert", "get_current_price"],
+    "backtest": ["run_backtest", "optimize_backtest"],
+    "isin": ["get_isin_for_symbol"],
+    "risk": ["get_portfolio_risk", "get_portfolio"],
+}
+
+# Tools that change account state (orders, alerts); left out in read-only mode
+WRITE_TOOLS = frozenset({"place_buy_order", "place_sell_order", "create_price_alert", "cancel_price_alert"})
+
+# Intents whose tools take an NSE_EQ|<isin> symbol, and so need the ISIN lookup
+NEEDS_LOOKUP = {"trade", "price", "history", "alerts", "backtest", "isin"}
+LOOKUP_TOOLS = ["get_isin_from_csv"]
+
+# Every tool named above, in first-mention order; the fallback tool set
+ALL_TOOLS = list(dict.fromkeys(LOOKUP_TOOLS + [name for names in INTENT_TOOLS.values() for name in names]))
+
+_PATTERNS = {
+    "portfolio": r"portfolio|holding|position|my (?:stocks|shares|investments)|p&l|pnl|profit|loss|invested",
+    "trade": r"\bbuy\b|\bsell\b|purchase|\border|square off|\bexit\b|\bshort\b|\bacquire\b",
+    "price": r"price|quote|\bltp\b|trading at|worth|how much|\bcost\b|value of|current",
+    "history": r"histor|chart|candle|trend|last \d+ days|past \d+|performance|moving average|analy[sz]|intraday|hourly|weekly|\b\d+ ?(?:m|min|minute|h|hour)\b",
+    "orders": r"\border|\bfill(?:ed|s)?\b|executed|rejected|cancell?ed|pending",
+    "screen": r"screen|\bscan\b|which stocks|what stocks|stocks (?:that|with|where|above|below|up|down)|gainer|loser|mover|52[- ]?week|volume above|top \d+",
+    "alerts": r"alert|notify|tell me when|let me know when|remind|cross(?:es|ing)?\b",
+    "backtest": r"back-?test|strateg|crossover|\brsi\b|\bsma\b|\bema\b|breakout|optimi[sz]e|best (?:settings|parameters)",
+    "isin": r"\bisin\b|nasdaq|nyse|\blse\b|\bus stock|american",
+    "risk": r"\brisk|\bvar\b|value at risk|volatil|correlat|concentrat|diversif|drawdown|\bbeta\b|exposure",
+}
+_COMPILED = {intent: re.compile(pattern, re.IGNORECASE) for intent, pattern in _PATTERNS.items()}
+
+
+def classify(text):
+    """Returns the set of intents matched in `text` (empty if none)."""
+    return {intent for intent, pattern in _COMPILED.items() if pattern.search(text)}
+
+
+def select_tools(text, read_only=False, all_names=None):
+    """
+    Returns (intents, tool names) for `text`; tool names is None when no
+    intent matched and every tool should be sent. With `read_only`, write
+    tools are dropped and an unmatched request gets `all_names` (default
+    ALL_TOOLS) minus them.
+    """
+    found = classify(text)
+    if read_only:
+        _, names = select_tools(text)
+        if names is None:
+            names = ALL_TOOLS if all_names is None else all_names
+        return found, [name for name in names if name not in WRITE_TOOLS]
+    if not found:
+        return found, None
+    names = []
+    if found & NEEDS_LOOKUP:
+        names.extend(LOOKUP_TOOLS)
+    for intent in sorted(found):
+        names.extend(INTENT_TOOLS[intent])
+    return found, list(dict.fromkeys(names))
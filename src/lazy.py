@@ -0,0 +1,71 @@
+# src/lazy.py
+"""
+Deferred imports for heavy third-party packages.
+
+    pd = lazy.lazy_import("pandas")     # nothing imported yet
+    pd.DataFrame(...)                   # pandas is imported here, once
+
+google.genai, pandas, upstox_client and requests together take well over
+a second to import; short-lived commands that never touch them shouldn't
+pay for it. The first real import of each module is timed into the
+lazy_import_seconds histogram.
+"""
+import importlib
+import threading
+import time
+
+from . import metrics
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is first used."""
+    __slots__ = ("_name", "_module", "_lock")
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    metrics.observe("lazy_import_seconds", time.perf_counter() - start, module=self._name)
+                    self._module = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Returns a shared LazyModule for `name`."""
+    with _registry_lock:
+        module = _registry.get(name)
+        if module is None:
+            module = _registry[name] = LazyModule(name)
+        return module
+
+
+def preload(names=None):
+    """Imports the given (default: all registered) lazy modules now."""
+    for name in names or list(_registry):
+        lazy_import(name)._load()
+
+
+def preload_in_background(names=None):
+    """Warms lazy modules on a daemon thread, e.g. while a REPL waits for input."""
+    thread = threading.Thread(target=preload, args=(names,), name="lazy-preload", daemon=True)
+    thread.start()
+    return thread
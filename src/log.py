@@ -0,0 +1,183 @@
+# src/log.py
+"""
+Structured, level-gated logging for the trading assistant.
+
+    from . import log
+    logger = log.get_logger(__name__)
+    logger.debug("ltp_response", symbol=symbol, response=lambda: response.to_dict())
+
+- Events are a short name plus keyword fields. Nothing is evaluated or
+  formatted unless the level is enabled; callable field values are only
+  called once the event is known to be emitted.
+- Records go through a QueueHandler, so formatting and the write to
+  stderr happen on a background listener thread, not on the hot path.
+- Levels are configurable per module:
+      TRADEGPT_LOG_LEVEL=INFO                      (default for all of src.*)
+      TRADEGPT_LOG_LEVELS=src.market_data=DEBUG,src.gemini=WARNING
+      TRADEGPT_LOG_FORMAT=json                     (default: key=value text)
+- Repeated DEBUG events are sampled: the first TRADEGPT_LOG_DEBUG_BURST
+  occurrences of an event are emitted, then one in TRADEGPT_LOG_DEBUG_SAMPLE.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+ROOT_LOGGER_NAME = "src"
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+
+
+class _StructuredFormatter(logging.Formatter):
+    """Renders an event and its fields as key=value text or as JSON."""
+
+    def __init__(self, as_json=False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if self.as_json:
+            payload = {
+                "ts": round(record.created, 6),
+                "level": record.levelname,
+                "logger": record.name,
+                "event": record.getMessage(),
+            }
+            payload.update(fields)
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str)
+        parts = [
+            self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            record.levelname,
+            record.name,
+            record.getMessage(),
+        ]
+        parts.extend(f"{key}={_render(value)}" for key, value in fields.items())
+        line = " ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def _render(value):
+    text = value if isinstance(value, str) else repr(value)
+    return json.dumps(text) if (" " in text or not text) else text
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves all formatting to the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        if level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure(level=None, module_levels=None, stream=None, as_json=None):
+    """
+    Installs the queue handler on the package logger. Called lazily by
+    get_logger(); call it explicitly to override the environment.
+    """
+    global _configured, _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        level = level or os.environ.get("TRADEGPT_LOG_LEVEL", "INFO")
+        if module_levels is None:
+            module_levels = _parse_levels(os.environ.get("TRADEGPT_LOG_LEVELS", ""))
+        if as_json is None:
+            as_json = os.environ.get("TRADEGPT_LOG_FORMAT", "").lower() == "json"
+
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for name, module_level in module_levels.items():
+            logging.getLogger(name).setLevel(module_level)
+
+        sink = logging.StreamHandler(stream or sys.stderr)
+        sink.setFormatter(_StructuredFormatter(as_json=as_json))
+        log_queue = queue.SimpleQueue()
+        root.addHandler(_DeferredQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, sink, respect_handler_level=False)
+        _listener.start()
+        _configured = True
+
+
+def shutdown():
+    """Flushes pending records and stops the listener thread."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown)
+
+
+class StructuredLogger:
+    """Thin wrapper over a stdlib logger that takes an event name plus fields."""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+        self.name = name
+        self._burst = int(os.environ.get("TRADEGPT_LOG_DEBUG_BURST", "10"))
+        self._sample_every = max(1, int(os.environ.get("TRADEGPT_LOG_DEBUG_SAMPLE", "100")))
+        self._debug_counts = {}
+        self._counts_lock = threading.Lock()
+
+    def isEnabledFor(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, fields, exc_info=False):
+        resolved = {key: value() if callable(value) else value for key, value in fields.items()}
+        self._logger.log(level, event, extra={"fields": resolved}, exc_info=exc_info, stacklevel=3)
+
+    def debug(self, event, **fields):
+        if not self._logger.isEnabledFor(logging.DEBUG):
+            return
+        with self._counts_lock:
+            seen = self._debug_counts.get(event, 0) + 1
+            self._debug_counts[event] = seen
+        if seen > self._burst:
+            if (seen - self._burst) % self._sample_every:
+                return
+            fields["sampled_of"] = self._sample_every
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        if self._logger.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        if self._logger.isEnabledFor(logging.WARNING):
+            self._log(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._log(logging.ERROR, event, fields, exc_info=exc_info)
+
+
+def get_logger(name):
+    """Returns a StructuredLogger, configuring the package logger on first use."""
+    if not _configured:
+        configure()
+    return StructuredLogger(name)
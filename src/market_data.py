@@ -1,67 +1,305 @@
-import upstox_client
-from upstox_client.rest import ApiException
-import pandas as pd
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from . import auth
-import traceback
+from . import metrics
+from . import log
+from . import lazy
+from . import cache
+from . import market_hours
+
+# Heavy dependencies are imported on first use (see src/lazy.py)
+upstox_client = lazy.lazy_import("upstox_client")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+def candles_to_frame(candles):
+    """Converts Upstox candle rows [ts, o, h, l, c, v, (oi)] to a DataFrame"""
+    # Validate candle data structure, dropping short rows
+    rows = [candle[:6] for candle in candles if len(candle) >= 6]
+    return pd.DataFrame(rows, columns=CANDLE_COLUMNS)
 
 def get_market_data(symbol, timeframe='1d', days=30):
-    """Get historical market data for a given symbol"""
+    """Get historical market data for a given symbol as bars of `timeframe` (e.g. 5m, 1h, 1d, 1w)"""
+    return get_bars(symbol, timeframe, days)
+
+# Intervals accepted by the Upstox v2 historical candle API
+HISTORY_INTERVALS = ("1minute", "30minute", "day", "week", "month")
+
+# Historical candles keyed by (symbol, interval, from_date, to_date). The key
+# changes with the date and past sessions don't change, so entries live long.
+_candle_cache = cache.TTLCache("candles", maxsize=512, ttl=6 * 3600)
+
+def get_candles(symbol, interval="day", days=365, refresh=False):
+    """Get historical candles (oldest first) for a symbol, cached per date range"""
+    if interval not in HISTORY_INTERVALS:
+        return {"error": f"Unsupported interval '{interval}', use one of {', '.join(HISTORY_INTERVALS)}"}
+
+    end_date = datetime.date.today()
+    from_date = (end_date - datetime.timedelta(days=days)).isoformat()
+    to_date = end_date.isoformat()
+    key = (symbol, interval, from_date, to_date)
+    frame = None if refresh else _candle_cache.get(key)
+    if frame is not None:
+        return frame
+
     api_client = auth.get_upstox_client()
     if not api_client:
         return {"error": "Authentication required"}
-    api_version='2.0'
-    market_api = upstox_client.MarketQuoteApi(api_client)
+    history_api = upstox_client.HistoryApi(api_client)
 
     try:
-        # Calculate date range
-        end_date = datetime.datetime.now()
-        start_date = end_date - datetime.timedelta(days=days)
-
-        # Format dates as required by Upstox API
-        from_date = start_date.strftime("%Y-%m-%d")
-        to_date = end_date.strftime("%Y-%m-%d")
-
-        # Get historical data
-        response = market_api.get_market_quote_ohlc(symbol,timeframe,api_version)
-            
-
-        if not response or not hasattr(response, 'data') or not hasattr(response.data, 'candles'):
+        with metrics.timer("upstox_request_seconds", endpoint="historical_candle"):
+            response = history_api.get_historical_candle_data1(symbol, interval, to_date, from_date, '2.0')
+        if not response or not response.data or response.data.candles is None:
             return {"error": "Invalid response format from API"}
 
-        # Convert to pandas DataFrame for easier analysis
-        data = []
-        for candle in response.data.candles:
-            if len(candle) >= 6:  # Validate candle data structure
-                data.append({
-                    'timestamp': candle[0],
-                    'open': candle[1],
-                    'high': candle[2],
-                    'low': candle[3],
-                    'close': candle[4],
-                    'volume': candle[5]
-                })
-
-        return pd.DataFrame(data)
-
-    except ApiException as e:
-        return {"error": f"Exception when calling MarketData API: {e}"}
+        # Upstox returns newest first
+        frame = candles_to_frame(response.data.candles).iloc[::-1].reset_index(drop=True)
+        _candle_cache.set(key, frame)
+        return frame
+
+    except upstox_client.rest.ApiException as e:
+        return {"error": f"Exception when calling HistoryApi: {e}"}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
+# --- Derived intervals ---
+
+# Names accepted for bar intervals, mapped to the canonical one
+INTERVAL_ALIASES = {
+    "1m": "1minute", "minute": "1minute", "5m": "5minute", "15m": "15minute", "30m": "30minute",
+    "1h": "1hour", "60m": "1hour", "60minute": "1hour", "hour": "1hour", "hourly": "1hour",
+    "1d": "day", "daily": "day", "1w": "week", "weekly": "week", "1mo": "month", "monthly": "month",
+}
+# pandas resample rule and bin offset per interval built locally; hourly bars
+# start at :15 so the first one opens with the 09:15 session
+RESAMPLE_RULES = {
+    "5minute": ("5min", None),
+    "15minute": ("15min", None),
+    "30minute": ("30min", None),
+    "1hour": ("1h", "15min"),
+    "day": ("1D", None),
+    "week": ("W", None),
+    "month": ("MS", None),
+}
+INTRADAY_INTERVALS = ("1minute", "5minute", "15minute", "30minute", "1hour")
+# Longest span fetched at 1-minute resolution (one Upstox request)
+INTRADAY_MAX_DAYS = 30
+# Daily candles are always fetched for at least this span (the range the
+# prefetcher keeps warm) and sliced, so short and long requests share one entry
+DAILY_BASE_DAYS = 365
+
+# (base frame, bars) built from it, keyed by (symbol, interval, days, date)
+_bar_cache = cache.TTLCache("bars", maxsize=1024, ttl=6 * 3600)
+# Today's 1-minute candles from the intraday endpoint, keyed by (symbol, date)
+_intraday_cache = cache.TTLCache("intraday_candles", maxsize=512, ttl=60)
+# (historical frame, today's frame, merged frame), keyed by (symbol, days)
+_merged_cache = cache.TTLCache("intraday_merged", maxsize=512, ttl=6 * 3600)
+
+def normalize_interval(interval):
+    """Canonical interval name for `interval` (e.g. '5m' -> '5minute'), or None if unknown"""
+    interval = str(interval).strip().lower()
+    interval = INTERVAL_ALIASES.get(interval, interval)
+    return interval if interval == "1minute" or interval in RESAMPLE_RULES else None
+
+def base_interval(interval):
+    """The resolution actually fetched for `interval` bars"""
+    return "1minute" if interval in INTRADAY_INTERVALS else "day"
+
+def get_intraday_candles(symbol, refresh=False):
+    """
+    Today's 1-minute candles (oldest first) from the intraday endpoint; the
+    historical endpoint only has completed sessions. Empty before the open
+    and on weekends.
+    """
+    now = market_hours.now_ist()
+    if now.weekday() >= 5 or now.time() < market_hours.OPEN:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    key = (symbol, now.date().isoformat())
+    frame = None if refresh else _intraday_cache.get(key)
+    if frame is not None:
+        return frame
+
+    api_client = auth.get_upstox_client()
+    if not api_client:
+        return {"error": "Authentication required"}
+    try:
+        with metrics.timer("upstox_request_seconds", endpoint="intraday_candle"):
+            response = upstox_client.HistoryApi(api_client).get_intra_day_candle_data(symbol, "1minute", '2.0')
+    except upstox_client.rest.ApiException as e:
+        return {"error": f"Exception when calling HistoryApi: {e}"}
+    candles = (response.data.candles if response and response.data else None) or []
+    frame = candles_to_frame(candles).iloc[::-1].reset_index(drop=True)
+    # New candles every minute while the session runs; fixed once it closes
+    _intraday_cache.set(key, frame, ttl=60 if market_hours.is_open() else 1800)
+    return frame
+
+def _intraday_base(symbol, days, refresh=False):
+    """1-minute candles for the last `days` days including today's session"""
+    history = get_candles(symbol, interval="1minute", days=days, refresh=refresh)
+    if isinstance(history, dict):
+        return history
+    today = get_intraday_candles(symbol, refresh=refresh)
+    if isinstance(today, dict):
+        logger.warning("intraday_candles_unavailable", symbol=symbol, error=today["error"])
+        return history
+    if not len(today):
+        return history
+    cached = _merged_cache.get((symbol, days))
+    # Same inputs as last time: reuse the frame, so the bar cache recognises it
+    if cached is not None and cached[0] is history and cached[1] is today:
+        return cached[2]
+    merged = (pd.concat([history, today], ignore_index=True)
+              .drop_duplicates("timestamp", keep="last")
+              .sort_values("timestamp", kind="stable").reset_index(drop=True))
+    _merged_cache.set((symbol, days), (history, today, merged))
+    return merged
+
+def resample(frame, interval):
+    """
+    Aggregates an oldest-first candle frame into `interval` bars (open first,
+    high max, low min, close last, volume sum). Each bar keeps the timestamp
+    of its first candle; empty bins (nights, weekends) are dropped.
+    """
+    rule, offset = RESAMPLE_RULES[interval]
+    indexed = frame.set_index(pd.to_datetime(frame["timestamp"]))
+    bars = indexed.resample(rule, offset=offset).agg(
+        {"timestamp": "first", "open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+    return bars.dropna(subset=["open"]).reset_index(drop=True)
+
+def get_bars(symbol, interval="day", days=30, refresh=False):
+    """
+    Get bars of any supported interval (oldest first). Only the base
+    resolution is fetched: 1-minute candles (plus today's session from the
+    intraday endpoint) for intraday intervals, daily candles for day, week
+    and month, so those close on the exchange's official closing price.
+    Other intervals are resampled from it locally and cached, so switching
+    interval over the same span makes no API call.
+    """
+    name = normalize_interval(interval)
+    if name is None:
+        supported = ", ".join(["1minute", *RESAMPLE_RULES])
+        return {"error": f"Unsupported interval '{interval}', use one of {supported}"}
+    if name in INTRADAY_INTERVALS and days > INTRADAY_MAX_DAYS:
+        return {"error": f"Intraday bars are available for up to {INTRADAY_MAX_DAYS} days, not {days}"}
+
+    base = base_interval(name)
+    if base == "day":
+        frame = get_candles(symbol, interval="day", days=max(days, DAILY_BASE_DAYS), refresh=refresh)
+    else:
+        frame = _intraday_base(symbol, days, refresh=refresh)
+    if isinstance(frame, dict):
+        return frame
+    end_date = datetime.date.today()
+    key = (symbol, name, days, end_date.isoformat())
+    cached = _bar_cache.get(key)
+    # Rebuilt whenever the base series was refetched
+    if cached is not None and cached[0] is frame:
+        return cached[1]
+    window = frame
+    if base == "day" and days < DAILY_BASE_DAYS:
+        cutoff = (end_date - datetime.timedelta(days=days)).isoformat()
+        window = frame[frame["timestamp"].astype(str).str[:10] >= cutoff].reset_index(drop=True)
+    if name == base:
+        bars = window
+    else:
+        with metrics.timer("resample_seconds", interval=name):
+            bars = resample(window, name)
+    _bar_cache.set(key, (frame, bars))
+    return bars
+
+# Upstox accepts up to 500 instrument keys per market quote request
+QUOTE_BATCH_SIZE = 500
+
+# Full market quotes keyed by instrument key, shared by the screener, alerts,
+# the prefetcher and get_current_price
+_quote_cache = cache.TTLCache("quotes", maxsize=20000, ttl=10)
+
+# Seconds a quote stays usable while the market is open / closed
+QUOTE_TTL_OPEN = 10
+QUOTE_TTL_CLOSED = 1800
+
+def quote_ttl():
+    """Quotes barely move outside market hours, so they can be kept much longer"""
+    return QUOTE_TTL_CLOSED if market_hours.phase() == "closed" else QUOTE_TTL_OPEN
+
+def _fetch_quote_batch(market_api, keys):
+    with metrics.timer("upstox_request_seconds", endpoint="full_market_quote"):
+        response = market_api.get_full_market_quote(",".join(keys), '2.0')
+    quotes = {}
+    for quote in (response.data or {}).values():
+        quote = quote.to_dict() if hasattr(quote, 'to_dict') else dict(quote)
+        quote.pop('depth', None)
+        if quote.get('instrument_token'):
+            quotes[quote['instrument_token']] = quote
+    return quotes
+
+def get_quotes(symbols, max_workers=8, refresh=False):
+    """
+    Get full market quotes for many instrument keys at once.
+    Keys are fetched in batches of QUOTE_BATCH_SIZE, several batches in parallel;
+    quotes younger than the cache TTL are reused unless `refresh` is set.
+    Returns {instrument_key: quote dict}; keys Upstox doesn't know are left out.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    quotes = {} if refresh else _quote_cache.get_many(symbols)
+    missing = [symbol for symbol in symbols if symbol not in quotes]
+    if not missing:
+        return quotes
+
+    api_client = auth.get_upstox_client()
+    if not api_client:
+        return {"error": "Authentication required"}
+    market_api = upstox_client.MarketQuoteApi(api_client)
+    batches = [missing[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(missing), QUOTE_BATCH_SIZE)]
+
+    errors = []
+    def fetch(batch):
+        try:
+            return _fetch_quote_batch(market_api, batch)
+        except upstox_client.rest.ApiException as e:
+            errors.append(f"Exception when calling MarketQuoteApi: {e}")
+        except Exception as e:
+            errors.append(f"Unexpected error: {str(e)}")
+        return {}
+
+    if len(batches) == 1:
+        results = [fetch(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            results = list(pool.map(fetch, batches))
+    ttl = quote_ttl()
+    for result in results:
+        for key, quote in result.items():
+            _quote_cache.set(key, quote, ttl=ttl)
+            quotes[key] = quote
+    if errors:
+        logger.warning("quote_batches_failed", failed=len(errors), batches=len(batches), error=errors[0])
+        if not quotes:
+            return {"error": errors[0]}
+    return quotes
+
 def get_current_price(symbol):
     """Get current market price for a given symbol"""
+    # Served from a recent full quote when one is cached (see src/prefetch.py)
+    quote = _quote_cache.get(symbol)
+    if quote is not None and quote.get('last_price') is not None:
+        return quote['last_price']
+
     api_client = auth.get_upstox_client()
     if not api_client:
         return {"error": "Authentication required"}
 
     market_api = upstox_client.MarketQuoteApi(api_client)
     api_version = '2.0'
-    print(f"Fetching LTP for symbol: {symbol} using API version: {api_version}")
 
     try:
-        response = market_api.ltp(symbol, api_version)
-        print(f"API Response: {response}")  # Debug print
+        with metrics.timer("upstox_request_seconds", endpoint="ltp"):
+            response = market_api.ltp(symbol, api_version)
+        logger.debug("ltp_response", symbol=symbol, response=lambda: response)
 
         # Convert response to dictionary if needed
         if hasattr(response, 'to_dict'):
@@ -85,10 +323,10 @@ def get_current_price(symbol):
             return {"error": "Last price not found in response"}
 
         last_price = instrument_data['last_price']
-        print(f"Last price for {symbol}: {last_price}")  # Debug print
+        logger.debug("ltp", symbol=symbol, last_price=last_price)
         return last_price
 
-    except ApiException as e:
+    except upstox_client.rest.ApiException as e:
         return {"error": f"Exception when calling MarketQuoteApi: {e}"}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
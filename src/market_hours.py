@@ -0,0 +1,51 @@
+# src/market_hours.py
+"""
+NSE cash-market session times (IST), used to pick cache lifetimes and
+refresh cadences. Weekends are closed; exchange holidays are not modelled,
+so a holiday just looks like a quiet trading day.
+"""
+import datetime
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# Warm-up starts a little before the 09:00 pre-open auction
+PRE_OPEN = datetime.time(8, 45)
+OPEN = datetime.time(9, 15)
+CLOSE = datetime.time(15, 30)
+
+PHASES = ("pre_open", "open", "closed")
+
+
+def now_ist():
+    return datetime.datetime.now(IST)
+
+
+def phase(now=None):
+    """Returns 'pre_open', 'open' or 'closed' for `now` (default: the current time)."""
+    now = (now or now_ist()).astimezone(IST)
+    if now.weekday() >= 5:
+        return "closed"
+    current = now.time()
+    if PRE_OPEN <= current < OPEN:
+        return "pre_open"
+    if OPEN <= current < CLOSE:
+        return "open"
+    return "closed"
+
+
+def is_open(now=None):
+    return phase(now) == "open"
+
+
+def seconds_until_change(now=None):
+    """Seconds until the next phase boundary (pre-open, open or close)."""
+    now = (now or now_ist()).astimezone(IST)
+    day = now.date()
+    for _ in range(8):
+        if day.weekday() < 5:
+            for boundary in (PRE_OPEN, OPEN, CLOSE):
+                moment = datetime.datetime.combine(day, boundary, IST)
+                if moment > now:
+                    return (moment - now).total_seconds()
+        day += datetime.timedelta(days=1)
+    return 86400.0
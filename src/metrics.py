@@ -0,0 +1,315 @@
+# src/metrics.py
+"""
+In-process instrumentation for the trading assistant.
+
+Counters and histograms live in a single module-level registry and are
+cheap enough to leave on permanently. Everything can be exported as
+Prometheus text exposition format or as a JSON-serialisable snapshot.
+
+Naming conventions used across the package:
+    <thing>_seconds          histogram of durations (see timer/timed)
+    <thing>_errors_total     counter bumped when a timed block raises
+    cache_hits_total / cache_misses_total   labelled with cache=<name>
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency buckets (seconds) tuned for HTTP/LLM round trips
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Buckets for token-count histograms
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Help strings for the metrics emitted by this package
+_HELP = {
+    "assistant_request_seconds": "End-to-end latency of one trading_assistant() call.",
+    "gemini_request_seconds": "Latency of one Gemini generate_content round trip.",
+    "gemini_request_errors_total": "Gemini generate_content calls that raised.",
+    "gemini_prompt_tokens": "Prompt token count per Gemini call.",
+    "gemini_response_tokens": "Response (candidates) token count per Gemini call.",
+    "gemini_prompt_tokens_total": "Prompt tokens sent to Gemini.",
+    "gemini_response_tokens_total": "Response tokens received from Gemini.",
+    "gemini_cached_tokens_total": "Prompt tokens Gemini served from a context cache.",
+    "gemini_prompt_tokens_saved_total": "Prompt tokens not sent (tool subsetting estimate); cached tokens are counted separately.",
+    "tool_call_seconds": "Latency of one tool invocation requested by Gemini.",
+    "tool_call_errors_total": "Tool invocations that raised or returned an error.",
+    "upstox_request_seconds": "Latency of one Upstox REST call.",
+    "upstox_request_errors_total": "Upstox REST calls that raised.",
+    "fmp_request_seconds": "Latency of one Financial Modeling Prep HTTP call.",
+    "fmp_request_errors_total": "FMP HTTP calls that raised.",
+    "cache_hits_total": "Cache lookups served from memory.",
+    "cache_misses_total": "Cache lookups that fell through to the source.",
+    "portfolio_risk_seconds": "Time to build a portfolio risk report (history fetch included).",
+    "portfolio_risk_updates_total": "Return-matrix updates by kind: rebuild, incremental or unchanged.",
+    "batch_tool_calls_deduplicated_total": "Batch tool calls answered by an identical earlier or in-flight call.",
+    "resample_seconds": "Time to build bars of one interval from base candles.",
+    "snapshot_seconds": "Time to save or restore the warm-restart cache snapshot.",
+    "risk_reservations_swept_total": "Order reservations settled by the REST sweep instead of the order stream.",
+    "risk_check_seconds": "Time spent in pre-trade risk checks per order.",
+    "risk_rejections_total": "Orders blocked by a pre-trade risk check, by rule.",
+}
+
+
+def _label_key(labels):
+    """Turns a labels dict into a hashable, order-independent key."""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in items
+    )
+    return "{" + body + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    kind = "counter"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [(key, list(series)) for key, series in self._series.items()]
+
+    def quantile(self, q, series):
+        """Estimates a quantile from bucket counts (linear within a bucket)."""
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if seen + count >= rank and count:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class Registry:
+    """Holds every metric by name; metrics are created on first use."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(name, _HELP.get(name, ""), **kwargs)
+                    self._metrics[name] = metric
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name):
+        return self._get(Counter, name)
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+REGISTRY = Registry()
+
+
+# --- Recording helpers ---
+
+def inc(name, value=1, **labels):
+    """Increments counter `name`."""
+    REGISTRY.counter(name).inc(value, **labels)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Records one observation in histogram `name`."""
+    REGISTRY.histogram(name, buckets=buckets).observe(value, **labels)
+
+
+def _error_counter_name(name):
+    base = name[:-len("_seconds")] if name.endswith("_seconds") else name
+    return f"{base}_errors_total"
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Times the enclosed block into histogram `name`.
+    If the block raises, `<name minus _seconds>_errors_total` is bumped too.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc(_error_counter_name(name), **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hit):
+    """Counts one cache lookup for the cache named `cache`."""
+    inc("cache_hits_total" if hit else "cache_misses_total", cache=cache)
+
+
+def reset():
+    """Drops every recorded metric (mainly for benchmarks)."""
+    REGISTRY.clear()
+
+
+# --- Export ---
+
+def export_prometheus():
+    """Renders all metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY.metrics():
+        if metric.help:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if metric.kind == "counter":
+            for key, value in metric.samples():
+                lines.append(f"{metric.name}{_format_labels(key)} {value}")
+            continue
+        for key, series in metric.samples():
+            cumulative = 0
+            for i, bound in enumerate(metric.buckets):
+                cumulative += series[i]
+                lines.append(f"{metric.name}_bucket{_format_labels(key, [('le', repr(float(bound)))])} {cumulative}")
+            cumulative += series[len(metric.buckets)]
+            lines.append(f"{metric.name}_bucket{_format_labels(key, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{metric.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{metric.name}_count{_format_labels(key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Returns all metrics as a JSON-serialisable dict."""
+    result = {"timestamp": time.time(), "counters": {}, "histograms": {}}
+    for metric in REGISTRY.metrics():
+        if metric.kind == "counter":
+            result["counters"][metric.name] = [
+                {"labels": dict(key), "value": value} for key, value in metric.samples()
+            ]
+            continue
+        entries = []
+        for key, series in metric.samples():
+            count = sum(series[:-1])
+            entries.append({
+                "labels": dict(key),
+                "count": count,
+                "sum": series[-1],
+                "mean": series[-1] / count if count else 0.0,
+                "p50": metric.quantile(0.5, series),
+                "p95": metric.quantile(0.95, series),
+                "buckets": dict(zip([str(b) for b in metric.buckets] + ["+Inf"], series[:-1])),
+            })
+        result["histograms"][metric.name] = entries
+    return result
+
+
+def export_json(indent=None):
+    """Renders snapshot() as a JSON string."""
+    return json.dumps(snapshot(), indent=indent)
+
+
+def write(path):
+    """Writes metrics to `path`; '.prom'/'.txt' get Prometheus text, anything else JSON."""
+    if path.endswith((".prom", ".txt")):
+        content = export_prometheus()
+    else:
+        content = export_json(indent=2)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def summary(limit=15):
+    """Human-readable 'where do the seconds go' table, slowest totals first."""
+    rows = []
+    for metric in REGISTRY.metrics():
+        if metric.kind != "histogram" or not metric.name.endswith("_seconds"):
+            continue
+        for key, series in metric.samples():
+            count = sum(series[:-1])
+            label = ",".join(f"{k}={v}" for k, v in key)
+            rows.append((series[-1], metric.name + (f"[{label}]" if label else ""), count,
+                         metric.quantile(0.5, series), metric.quantile(0.95, series)))
+    rows.sort(reverse=True)
+    lines = [f"{'metric':<55} {'count':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8}"]
+    for total, name, count, p50, p95 in rows[:limit]:
+        lines.append(f"{name:<55} {count:>6} {total:>9.3f} {p50:>8.3f} {p95:>8.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,429 @@
+# src/orders.py
+"""
+Order and fill tracking fed by the Upstox portfolio update stream.
+
+place_buy_order/place_sell_order register each new order with the
+process-wide OrderBook; the stream then pushes every status change
+(open, complete, rejected, ...) with filled quantity and average price, so
+
+    book = orders.get_book()
+    book.get(order_id)                          # latest state, no REST call
+    book.wait_for_fill(order_id, timeout=10)    # blocks until complete/rejected/cancelled
+
+answer from memory. Waiters sleep on a condition variable and wake on the
+update that concerns them; nothing polls.
+
+Two feeds fill the book:
+
+    UpstoxOrderFeed   upstox_client.PortfolioDataStreamer (order updates only)
+    LocalOrderFeed    simulates the exchange in-process: every registered order
+                      goes open -> complete at the current price; for tests
+                      and offline runs (TRADEGPT_ORDER_FEED=local)
+
+Both push the same message shape, so the parsing path is shared. Each
+account has its own Upstox feed: main.py starts the default account's, and
+an order placed as any other account starts that account's on first use.
+Lookups (get, wait_for) only see the current account's orders.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import accounts, auth, lazy, log, market_data, metrics
+
+upstox_client = lazy.lazy_import("upstox_client")
+
+logger = log.get_logger(__name__)
+
+# Statuses after which an order never changes again
+TERMINAL = frozenset({"complete", "rejected", "cancelled"})
+# Status of an order accepted by the REST API but not yet seen on the stream
+SUBMITTED = "put order req received"
+# Orders kept in memory; the oldest finished ones are dropped beyond this
+MAX_ORDERS = 5000
+# Fields copied from stream messages / REST order details
+FIELDS = ("instrument_token", "trading_symbol", "transaction_type", "order_type", "product",
+          "quantity", "filled_quantity", "pending_quantity", "price", "average_price",
+          "status_message", "exchange_order_id")
+
+
+class OrderBook:
+    """Latest state of every tracked order, keyed by order id."""
+
+    def __init__(self, max_orders=MAX_ORDERS):
+        self.max_orders = max_orders
+        self.listeners = []  # called with each order dict after it changes
+        self._orders = OrderedDict()  # order_id -> order dict, oldest first
+        self._cond = threading.Condition()
+
+    # --- Updates ---
+
+    def register(self, order_id, account=None, **fields):
+        """Records an order just placed through the REST API."""
+        now = time.time()
+        with self._cond:
+            order = self._orders.get(order_id)
+            created = order is None
+            if created:
+                order = self._orders[order_id] = {
+                    "order_id": order_id, "account": account or accounts.current(),
+                    "status": SUBMITTED, "filled_quantity": 0, "average_price": None,
+                    "created_at": now, "updated_at": now,
+                    "transitions": [{"status": SUBMITTED, "at": now}],
+                }
+                self._trim()
+            # The stream can beat the REST response; keep whatever it reported
+            for key, value in fields.items():
+                order.setdefault(key, value)
+            snapshot = _copy(order)
+            self._cond.notify_all()
+        if created:
+            self._notify(snapshot)
+        return snapshot
+
+    def on_update(self, message):
+        """
+        Applies one order update (a stream message as bytes/str JSON, or a
+        dict). Returns the updated order, or None if the message was ignored.
+        """
+        if isinstance(message, (bytes, str)):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                logger.warning("order_update_unparseable", message=str(message)[:200])
+                return None
+        if not isinstance(message, dict) or message.get("update_type", "order") != "order":
+            return None
+        order_id = message.get("order_id")
+        status = (message.get("status") or "").lower()
+        if not order_id or not status:
+            return None
+
+        now = time.time()
+        with self._cond:
+            order = self._orders.get(order_id)
+            if order is None:
+                # Placed elsewhere (web/mobile) or before this process started
+                order = self._orders[order_id] = {
+                    "order_id": order_id, "account": message.get("account") or accounts.current(),
+                    "created_at": now, "transitions": [],
+                }
+                self._trim()
+            elif order.get("status") in TERMINAL and status not in TERMINAL:
+                # Late delivery of an earlier state
+                return None
+            for key in FIELDS:
+                if message.get(key) is not None:
+                    order[key] = message[key]
+            if order.get("status") != status:
+                order["transitions"].append({"status": status, "at": now})
+            order["status"] = status
+            order["updated_at"] = now
+            if status in TERMINAL and "closed_at" not in order:
+                order["closed_at"] = now
+            snapshot = _copy(order)
+            self._cond.notify_all()
+
+        metrics.inc("order_updates_total", status=status)
+        logger.debug("order_update", order_id=order_id, status=status,
+                     filled=snapshot.get("filled_quantity"), average_price=snapshot.get("average_price"))
+        self._notify(snapshot)
+        return snapshot
+
+    def _notify(self, order):
+        for listener in list(self.listeners):
+            try:
+                listener(order)
+            except Exception:
+                logger.error("order_listener_failed", order_id=order["order_id"], exc_info=True)
+
+    def _trim(self):
+        while len(self._orders) > self.max_orders:
+            for order_id, order in self._orders.items():
+                if order.get("status") in TERMINAL:
+                    del self._orders[order_id]
+                    break
+            else:
+                self._orders.popitem(last=False)
+
+    # --- Queries ---
+
+    def get(self, order_id, account=None):
+        """Latest state of `order_id`, or None if it isn't tracked for `account` (default: the current one)."""
+        account = account or accounts.current()
+        with self._cond:
+            order = self._orders.get(order_id)
+            return _copy(order) if order is not None and order.get("account") == account else None
+
+    def list(self, account=None, open_only=False, limit=None):
+        """Orders of `account` (default: the current one), newest first."""
+        account = account or accounts.current()
+        with self._cond:
+            found = [_copy(o) for o in reversed(self._orders.values())
+                     if o.get("account") == account and not (open_only and o.get("status") in TERMINAL)]
+        return found[:limit] if limit else found
+
+    def export(self):
+        """Every tracked order, oldest first (for snapshots)."""
+        with self._cond:
+            return [_copy(o) for o in self._orders.values()]
+
+    def restore(self, saved):
+        """Adds orders from export() that aren't tracked yet; returns how many were added."""
+        added = 0
+        with self._cond:
+            for order in saved:
+                if order.get("order_id") and order["order_id"] not in self._orders:
+                    self._orders[order["order_id"]] = _copy(order)
+                    added += 1
+            self._trim()
+            self._cond.notify_all()
+        return added
+
+    def wait_for(self, order_id, statuses, timeout=None, account=None):
+        """
+        Blocks until `order_id` reaches one of `statuses` (or any terminal
+        status). Returns the order, or its latest state (None if unknown)
+        once `timeout` seconds pass. Orders of another account than
+        `account` (default: the current one) return None at once.
+        """
+        account = account or accounts.current()
+        statuses = set(statuses) | TERMINAL
+        def reached():
+            order = self._orders.get(order_id)
+            return order is not None and (order.get("account") != account or order.get("status") in statuses)
+        with self._cond:
+            self._cond.wait_for(reached, timeout)
+            order = self._orders.get(order_id)
+            return _copy(order) if order is not None and order.get("account") == account else None
+
+    def wait_for_fill(self, order_id, timeout=None, account=None):
+        """Blocks until `order_id` is complete, rejected or cancelled; see wait_for."""
+        with metrics.timer("order_fill_wait_seconds"):
+            return self.wait_for(order_id, TERMINAL, timeout, account)
+
+    def __len__(self):
+        return len(self._orders)
+
+
+def _copy(order):
+    copied = dict(order)
+    copied["transitions"] = list(order.get("transitions", ()))
+    return copied
+
+
+# --- Feeds ---
+
+class UpstoxOrderFeed:
+    """Pushes order updates from the Upstox portfolio stream into a book."""
+
+    def __init__(self, book, account=None):
+        self.book = book
+        self.account = account or accounts.current()
+        self._streamer = None
+
+    def start(self):
+        api_client = accounts.get_client(self.account)
+        if api_client is None:
+            logger.info("order_feed_skipped", account=self.account, reason="no access token")
+            return False
+        account = self.account
+        def on_message(message):
+            with accounts.use_account(account):
+                self.book.on_update(message)
+        streamer = upstox_client.PortfolioDataStreamer(api_client, order_update=True)
+        streamer.on("message", on_message)
+        streamer.on("error", lambda error: logger.warning("order_feed_error", account=account, error=str(error)))
+        streamer.on("autoReconnectStopped", lambda reason: logger.warning(
+            "order_feed_stopped", account=account, reason=str(reason)))
+        streamer.connect()
+        self._streamer = streamer
+        logger.info("order_feed_started", account=account, feed="upstox")
+        return True
+
+    def stop(self):
+        if self._streamer is not None:
+            try:
+                self._streamer.disconnect()
+            except Exception:
+                pass
+            self._streamer = None
+
+
+class LocalOrderFeed:
+    """
+    Exchange stand-in: every order registered with the book is acknowledged
+    ("open") and then filled in full ("complete") after `fill_delay` seconds,
+    at its limit price or the price from `price_source` (default: the
+    current market price). Orders for which `reject` returns a reason are
+    rejected instead.
+    """
+
+    def __init__(self, book, fill_delay=0.0, price_source=None, reject=None):
+        self.book = book
+        self.fill_delay = fill_delay
+        self.price_source = price_source or market_data.get_current_price
+        self.reject = reject
+        self._timers = set()
+        self._lock = threading.Lock()
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self.book.listeners.append(self._on_order)
+        logger.info("order_feed_started", feed="local")
+        return True
+
+    def stop(self):
+        self._running = False
+        if self._on_order in self.book.listeners:
+            self.book.listeners.remove(self._on_order)
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+
+    def _on_order(self, order):
+        # Registration is the only change this feed reacts to
+        if not self._running or order["status"] != SUBMITTED:
+            return
+        self.book.on_update(self._message(order, "open"))
+        timer = threading.Timer(self.fill_delay, accounts.propagate(self._fill), args=(order,))
+        timer.daemon = True
+        with self._lock:
+            self._timers.add(timer)
+        timer.start()
+
+    def _fill(self, order):
+        with self._lock:
+            self._timers = {t for t in self._timers if t.is_alive() and t is not threading.current_thread()}
+        reason = self.reject(order) if self.reject else None
+        if reason:
+            self.book.on_update(self._message(order, "rejected", status_message=reason))
+            return
+        price = order.get("price") if order.get("order_type") == "LIMIT" else None
+        if not price:
+            price = self.price_source(order.get("instrument_token"))
+            if not isinstance(price, (int, float)):
+                price = order.get("price") or 0.0
+        quantity = order.get("quantity") or 0
+        self.book.on_update(self._message(order, "complete", filled_quantity=quantity,
+                                          pending_quantity=0, average_price=float(price)))
+
+    @staticmethod
+    def _message(order, status, **fields):
+        message = {"update_type": "order", "order_id": order["order_id"], "status": status,
+                   "account": order.get("account")}
+        for key in FIELDS:
+            if order.get(key) is not None:
+                message[key] = order[key]
+        message.update(fields)
+        return json.dumps(message)
+
+
+# --- REST fallback ---
+
+def fetch_order(order_id):
+    """
+    Loads one order from the REST API into the book (for orders placed
+    before the stream was connected). Returns the order or an error dict.
+    """
+    api_client = auth.get_upstox_client()
+    if not api_client:
+        return {"error": "Authentication required"}
+    try:
+        with metrics.timer("upstox_request_seconds", endpoint="get_order_status"):
+            response = upstox_client.OrderApi(api_client).get_order_status(order_id=order_id)
+    except upstox_client.rest.ApiException as e:
+        return {"error": f"Exception when calling OrderApi: {e}"}
+    data = response.data
+    message = {key: getattr(data, key, None) for key in FIELDS}
+    message.update(order_id=order_id, status=data.status,
+                   trading_symbol=data.trading_symbol or data.tradingsymbol)
+    return get_book().on_update(message) or get_book().get(order_id) or {"error": f"Order '{order_id}' not found"}
+
+
+# --- Process-wide book and feeds ---
+
+_book = None
+_feeds = {}  # account -> started feed; the local feed serves every account under LOCAL
+_creating = {}  # account -> lock held while its feed starts
+_lock = threading.Lock()
+
+LOCAL = "*local*"
+
+
+def get_book():
+    """Returns the process-wide OrderBook."""
+    global _book
+    if _book is None:
+        with _lock:
+            if _book is None:
+                _book = OrderBook()
+    return _book
+
+
+def set_book(book):
+    """Replaces the process-wide OrderBook."""
+    global _book
+    _book = book
+
+
+def start_feed(account=None, kind=None):
+    """
+    Starts the order feed for `account` (default: the current one), once
+    per account. `kind` is "upstox" or "local" (default:
+    TRADEGPT_ORDER_FEED, else "upstox"); the local feed simulates fills for
+    every account. Returns the feed, or None if it couldn't start.
+    """
+    account = account or accounts.current()
+    kind = kind or os.environ.get("TRADEGPT_ORDER_FEED", "upstox")
+    key = LOCAL if kind == "local" else account
+    with _lock:
+        feed = _feeds.get(key) or _feeds.get(LOCAL)
+        if feed is not None:
+            return feed
+        creating = _creating.setdefault(key, threading.Lock())
+
+    with creating:
+        with _lock:
+            feed = _feeds.get(key)
+            if feed is not None:
+                return feed
+        feed = LocalOrderFeed(get_book()) if kind == "local" else UpstoxOrderFeed(get_book(), account)
+        try:
+            started = feed.start()
+        except Exception as e:
+            logger.warning("order_feed_failed", account=account, feed=kind, error=str(e))
+            started = False
+        with _lock:
+            _creating.pop(key, None)
+            if started:
+                _feeds[key] = feed
+    return feed if started else None
+
+
+def ensure_feed(account=None):
+    """
+    Starts `account`'s feed if feeds are in use (some feed was started, as
+    main.py does) and it has none yet; called when an order is placed.
+    """
+    account = account or accounts.current()
+    with _lock:
+        if not _feeds or account in _feeds or LOCAL in _feeds:
+            return
+    start_feed(account)
+
+
+def stop_feed(account=None):
+    """Stops `account`'s feed, or every feed when None."""
+    with _lock:
+        if account is None:
+            feeds = list(_feeds.values())
+            _feeds.clear()
+        else:
+            feeds = [f for f in (_feeds.pop(account, None),) if f is not None]
+    for feed in feeds:
+        feed.stop()
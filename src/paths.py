@@ -0,0 +1,20 @@
+# src/paths.py
+"""Filesystem locations shared across modules."""
+import os
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), '..')
+CONFIG_DIR = os.path.join(ROOT_DIR, 'config')
+
+
+def cache_dir(*parts):
+    """Returns (and creates) a directory under the local cache, TRADEGPT_CACHE_DIR or ./cache."""
+    path = os.path.join(os.environ.get("TRADEGPT_CACHE_DIR") or os.path.join(ROOT_DIR, 'cache'), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def data_dir(*parts):
+    """Returns (and creates) a directory for persistent user data, TRADEGPT_DATA_DIR or ./data."""
+    path = os.path.join(os.environ.get("TRADEGPT_DATA_DIR") or os.path.join(ROOT_DIR, 'data'), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
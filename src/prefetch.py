@@ -0,0 +1,198 @@
+# src/prefetch.py
+"""
+Keeps the data behind likely questions warm: portfolio holdings plus a
+watchlist from config.json
+
+    {"access_token": "...", "watchlist": ["INFY", "TCS", "NSE_EQ|INE002A01018"]}
+
+A daemon thread warms everything at startup and again whenever the market
+enters pre-open, opens or closes, and in between refreshes each kind of
+data on a cadence that depends on the session:
+
+                 open / pre-open     closed
+    quotes       every 5 s           every 15 min
+    holdings     every 60 s          every 15 min
+    candles      every 60 min        every 6 h
+
+Refreshes go through the normal market_data/trading functions with
+refresh=True, so the results land in the same caches interactive tool
+calls read from. Candles are warmed at the daily base span of
+market_data.get_bars, which every day/week/month request (get_market_data,
+the backtester, screener and risk analytics) reads from.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import accounts, auth, instruments, log, market_data, market_hours, metrics, trading
+
+logger = log.get_logger(__name__)
+
+# Seconds between refreshes per task, by market phase
+CADENCE = {
+    "quotes": {"open": 5, "pre_open": 5, "closed": 900},
+    "holdings": {"open": 60, "pre_open": 60, "closed": 900},
+    "candles": {"open": 3600, "pre_open": 3600, "closed": 6 * 3600},
+}
+CANDLE_DAYS = market_data.DAILY_BASE_DAYS
+CANDLE_WORKERS = 4
+
+
+class Prefetcher:
+    """Background warm-up of holdings, watchlist quotes and daily candles."""
+
+    def __init__(self, csv_path=None, watchlist=None, candle_days=CANDLE_DAYS):
+        self.csv_path = csv_path
+        self.watchlist = watchlist
+        self.candle_days = candle_days
+        self._next_run = dict.fromkeys(CADENCE, 0.0)
+        self._targets = []
+        self._resolved = {}  # watchlist entry -> instrument key (None if unknown)
+        self._thread = None
+        self._stop = threading.Event()
+
+    # --- Targets ---
+
+    def _resolve(self, entry):
+        entry = str(entry).strip()
+        if "|" in entry:
+            return entry
+        if not self.csv_path:
+            return None
+        try:
+            found = instruments.get_index(self.csv_path).lookup(entry)
+        except (OSError, instruments.CsvFormatError) as e:
+            logger.warning("watchlist_lookup_failed", symbol=entry, error=str(e))
+            return None
+        if found is None:
+            logger.warning("watchlist_symbol_unknown", symbol=entry)
+            return None
+        return found["nse_format"]
+
+    def targets(self):
+        """Instrument keys of the holdings and the watchlist, holdings first."""
+        watchlist = self.watchlist
+        if watchlist is None:
+            watchlist = auth.load_config().get("watchlist", [])
+        keys = [h["instrument_token"] for h in self._holdings() if h.get("instrument_token")]
+        for entry in watchlist:
+            if entry not in self._resolved:
+                self._resolved[entry] = self._resolve(entry)
+            if self._resolved[entry]:
+                keys.append(self._resolved[entry])
+        self._targets = list(dict.fromkeys(keys))
+        return self._targets
+
+    def _holdings(self, refresh=False):
+        holdings = trading.get_portfolio(refresh=refresh)
+        if isinstance(holdings, dict):
+            logger.warning("prefetch_holdings_failed", error=holdings.get("error"))
+            return []
+        return holdings
+
+    # --- Tasks ---
+
+    def refresh_holdings(self):
+        with metrics.timer("prefetch_seconds", task="holdings"):
+            return len(self._holdings(refresh=True))
+
+    def refresh_quotes(self):
+        if not self._targets:
+            return 0
+        with metrics.timer("prefetch_seconds", task="quotes"):
+            quotes = market_data.get_quotes(self._targets, refresh=True)
+        if "error" in quotes:
+            logger.warning("prefetch_quotes_failed", error=quotes["error"])
+            return 0
+        return len(quotes)
+
+    def refresh_candles(self):
+        if not self._targets:
+            return 0
+        def fetch(key):
+            frame = market_data.get_candles(key, interval="day", days=self.candle_days, refresh=True)
+            return not isinstance(frame, dict)
+        with metrics.timer("prefetch_seconds", task="candles"):
+            with ThreadPoolExecutor(max_workers=CANDLE_WORKERS) as pool:
+                return sum(pool.map(accounts.propagate(fetch), self._targets))
+
+    def warm(self):
+        """Refreshes everything now; returns counts and the time taken."""
+        start = time.perf_counter()
+        if not auth.get_token():
+            logger.info("prefetch_skipped", reason="no access token")
+            return {"skipped": "no access token"}
+        holdings = self.refresh_holdings()
+        self.targets()
+        quotes = self.refresh_quotes()
+        candles = self.refresh_candles()
+        now = time.monotonic()
+        current = market_hours.phase()
+        for task, cadence in CADENCE.items():
+            self._next_run[task] = now + cadence[current]
+        stats = {"holdings": holdings, "instruments": len(self._targets), "quotes": quotes,
+                 "candles": candles, "seconds": round(time.perf_counter() - start, 3)}
+        logger.info("prefetch_warm", phase=current, **stats)
+        return stats
+
+    # --- Scheduling ---
+
+    def run_due(self):
+        """Runs whichever tasks are due; returns seconds until the next one."""
+        if not auth.get_token():
+            return 60.0
+        now = time.monotonic()
+        current = market_hours.phase()
+        for task in ("holdings", "quotes", "candles"):
+            if now >= self._next_run[task]:
+                if task == "holdings":
+                    self.refresh_holdings()
+                    self.targets()
+                elif task == "quotes":
+                    self.refresh_quotes()
+                else:
+                    self.refresh_candles()
+                self._next_run[task] = time.monotonic() + CADENCE[task][current]
+        return max(0.0, min(self._next_run.values()) - time.monotonic())
+
+    def start(self):
+        """Starts the warm-up thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        current = None
+        while not self._stop.is_set():
+            try:
+                new_phase = market_hours.phase()
+                if new_phase != current:
+                    # Startup and every session boundary get a full warm-up
+                    current = new_phase
+                    self.warm()
+                    delay = min(self._next_run.values()) - time.monotonic()
+                else:
+                    delay = self.run_due()
+            except Exception:
+                logger.error("prefetch_failed", exc_info=True)
+                delay = 60
+            delay = min(max(delay, 1.0), market_hours.seconds_until_change() + 1)
+            self._stop.wait(delay)
+
+
+def start_from_config(csv_path):
+    """Starts a Prefetcher unless TRADEGPT_PREFETCH=0; returns it (or None)."""
+    if os.environ.get("TRADEGPT_PREFETCH", "1") == "0":
+        return None
+    prefetcher = Prefetcher(csv_path=csv_path)
+    prefetcher.start()
+    return prefetcher
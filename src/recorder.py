@@ -0,0 +1,315 @@
+# src/recorder.py
+"""
+Transport-level record/replay of Upstox, FMP and Gemini traffic.
+
+    TRADEGPT_RECORD=fixtures/session.jsonl.gz python main.py
+    TRADEGPT_REPLAY=fixtures/session.jsonl.gz TRADEGPT_REPLAY_LATENCY=1 python main.py
+
+or from code:
+
+    with recorder.Recorder("session.jsonl.gz", mode="record"):
+        gemini.trading_assistant("What is the price of INFY?")
+
+Fixtures are gzip'd JSON lines, one exchange per line: service, method,
+normalised URL, a hash of the request body, status, content type,
+response body and elapsed seconds. Credentials are never written: request
+headers are not stored and `apikey`-style query parameters are stripped.
+
+Replay is deterministic: the n-th request with a given identity gets the
+n-th recorded response for it (the last one repeats once exhausted).
+Requests whose identity was never seen fall back to the recorded
+responses for the same service/method/path, in order, unless strict=True.
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+import requests
+
+from . import auth, log
+
+logger = log.get_logger(__name__)
+
+FMP_BASE_URL = "https://financialmodelingprep.com"
+# Query parameters that carry credentials or vary per run
+_VOLATILE_PARAMS = {"apikey", "api_key", "key", "access_token"}
+
+
+class ReplayMissError(LookupError):
+    """Raised in strict replay mode when no recorded response matches."""
+
+
+def _normalise_url(url, query_pairs=None):
+    parts = urlsplit(url)
+    pairs = parse_qsl(parts.query, keep_blank_values=True) + list(query_pairs or [])
+    pairs = sorted((k, str(v)) for k, v in pairs if k.lower() not in _VOLATILE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(pairs), ""))
+
+
+def _body_hash(body):
+    if body is None or body == b"" or body == "":
+        return ""
+    if isinstance(body, str):
+        body = body.encode()
+    try:
+        # Canonicalise JSON so key order doesn't change the identity
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+def _encode_body(data):
+    try:
+        return {"body": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(data).decode(), "b64": True}
+
+
+def _decode_body(entry):
+    if entry.get("b64"):
+        return base64.b64decode(entry["body"])
+    return entry["body"].encode("utf-8")
+
+
+class Recorder:
+    """Records or replays HTTP exchanges for the three external services."""
+
+    def __init__(self, path, mode="record", replay_latency=0.0, strict=False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown recorder mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency  # multiplier on recorded elapsed time
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._file = None
+        self._exact = defaultdict(deque)
+        self._by_path = defaultdict(deque)
+        self._installed = []
+        self.recorded = 0
+        self.replayed = 0
+
+    # --- Storage ---
+
+    def _open(self):
+        if self.mode == "record":
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._exact[self._key(entry)].append(entry)
+                self._by_path[self._path_key(entry)].append(entry)
+        logger.info("replay_loaded", path=self.path, exchanges=sum(len(q) for q in self._exact.values()))
+
+    @staticmethod
+    def _key(entry):
+        return (entry["svc"], entry["method"], entry["url"], entry["req"])
+
+    @staticmethod
+    def _path_key(entry):
+        return (entry["svc"], entry["method"], urlsplit(entry["url"]).path)
+
+    def save(self, svc, method, url, body, status, content_type, data, elapsed):
+        entry = {"svc": svc, "method": method, "url": url, "req": _body_hash(body),
+                 "status": status, "type": content_type, "elapsed": round(elapsed, 6)}
+        entry.update(_encode_body(data))
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self.recorded += 1
+
+    def lookup(self, svc, method, url, body):
+        """Returns the recorded entry for a request, honouring recorded latency."""
+        probe = {"svc": svc, "method": method, "url": url, "req": _body_hash(body)}
+        with self._lock:
+            queue = self._exact.get(self._key(probe))
+            if not queue and not self.strict:
+                queue = self._by_path.get(self._path_key(probe))
+            if not queue:
+                raise ReplayMissError(f"No recorded response for {method} {url}")
+            entry = queue.popleft() if len(queue) > 1 else queue[0]
+            self.replayed += 1
+        if self.replay_latency:
+            time.sleep(entry["elapsed"] * self.replay_latency)
+        return entry
+
+    # --- Installation ---
+
+    def install(self, gemini_transport=None):
+        """Starts recording/replaying Upstox, FMP and Gemini traffic."""
+        from . import gemini
+        from google.genai import types
+
+        self._open()
+
+        auth.client_hooks.append(self.wrap_api_client)
+        auth.reset_clients()
+        self._installed.append(lambda: (auth.client_hooks.remove(self.wrap_api_client), auth.reset_clients()))
+
+        session = gemini.get_http_session()
+        previous_adapter = session.get_adapter(FMP_BASE_URL)
+        session.mount(FMP_BASE_URL, RecordingAdapter(self, previous_adapter))
+        self._installed.append(lambda: session.mount(FMP_BASE_URL, previous_adapter))
+
+        previous_client = gemini._client
+        if self.mode == "replay":
+            api_key = os.environ.get("GOOGLE_API_KEY") or "replay"
+        else:
+            gemini.setup_environment_api_key()
+            api_key = None
+        inner = gemini_transport or httpx.HTTPTransport()
+        gemini.set_gemini_client(gemini.genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(httpx_client=httpx.Client(transport=RecordingTransport(self, inner))),
+        ))
+        self._installed.append(lambda: gemini.set_gemini_client(previous_client))
+        logger.info("recorder_installed", mode=self.mode, path=self.path)
+        return self
+
+    def uninstall(self):
+        """Restores the original transports and closes the fixture file."""
+        while self._installed:
+            self._installed.pop()()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logger.info("recorder_stopped", mode=self.mode, recorded=self.recorded, replayed=self.replayed)
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+        return False
+
+    def wrap_api_client(self, api_client):
+        """client hook: routes an Upstox ApiClient's HTTP traffic through the recorder."""
+        api_client.rest_client.pool_manager = RecordingPoolManager(self, api_client.rest_client.pool_manager)
+
+
+# --- Transport adapters ---
+
+class _ReplayedUrllib3Response:
+    def __init__(self, entry):
+        self.status = entry["status"]
+        self.reason = "Replayed"
+        self.data = _decode_body(entry)
+        self._headers = {"Content-Type": entry.get("type") or "application/json"}
+
+    def getheaders(self):
+        return self._headers
+
+    def getheader(self, name, default=None):
+        return self._headers.get(name, default)
+
+
+class RecordingPoolManager:
+    """Wraps the urllib3 PoolManager inside an Upstox ApiClient."""
+
+    def __init__(self, recorder, inner):
+        self.recorder = recorder
+        self.inner = inner
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def request(self, method, url, fields=None, body=None, **kwargs):
+        # GET parameters travel in `fields`; fold them into the URL identity
+        query = fields if method in ("GET", "HEAD") else None
+        key_url = _normalise_url(url, query)
+        if self.recorder.mode == "replay":
+            return _ReplayedUrllib3Response(self.recorder.lookup("upstox", method, key_url, body))
+        start = time.perf_counter()
+        response = self.inner.request(method, url, fields=fields, body=body, **kwargs)
+        elapsed = time.perf_counter() - start
+        self.recorder.save("upstox", method, key_url, body, response.status,
+                           response.getheader("Content-Type"), response.data or b"", elapsed)
+        return response
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    """requests transport adapter for the FMP session."""
+
+    def __init__(self, recorder, inner):
+        super().__init__()
+        self.recorder = recorder
+        self.inner = inner
+
+    def send(self, request, **kwargs):
+        key_url = _normalise_url(request.url)
+        if self.recorder.mode == "replay":
+            entry = self.recorder.lookup("fmp", request.method, key_url, request.body)
+            response = requests.Response()
+            response.status_code = entry["status"]
+            response._content = _decode_body(entry)
+            response.headers["Content-Type"] = entry.get("type") or "application/json"
+            response.url = request.url
+            response.request = request
+            return response
+        start = time.perf_counter()
+        response = self.inner.send(request, **kwargs)
+        content = response.content
+        self.recorder.save("fmp", request.method, key_url, request.body, response.status_code,
+                           response.headers.get("Content-Type"), content, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """httpx transport for the Gemini client."""
+
+    def __init__(self, recorder, inner):
+        self.recorder = recorder
+        self.inner = inner
+
+    def handle_request(self, request):
+        key_url = _normalise_url(str(request.url))
+        body = request.read()
+        if self.recorder.mode == "replay":
+            entry = self.recorder.lookup("gemini", request.method, key_url, body)
+            return httpx.Response(entry["status"], content=_decode_body(entry),
+                                  headers={"Content-Type": entry.get("type") or "application/json"})
+        start = time.perf_counter()
+        response = self.inner.handle_request(request)
+        content = response.read()
+        self.recorder.save("gemini", request.method, key_url, body, response.status_code,
+                           response.headers.get("Content-Type"), content, time.perf_counter() - start)
+        return response
+
+    def close(self):
+        self.inner.close()
+
+
+def install_from_env():
+    """Installs a recorder if TRADEGPT_RECORD or TRADEGPT_REPLAY is set."""
+    record_path = os.environ.get("TRADEGPT_RECORD")
+    replay_path = os.environ.get("TRADEGPT_REPLAY")
+    if not (record_path or replay_path):
+        return None
+    if replay_path:
+        latency = float(os.environ.get("TRADEGPT_REPLAY_LATENCY", "0") or 0)
+        strict = os.environ.get("TRADEGPT_REPLAY_STRICT", "") == "1"
+        recorder = Recorder(replay_path, mode="replay", replay_latency=latency, strict=strict)
+    else:
+        recorder = Recorder(record_path, mode="record")
+    recorder.install()
+    atexit.register(recorder.uninstall)
+    return recorder
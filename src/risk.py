@@ -0,0 +1,368 @@
+# src/risk.py
+"""
+Pre-trade risk checks, run on every order before it reaches OrderApi.
+
+Limits come from a "risk" section in config/config.json (or per account in
+config/accounts.json); anything missing falls back to DEFAULT_LIMITS:
+
+    {"access_token": "...", "risk": {"max_order_value": 100000, "price_band_pct": 5}}
+
+    max_quantity           shares per order
+    max_order_value        notional per order (quantity x price)
+    max_position_value     absolute notional held in one instrument after the order
+    max_total_exposure     sum of absolute notional over all instruments (null: no limit)
+    max_daily_buy_value    net buy notional for the session, reset each IST day (null: no limit)
+    price_band_pct         limit price distance from the market price (fat-finger check)
+    max_orders_per_minute  orders accepted in any 60 s window
+
+Exposure is kept incrementally per account: holdings seed it once, each
+accepted order reserves its notional, and fills from the order book
+(src/orders.py) move the reservation into the position, or release it on
+rejection/cancellation. A check is a handful of dict lookups and
+comparisons, so it adds microseconds, not a holdings fetch, to an order.
+If the holdings fetch fails the account stays unseeded and the next check
+tries again.
+
+Reservations normally settle from the order stream. For orders it hasn't
+settled after SETTLE_AFTER seconds (no feed for the account, a dropped
+connection), a check first asks the REST API for their status, at most
+once per SWEEP_INTERVAL; DAY orders still unsettled once their session has
+closed are released.
+"""
+import datetime
+import threading
+import time
+from collections import deque
+
+from . import accounts, log, market_hours, metrics, orders
+
+logger = log.get_logger(__name__)
+
+DEFAULT_LIMITS = {
+    "max_quantity": 10000,
+    "max_order_value": 500000.0,
+    "max_position_value": 1000000.0,
+    "max_total_exposure": None,
+    "max_daily_buy_value": None,
+    "price_band_pct": 10.0,
+    "max_orders_per_minute": 20,
+}
+RATE_WINDOW = 60.0
+# Seconds before an open reservation is looked up over REST, and between lookups per account
+SETTLE_AFTER = 30.0
+SWEEP_INTERVAL = 60.0
+
+
+class RiskError(ValueError):
+    """An order failed a pre-trade check; `rule` names the limit."""
+
+    def __init__(self, rule, message):
+        super().__init__(message)
+        self.rule = rule
+
+
+class AccountRisk:
+    """Running exposure and counters for one account."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.qty = {}  # instrument -> signed filled quantity
+        self.value = {}  # instrument -> signed notional of filled quantity
+        self.pending = {}  # instrument -> signed notional reserved by open orders
+        self.total = 0.0  # sum over instruments of |value + pending|
+        self.bought = 0.0  # net buy notional this session, incl. open orders
+        self.recent = deque()  # acceptance times within RATE_WINDOW
+        self.open = {}  # order_id -> [instrument, sign, quantity, price, quantity applied, placed at]
+        self.seeded = False
+        self.swept_at = 0.0
+        self.session = market_hours.now_ist().date()
+
+    def roll(self, today):
+        """Starts a new session's counters when the IST date changes."""
+        if today == self.session:
+            return
+        self.session = today
+        # Buys still open carry over: their reservation is released or settled against this total
+        self.bought = sum((entry[2] - entry[4]) * entry[3] for entry in self.open.values() if entry[1] > 0)
+        self.recent.clear()
+
+    def exposure(self, key):
+        return abs(self.value.get(key, 0.0) + self.pending.get(key, 0.0))
+
+    def move(self, key, value=0.0, pending=0.0, qty=0):
+        """Adjusts one instrument and keeps the total in step."""
+        before = self.exposure(key)
+        if value:
+            self.value[key] = self.value.get(key, 0.0) + value
+        if pending:
+            self.pending[key] = self.pending.get(key, 0.0) + pending
+        if qty:
+            self.qty[key] = self.qty.get(key, 0) + qty
+        self.total += self.exposure(key) - before
+
+
+class RiskEngine:
+    """Pre-trade checks and per-account exposure, fed by order updates."""
+
+    def __init__(self, limits=None, holdings_source=None):
+        self.limits = limits  # overrides config when given
+        self.holdings_source = holdings_source or _holdings
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def _state(self, account):
+        state = self._accounts.get(account)
+        if state is None:
+            state = self._accounts[account] = AccountRisk(self._limits_for(account))
+        return state
+
+    def _seed(self, account):
+        """Loads an account's holdings once (retried while unavailable); later changes arrive as fills."""
+        with self._lock:
+            if self._state(account).seeded:
+                return
+        holdings = self.holdings_source(account)
+        if holdings is None:
+            return
+        with self._lock:
+            state = self._state(account)
+            if state.seeded:
+                return
+            state.seeded = True
+            for holding in holdings:
+                key = holding.get("instrument_token")
+                quantity = holding.get("quantity") or 0
+                price = holding.get("last_price") or holding.get("average_price") or 0.0
+                if key and quantity:
+                    state.move(key, value=quantity * price, qty=quantity)
+
+    def _limits_for(self, account):
+        if self.limits is not None:
+            return {**DEFAULT_LIMITS, **self.limits}
+        settings = accounts.get_pool().store.get(account) or {}
+        return {**DEFAULT_LIMITS, **(settings.get("risk") or {})}
+
+    # --- Checks ---
+
+    def check(self, instrument_key, side, quantity, price, reference_price=None, order_type="MARKET"):
+        """
+        Checks an order and, if it passes, reserves its exposure. `price` is
+        the limit price (ignored for market orders) and `reference_price` the
+        current market price. Raises RiskError naming the rule that failed;
+        returns a reservation to pass to bind() or release().
+        """
+        account = accounts.current()
+        self._seed(account)
+        self.sweep(account)
+        start = time.perf_counter()
+        sign = 1 if side == "BUY" else -1
+        if isinstance(quantity, float) and quantity.is_integer():
+            quantity = int(quantity)  # JSON tool arguments arrive as floats
+        today = market_hours.now_ist().date()
+        with self._lock:
+            state = self._state(account)
+            state.roll(today)
+            try:
+                limit_price = price if order_type == "LIMIT" and price else None
+                notional = self._validate(state, instrument_key, sign, quantity, limit_price, reference_price)
+            except RiskError as e:
+                metrics.inc("risk_rejections_total", rule=e.rule)
+                logger.warning("risk_rejected", account=account, instrument=instrument_key, side=side,
+                               quantity=quantity, rule=e.rule, reason=str(e))
+                raise
+            state.move(instrument_key, pending=sign * notional)
+            if sign > 0:
+                state.bought += notional
+            state.recent.append(time.monotonic())
+        metrics.observe("risk_check_seconds", time.perf_counter() - start)
+        return (account, instrument_key, sign, quantity, notional / quantity)
+
+    def _validate(self, state, key, sign, quantity, limit_price, reference_price):
+        limits = state.limits
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            raise RiskError("quantity", f"Quantity must be a positive whole number, got {quantity!r}")
+        if limits["max_quantity"] and quantity > limits["max_quantity"]:
+            raise RiskError("max_quantity", f"Quantity {quantity} exceeds the limit of {limits['max_quantity']} per order")
+
+        if limit_price is not None and reference_price:
+            band = limits["price_band_pct"]
+            off = abs(limit_price - reference_price) / reference_price * 100
+            if band and off > band:
+                raise RiskError("price_band", f"Limit price {limit_price} is {off:.1f}% from the market price "
+                                              f"{reference_price} (band {band}%)")
+        price = limit_price or reference_price
+        if not price or price <= 0:
+            raise RiskError("reference_price", "No market price available to value the order")
+        notional = quantity * price
+
+        if limits["max_order_value"] and notional > limits["max_order_value"]:
+            raise RiskError("max_order_value", f"Order value {notional:,.2f} exceeds the limit of "
+                                               f"{limits['max_order_value']:,.2f}")
+        before = state.exposure(key)
+        after = abs(state.value.get(key, 0.0) + state.pending.get(key, 0.0) + sign * notional)
+        if limits["max_position_value"] and after > before and after > limits["max_position_value"]:
+            raise RiskError("max_position_value", f"Position would be worth {after:,.2f}, over the limit of "
+                                                  f"{limits['max_position_value']:,.2f}")
+        total = state.total + after - before
+        if limits["max_total_exposure"] and after > before and total > limits["max_total_exposure"]:
+            raise RiskError("max_total_exposure", f"Total exposure would be {total:,.2f}, over the limit of "
+                                                  f"{limits['max_total_exposure']:,.2f}")
+        if sign > 0 and limits["max_daily_buy_value"] and state.bought + notional > limits["max_daily_buy_value"]:
+            raise RiskError("max_daily_buy_value", f"Buys today would total {state.bought + notional:,.2f}, over "
+                                                   f"the limit of {limits['max_daily_buy_value']:,.2f}")
+
+        rate = limits["max_orders_per_minute"]
+        if rate:
+            cutoff = time.monotonic() - RATE_WINDOW
+            while state.recent and state.recent[0] < cutoff:
+                state.recent.popleft()
+            if len(state.recent) >= rate:
+                raise RiskError("max_orders_per_minute", f"More than {rate} orders in the last minute")
+        return notional
+
+    # --- Reservations and fills ---
+
+    def bind(self, reservation, order_id):
+        """Ties a reservation to the order id it was placed as, so fills settle it."""
+        account, key, sign, quantity, price = reservation
+        with self._lock:
+            self._accounts[account].open[order_id] = [key, sign, quantity, price, 0, time.time()]
+        # Updates that arrived before the REST response returned
+        order = orders.get_book().get(order_id, account)
+        if order is not None:
+            self.on_order(order)
+
+    def release(self, reservation):
+        """Undoes a reservation whose order was never placed."""
+        account, key, sign, quantity, price = reservation
+        with self._lock:
+            state = self._accounts[account]
+            state.move(key, pending=-sign * quantity * price)
+            if sign > 0:
+                state.bought -= quantity * price
+            if state.recent:
+                state.recent.pop()
+
+    def on_order(self, order):
+        """Order book listener: settles fills and frees unfilled reservations."""
+        with self._lock:
+            state = self._accounts.get(order.get("account"))
+            entry = state.open.get(order["order_id"]) if state is not None else None
+            if entry is None:
+                return
+            key, sign, quantity, price, applied, _ = entry
+            filled = min(int(order.get("filled_quantity") or 0), quantity)
+            if filled > applied:
+                fill_price = order.get("average_price") or price
+                delta = filled - applied
+                state.move(key, value=sign * delta * fill_price, pending=-sign * delta * price, qty=sign * delta)
+                if sign > 0:
+                    state.bought += delta * (fill_price - price)
+                entry[4] = filled
+            if order.get("status") in orders.TERMINAL:
+                unfilled = quantity - entry[4]
+                if unfilled:
+                    state.move(key, pending=-sign * unfilled * price)
+                    if sign > 0:
+                        state.bought -= unfilled * price
+                del state.open[order["order_id"]]
+
+    def sweep(self, account=None, max_age=SETTLE_AFTER):
+        """
+        Settles reservations the order stream hasn't: orders open longer
+        than `max_age` are fetched over REST, and ones whose session has
+        closed are released if that fails. Throttled to once per
+        SWEEP_INTERVAL per account; returns how many orders were settled.
+        """
+        account = account or accounts.current()
+        now = time.time()
+        with self._lock:
+            state = self._accounts.get(account)
+            if state is None or not state.open or now - state.swept_at < SWEEP_INTERVAL:
+                return 0
+            state.swept_at = now
+            stale = [(order_id, entry[5]) for order_id, entry in state.open.items() if now - entry[5] >= max_age]
+        settled = 0
+        for order_id, placed in stale:
+            with accounts.use_account(account):
+                order = orders.fetch_order(order_id)
+            if "error" in order:
+                if not _session_over(placed):
+                    continue
+                # DAY orders lapse at the close; whatever didn't fill won't
+                logger.warning("risk_reservation_expired", account=account, order_id=order_id, error=order["error"])
+                order = {"order_id": order_id, "account": account, "status": "cancelled"}
+            self.on_order(order)
+            with self._lock:
+                settled += order_id not in state.open
+        if settled:
+            metrics.inc("risk_reservations_swept_total", settled)
+        return settled
+
+    # --- Inspection ---
+
+    def snapshot(self, account=None):
+        """Current exposure and counters for `account` (default: the current one)."""
+        account = account or accounts.current()
+        self._seed(account)
+        today = market_hours.now_ist().date()
+        with self._lock:
+            state = self._state(account)
+            state.roll(today)
+            positions = {key: {"quantity": state.qty.get(key, 0), "value": round(state.value.get(key, 0.0), 2),
+                               "pending": round(state.pending.get(key, 0.0), 2)}
+                         for key in set(state.value) | set(state.pending)}
+            return {"account": account, "total_exposure": round(state.total, 2),
+                    "bought_today": round(state.bought, 2), "open_orders": len(state.open),
+                    "orders_last_minute": len(state.recent), "positions": positions,
+                    "limits": dict(state.limits)}
+
+    def reset(self, account=None):
+        """Forgets an account's state (all accounts if None); it is reseeded from holdings on next use."""
+        with self._lock:
+            if account is None:
+                self._accounts.clear()
+            else:
+                self._accounts.pop(account, None)
+
+
+def _session_over(placed):
+    """True once the trading session an order placed at `placed` (epoch seconds) belongs to has closed."""
+    placed = datetime.datetime.fromtimestamp(placed, market_hours.IST)
+    session = placed.date() if placed.time() < market_hours.CLOSE else placed.date() + datetime.timedelta(days=1)
+    close = datetime.datetime.combine(session, market_hours.CLOSE, market_hours.IST)
+    return market_hours.now_ist() >= close
+
+
+def _holdings(account):
+    """The account's holdings, or None if they couldn't be fetched."""
+    # Imported here: trading imports this module
+    from . import trading
+    with accounts.use_account(account):
+        holdings = trading.get_portfolio()
+    if isinstance(holdings, dict):
+        logger.warning("risk_holdings_unavailable", account=account, error=holdings.get("error"))
+        return None
+    return holdings
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Returns the process-wide RiskEngine, subscribed to the order book."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = RiskEngine()
+                orders.get_book().listeners.append(engine.on_order)
+                _engine = engine
+    return _engine
+
+
+def set_engine(engine):
+    """Replaces the process-wide RiskEngine (subscribe it to the order book yourself)."""
+    global _engine
+    _engine = engine
@@ -0,0 +1,298 @@
+# src/screener.py
+"""
+Universe-wide stock screener.
+
+The universe is every EQ-series instrument in the bhavcopy. Quotes for all
+of it are fetched with market_data.get_quotes (500 keys per request, several
+requests in flight), turned into one DataFrame, and the user's filter is
+evaluated as whole-column operations:
+
+    screen("change_pct > 5 and volume_ratio > 1", csv_path, sort_by="change_pct")
+
+Columns that need daily history (20-day average volume, 52-week range) are
+only computed for the instruments that survive the quote-only part of the
+filter, so a typical scan costs a handful of quote requests.
+"""
+import io
+import time
+import tokenize
+from concurrent.futures import ThreadPoolExecutor
+
+from . import accounts, instruments, lazy, log, market_data, metrics
+
+np = lazy.lazy_import("numpy")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+# Columns available from a single quote snapshot
+QUOTE_COLUMNS = {
+    "last_price": "Last traded price",
+    "prev_close": "Previous session close",
+    "open": "Today's open",
+    "high": "Today's high",
+    "low": "Today's low",
+    "change": "Change from previous close",
+    "change_pct": "Percent change from previous close",
+    "gap_pct": "Percent gap of today's open over the previous close",
+    "range_pct": "Today's high-low range in percent of the previous close",
+    "volume": "Shares traded today",
+    "turnover": "last_price * volume",
+    "vwap": "Average traded price today",
+    "buy_sell_ratio": "Total buy quantity / total sell quantity in the order book",
+}
+# Columns derived from a year of daily candles, fetched only for candidates
+HISTORY_COLUMNS = {
+    "avg_volume_20d": "Average daily volume over the last 20 sessions",
+    "volume_ratio": "volume / avg_volume_20d",
+    "high_52w": "52-week high",
+    "low_52w": "52-week low",
+    "from_52w_high_pct": "Percent below the 52-week high (negative)",
+    "change_20d_pct": "Percent change over the last 20 sessions",
+}
+TEXT_COLUMNS = ("symbol", "isin", "instrument_key")
+
+# Upper bound on how many instruments get the history columns in one scan
+MAX_HISTORY_FETCHES = 200
+HISTORY_WORKERS = 8
+
+_KEYWORDS = {"and", "or", "not", "True", "False"}
+_OPERATORS = {"<", ">", "<=", ">=", "==", "!=", "(", ")", "+", "-", "*", "/", "&", "|", "~", "%"}
+
+_universe = None
+
+
+class FilterError(ValueError):
+    """The filter expression uses something other than columns, numbers and operators."""
+
+
+# --- Universe ---
+
+def get_universe(csv_path):
+    """DataFrame of symbol / isin / instrument_key for every EQ instrument in the bhavcopy."""
+    global _universe
+    index = instruments.get_index(csv_path)
+    if _universe is not None and _universe[0] is index:
+        return _universe[1]
+    series_idx = next((i for i, h in enumerate(index.headers) if h.upper() == "SERIES"), None)
+    symbols, isins = [], []
+    for row in index.rows:
+        if series_idx is not None and row[series_idx].strip() != "EQ":
+            continue
+        symbols.append(row[index.symbol_idx].strip().upper())
+        isins.append(row[index.isin_idx].strip())
+    frame = pd.DataFrame({"symbol": symbols, "isin": isins}).drop_duplicates("isin", ignore_index=True)
+    frame["instrument_key"] = "NSE_EQ|" + frame["isin"]
+    _universe = (index, frame)
+    return frame
+
+
+# --- Filter expressions ---
+
+def _tokens(expression):
+    try:
+        return [t for t in tokenize.generate_tokens(io.StringIO(expression).readline)
+                if t.type not in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER)]
+    except (tokenize.TokenError, IndentationError) as e:
+        raise FilterError(f"Could not parse filter: {e}")
+
+
+def parse_filter(expression):
+    """
+    Validates `expression` and splits it on top-level 'and' into clauses.
+    Returns (clauses, columns used). Raises FilterError.
+    """
+    allowed = set(QUOTE_COLUMNS) | set(HISTORY_COLUMNS) | set(TEXT_COLUMNS)
+    tokens = _tokens(expression)
+    if not tokens:
+        raise FilterError("Empty filter")
+    used = set()
+    depth = 0
+    splits = []
+    has_top_level_or = False
+    for tok in tokens:
+        if tok.type == tokenize.NAME:
+            if tok.string in _KEYWORDS:
+                if depth == 0 and tok.string == "and":
+                    splits.append(tok)
+                has_top_level_or |= depth == 0 and tok.string == "or"
+                continue
+            if tok.string not in allowed:
+                raise FilterError(f"Unknown column '{tok.string}'. Available: {', '.join(sorted(allowed))}")
+            used.add(tok.string)
+        elif tok.type == tokenize.OP:
+            if tok.string not in _OPERATORS:
+                raise FilterError(f"Operator '{tok.string}' is not allowed in filters")
+            depth += {"(": 1, ")": -1}.get(tok.string, 0)
+            has_top_level_or |= depth == 0 and tok.string == "|"
+        elif tok.type not in (tokenize.NUMBER, tokenize.STRING):
+            raise FilterError(f"Unexpected '{tok.string}' in filter")
+    if depth:
+        raise FilterError("Unbalanced parentheses in filter")
+
+    # Top-level 'or' ties the clauses together; keep them as one
+    if has_top_level_or or not splits:
+        return [expression.strip()], used
+    clauses, start = [], 0
+    for tok in splits:
+        clauses.append(expression[start:tok.start[1]].strip())
+        start = tok.end[1]
+    clauses.append(expression[start:].strip())
+    if not all(clauses):
+        raise FilterError("Empty clause in filter")
+    return clauses, used
+
+
+def _columns_in(clause):
+    return {t.string for t in _tokens(clause) if t.type == tokenize.NAME and t.string not in _KEYWORDS}
+
+
+def _apply(frame, clauses):
+    for clause in clauses:
+        if frame.empty:
+            break
+        try:
+            mask = frame.eval(clause)
+        except Exception as e:
+            raise FilterError(f"Could not evaluate '{clause}': {e}")
+        if not isinstance(mask, pd.Series) or mask.dtype != bool:
+            raise FilterError(f"'{clause}' is not a condition (use comparisons like change_pct > 2)")
+        frame = frame[mask]
+    return frame
+
+
+# --- Columns ---
+
+def quotes_frame(quotes):
+    """Vectorised quote columns for {instrument_key: quote} as returned by market_data.get_quotes."""
+    keys = list(quotes)
+    values = [quotes[k] for k in keys]
+
+    def column(field, sub=None):
+        if sub:
+            return np.array([(q.get(field) or {}).get(sub) or np.nan for q in values], dtype=float)
+        return np.array([q.get(field) if q.get(field) is not None else np.nan for q in values], dtype=float)
+
+    last = column("last_price")
+    change = column("net_change")
+    prev = last - change
+    volume = column("volume")
+    buy, sell = column("total_buy_quantity"), column("total_sell_quantity")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame = pd.DataFrame({
+            "instrument_key": keys,
+            "last_price": last,
+            "prev_close": prev,
+            "open": column("ohlc", "open"),
+            "high": column("ohlc", "high"),
+            "low": column("ohlc", "low"),
+            "change": change,
+            "change_pct": change / prev * 100,
+            "volume": volume,
+            "turnover": last * volume,
+            "vwap": column("average_price"),
+            "buy_sell_ratio": buy / sell,
+        })
+        frame["gap_pct"] = (frame["open"] - prev) / prev * 100
+        frame["range_pct"] = (frame["high"] - frame["low"]) / prev * 100
+    return frame.replace([np.inf, -np.inf], np.nan)
+
+
+def _history_row(instrument_key):
+    # One year is the most a single daily-candle request returns; it also shares the prefetcher's cache entry
+    candles = market_data.get_candles(instrument_key, interval="day", days=market_data.DAILY_BASE_DAYS)
+    if isinstance(candles, dict) or candles.empty:
+        return None
+    volume = candles["volume"].to_numpy(dtype=float)
+    close = candles["close"].to_numpy(dtype=float)
+    last_year = candles.iloc[-252:]
+    return {
+        "instrument_key": instrument_key,
+        "avg_volume_20d": volume[-20:].mean(),
+        "high_52w": float(last_year["high"].max()),
+        "low_52w": float(last_year["low"].min()),
+        "close_20d_ago": close[-21] if len(close) > 20 else np.nan,
+    }
+
+
+def add_history_columns(frame):
+    """Adds HISTORY_COLUMNS to `frame` (one cached daily-candle request per row)."""
+    keys = frame["instrument_key"].tolist()
+    with ThreadPoolExecutor(max_workers=HISTORY_WORKERS) as pool:
+        rows = [row for row in pool.map(accounts.propagate(_history_row), keys) if row]
+    history = pd.DataFrame(rows, columns=["instrument_key", "avg_volume_20d", "high_52w", "low_52w", "close_20d_ago"])
+    frame = frame.merge(history, on="instrument_key", how="left")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["volume_ratio"] = frame["volume"] / frame["avg_volume_20d"]
+        frame["from_52w_high_pct"] = (frame["last_price"] / frame["high_52w"] - 1) * 100
+        frame["change_20d_pct"] = (frame["last_price"] / frame["close_20d_ago"] - 1) * 100
+    return frame.drop(columns="close_20d_ago").replace([np.inf, -np.inf], np.nan)
+
+
+# --- Screening ---
+
+@metrics.timed("screener_seconds")
+def screen(expression, csv_path, sort_by="change_pct", ascending=False, limit=20):
+    """
+    Runs `expression` over the universe in the bhavcopy at `csv_path` and returns the top `limit`
+    matches ordered by `sort_by`, or {'error': ...}.
+    """
+    start = time.perf_counter()
+    try:
+        clauses, used = parse_filter(expression)
+    except FilterError as e:
+        return {"error": str(e)}
+    if sort_by not in QUOTE_COLUMNS and sort_by not in HISTORY_COLUMNS:
+        return {"error": f"Cannot sort by '{sort_by}'. Available: {', '.join(sorted({**QUOTE_COLUMNS, **HISTORY_COLUMNS}))}"}
+
+    try:
+        universe = get_universe(csv_path)
+    except FileNotFoundError:
+        return {"error": f"Instrument list not found at {csv_path}"}
+    except instruments.CsvFormatError as e:
+        return {"error": str(e)}
+
+    quotes = market_data.get_quotes(universe["instrument_key"].tolist())
+    if "error" in quotes:
+        return quotes
+    frame = universe.merge(quotes_frame(quotes), on="instrument_key", how="inner")
+
+    quote_clauses = [c for c in clauses if not _columns_in(c) & set(HISTORY_COLUMNS)]
+    history_clauses = [c for c in clauses if c not in quote_clauses]
+    note = None
+    partial = False
+    try:
+        frame = _apply(frame, quote_clauses)
+        if history_clauses or sort_by in HISTORY_COLUMNS:
+            if len(frame) > MAX_HISTORY_FETCHES:
+                # Keep the most liquid candidates rather than fetching history for everything
+                note = (f"{len(frame)} stocks passed the quote filters; history columns were computed "
+                        f"for the {MAX_HISTORY_FETCHES} with the highest turnover")
+                frame = frame.nlargest(MAX_HISTORY_FETCHES, "turnover")
+                partial = True
+            frame = add_history_columns(frame)
+            frame = _apply(frame, history_clauses)
+    except FilterError as e:
+        return {"error": str(e)}
+
+    matched = len(frame)
+    top = frame.sort_values(sort_by, ascending=ascending, na_position="last").head(max(1, min(int(limit), 100)))
+    columns = ["symbol", "instrument_key", "last_price", "change_pct", "volume"]
+    columns += [c for c in sorted(used | {sort_by}) if c not in columns and c in top.columns]
+    results = top[columns].round(2).astype(object).where(top[columns].notna(), None).to_dict("records")
+
+    elapsed = time.perf_counter() - start
+    logger.info("screen", filter=expression, universe=len(universe), quoted=len(quotes),
+                matched=matched, partial=partial, seconds=round(elapsed, 3))
+    result = {
+        "filter": expression, "sort_by": sort_by, "universe": len(universe), "quoted": len(quotes),
+        "results": results, "elapsed_seconds": round(elapsed, 2),
+    }
+    if partial:
+        # Only the checked candidates are counted; more may match
+        result.update(partial=True, matched_at_least=matched)
+    else:
+        result["matched"] = matched
+    if note:
+        result["note"] = note
+    return result
@@ -0,0 +1,345 @@
+# src/snapshot.py
+"""
+Warm restarts: the in-memory caches are written to one snapshot file every
+few minutes and at exit, and loaded back at startup, so the first questions
+after a redeploy or crash don't all go to the network.
+
+Covered: quotes, daily/intraday candles, holdings per account, FMP ISIN
+results, Gemini context-cache names and today's order book. The instrument
+index has its own on-disk snapshot (src/instruments.py) and is just loaded.
+
+File layout (little-endian), data/snapshot/cache.snap:
+
+    header    magic "TGPTSNAP", format version, section count, created at (unix time)
+    table     per section: name (16 bytes), offset, length, CRC-32
+    sections  each starting on a 64-byte boundary
+                candles.values  float64 [rows x 5] open/high/low/close/volume
+                candles.ts      fixed-width ASCII timestamps, one per row
+                other sections  compact JSON
+
+The candle arrays are read straight from a memory map (numpy.frombuffer),
+so restoring thousands of frames doesn't parse text. A snapshot is ignored
+when the magic, version or any section's CRC doesn't match, or when it is
+older than TRADEGPT_SNAPSHOT_MAX_AGE seconds (default 12 h); individual
+entries are only restored while their cache TTL hasn't run out, candles
+only for ranges ending today and orders only from today's session.
+"""
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from . import lazy, log, market_data, market_hours, metrics, orders, paths, trading
+
+np = lazy.lazy_import("numpy")
+pd = lazy.lazy_import("pandas")
+
+logger = log.get_logger(__name__)
+
+MAGIC = b"TGPTSNAP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sHHd")
+ENTRY = struct.Struct("<16sQQI")
+ALIGN = 64
+
+# Seconds between periodic saves, and the oldest snapshot worth restoring
+SAVE_INTERVAL = 300.0
+MAX_AGE = 12 * 3600.0
+
+CANDLE_VALUES = ["open", "high", "low", "close", "volume"]
+
+
+class SnapshotError(ValueError):
+    """The snapshot file is missing, corrupt or from another format version."""
+
+
+def default_path():
+    return os.path.join(paths.data_dir("snapshot"), "cache.snap")
+
+
+# --- File format ---
+
+def write_sections(path, sections, created_at=None):
+    """Writes {name: bytes} as a snapshot file (atomically); returns its size."""
+    created_at = time.time() if created_at is None else created_at
+    names = list(sections)
+    offset = HEADER.size + ENTRY.size * len(names)
+    table, layout = [], []
+    for name in names:
+        offset += -offset % ALIGN
+        payload = sections[name]
+        table.append(ENTRY.pack(name.encode()[:16], offset, len(payload), zlib.crc32(payload)))
+        layout.append((offset, payload))
+        offset += len(payload)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(names), created_at))
+        f.write(b"".join(table))
+        for start, payload in layout:
+            f.write(b"\0" * (start - f.tell()))
+            f.write(payload)
+    os.replace(tmp, path)
+    return offset
+
+
+class SnapshotFile:
+    """A validated, memory-mapped snapshot; sections are zero-copy memoryviews."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise SnapshotError("truncated header")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count, self.created_at = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise SnapshotError("not a snapshot file")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"format version {version}, expected {FORMAT_VERSION}")
+            if HEADER.size + ENTRY.size * count > size:
+                raise SnapshotError("truncated section table")
+            self.sections = {}
+            self._view = view = memoryview(self._map)
+            for i in range(count):
+                raw, offset, length, crc = ENTRY.unpack_from(self._map, HEADER.size + ENTRY.size * i)
+                name = raw.rstrip(b"\0").decode()
+                if offset + length > size:
+                    raise SnapshotError(f"section {name} runs past the end of the file")
+                self.sections[name] = payload = view[offset:offset + length]
+                if zlib.crc32(payload) != crc:
+                    raise SnapshotError(f"section {name} failed its checksum")
+        except (SnapshotError, struct.error):
+            self.close()
+            raise
+
+    def json(self, name, default=None):
+        payload = self.sections.get(name)
+        return default if payload is None else json.loads(bytes(payload))
+
+    def close(self):
+        sections, self.sections = getattr(self, "sections", {}), {}
+        for payload in sections.values():
+            payload.release()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+        self._map.close()
+
+
+def _json(data):
+    return json.dumps(data, separators=(",", ":"), default=str).encode()
+
+
+# --- Collect / apply ---
+
+def _cache_entries(ttl_cache, now):
+    """[key, value, expires at (unix time)] for a TTLCache's live entries."""
+    return [[key, value, now + left] for key, value, left in ttl_cache.items()]
+
+
+def collect():
+    """Serializes every covered cache; returns ({section: bytes}, entry counts)."""
+    now = time.time()
+    sections, counts = {}, {}
+
+    quotes = _cache_entries(market_data._quote_cache, now)
+    sections["quotes"] = _json(quotes)
+    counts["quotes"] = len(quotes)
+
+    holdings = _cache_entries(trading._holdings_cache, now)
+    sections["holdings"] = _json(holdings)
+    counts["holdings"] = len(holdings)
+
+    from . import gemini  # imported here: heavy, and only needed once the caches exist
+    isin = [[list(key), value, expires] for key, value, expires in _cache_entries(gemini._isin_cache, now)]
+    sections["isin"] = _json(isin)
+    counts["isin"] = len(isin)
+
+    prompts = [[model, None if names is None else sorted(names), entry[0], entry[1]]
+               for (model, names), entry in list(gemini._prompt_caches.items()) if entry and entry[1] > now]
+    sections["prompt_caches"] = _json(prompts)
+    counts["prompt_caches"] = len(prompts)
+
+    saved_orders = orders.get_book().export()
+    sections["orders"] = _json(saved_orders)
+    counts["orders"] = len(saved_orders)
+
+    candles = _cache_entries(market_data._candle_cache, now)
+    if candles:
+        index, values, stamps = [], [], []
+        row = 0
+        for key, frame, expires in candles:
+            rows = len(frame)
+            index.append([list(key), expires, row, rows, str(frame["volume"].dtype)])
+            values.append(frame[CANDLE_VALUES].to_numpy(dtype="<f8"))
+            stamps.extend(frame["timestamp"].astype(str))
+            row += rows
+        stamps = np.array(stamps, dtype="S") if stamps else np.zeros(0, dtype="S1")
+        sections["candles.index"] = _json({"width": stamps.dtype.itemsize, "frames": index})
+        sections["candles.values"] = np.ascontiguousarray(np.concatenate(values)).tobytes()
+        sections["candles.ts"] = stamps.tobytes()
+    counts["candles"] = len(candles)
+    return sections, counts
+
+
+def apply(snap):
+    """Loads a SnapshotFile's entries into the caches; returns counts restored."""
+    now = time.time()
+    counts = {}
+
+    def load(ttl_cache, entries, key=lambda k: k):
+        restored = 0
+        for cache_key, value, expires in entries:
+            if expires > now:
+                ttl_cache.set(key(cache_key), value, ttl=expires - now)
+                restored += 1
+        return restored
+
+    counts["quotes"] = load(market_data._quote_cache, snap.json("quotes", []))
+    counts["holdings"] = load(trading._holdings_cache, snap.json("holdings", []))
+
+    from . import gemini
+    counts["isin"] = load(gemini._isin_cache, snap.json("isin", []), key=tuple)
+    prompts = 0
+    for model, names, name, expires in snap.json("prompt_caches", []):
+        if expires > now + 60:
+            gemini._prompt_caches[(model, None if names is None else frozenset(names))] = (name, expires)
+            prompts += 1
+    counts["prompt_caches"] = prompts
+
+    today = market_hours.now_ist().date()
+    session = [o for o in snap.json("orders", [])
+               if datetime.datetime.fromtimestamp(o.get("created_at", 0), market_hours.IST).date() == today]
+    counts["orders"] = orders.get_book().restore(session)
+
+    counts["candles"] = _apply_candles(snap, now)
+    return counts
+
+
+def _apply_candles(snap, now):
+    index = snap.json("candles.index")
+    if not index or not index["frames"]:
+        return 0
+    values = np.frombuffer(snap.sections["candles.values"], dtype="<f8").reshape(-1, len(CANDLE_VALUES))
+    stamps = np.frombuffer(snap.sections["candles.ts"], dtype=f"S{index['width']}")
+    today = datetime.date.today().isoformat()
+    restored = 0
+    for key, expires, start, rows, volume_dtype in index["frames"]:
+        # Keys end with the range's to_date; older ranges would never be looked up again
+        if expires <= now or key[-1] != today:
+            continue
+        frame = pd.DataFrame(values[start:start + rows], columns=CANDLE_VALUES, copy=True)
+        frame.insert(0, "timestamp", stamps[start:start + rows].astype(str))
+        if volume_dtype != "float64":
+            frame["volume"] = frame["volume"].astype(volume_dtype)
+        market_data._candle_cache.set(tuple(key), frame, ttl=expires - now)
+        restored += 1
+    del values, stamps  # views into the map must go before it is closed
+    return restored
+
+
+# --- Save / restore ---
+
+def save(path=None):
+    """Writes a snapshot of the caches; returns counts, size and time taken."""
+    path = path or default_path()
+    start = time.perf_counter()
+    with metrics.timer("snapshot_seconds", op="save"):
+        sections, counts = collect()
+        size = write_sections(path, sections)
+    stats = dict(counts, bytes=size, seconds=round(time.perf_counter() - start, 3))
+    logger.info("snapshot_saved", path=path, **stats)
+    return stats
+
+
+def restore(path=None, csv_path=None, max_age=None):
+    """
+    Loads a snapshot into the caches (and the instrument index for
+    `csv_path`). Returns counts restored, or {"skipped": reason}.
+    """
+    path = path or default_path()
+    max_age = float(os.environ.get("TRADEGPT_SNAPSHOT_MAX_AGE", MAX_AGE)) if max_age is None else max_age
+    start = time.perf_counter()
+    if csv_path:
+        from . import instruments
+        try:
+            instruments.get_index(csv_path)
+        except (OSError, instruments.CsvFormatError) as e:
+            logger.warning("snapshot_index_failed", path=csv_path, error=str(e))
+    try:
+        snap = SnapshotFile(path)
+    except FileNotFoundError:
+        return {"skipped": "no snapshot"}
+    except (OSError, SnapshotError) as e:
+        logger.warning("snapshot_invalid", path=path, error=str(e))
+        return {"skipped": f"invalid snapshot: {e}"}
+    try:
+        age = time.time() - snap.created_at
+        if age > max_age:
+            logger.info("snapshot_stale", path=path, age=round(age))
+            return {"skipped": f"snapshot is {age / 3600:.1f} h old"}
+        with metrics.timer("snapshot_seconds", op="restore"):
+            try:
+                counts = apply(snap)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning("snapshot_invalid", path=path, error=str(e))
+                return {"skipped": f"invalid snapshot: {e}"}
+    finally:
+        snap.close()
+    stats = dict(counts, age=round(age), seconds=round(time.perf_counter() - start, 3))
+    logger.info("snapshot_restored", path=path, **stats)
+    return stats
+
+
+class Snapshotter:
+    """Saves a snapshot every `interval` seconds on a daemon thread, and once more on stop()."""
+
+    def __init__(self, path=None, interval=SAVE_INTERVAL):
+        self.path = path or default_path()
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the thread and writes a final snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.save()
+
+    def save(self):
+        try:
+            return save(self.path)
+        except Exception:
+            logger.error("snapshot_save_failed", path=self.path, exc_info=True)
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.save()
+
+
+def start_from_config(csv_path=None):
+    """
+    Restores the last snapshot and starts periodic saves unless
+    TRADEGPT_SNAPSHOT=0; returns (Snapshotter or None, restore stats).
+    """
+    if os.environ.get("TRADEGPT_SNAPSHOT", "1") == "0":
+        return None, {"skipped": "disabled"}
+    stats = restore(csv_path=csv_path)
+    snapshotter = Snapshotter(interval=float(os.environ.get("TRADEGPT_SNAPSHOT_INTERVAL", SAVE_INTERVAL)))
+    snapshotter.start()
+    return snapshotter, stats
@@ -0,0 +1,71 @@
+# src/startup.py
+"""
+Cold-start profiler for the CLI entry points.
+
+    python -m src.startup                  # main, set_token, auth_setup
+    python -m src.startup main --deferred  # also import what src.lazy defers
+    python -m src.startup --top 25 src.gemini
+
+Each target is imported in a fresh interpreter under `-X importtime`;
+the report lists total import time plus the most expensive modules by
+self time and the heaviest top-level packages by cumulative time.
+"""
+import argparse
+import re
+import subprocess
+import sys
+import os
+
+DEFAULT_TARGETS = ["main", "set_token", "auth_setup"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(target, deferred=False):
+    """Imports `target` in a subprocess and returns [(self_us, cumulative_us, depth, module)]."""
+    code = f"import {target}"
+    if deferred:
+        code += "; from src import lazy; lazy.preload()"
+    root = os.path.join(os.path.dirname(__file__), '..')
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=root)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{proc.stderr[-2000:]}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, module))
+    return entries
+
+
+def report(target, entries, top=15):
+    total_us = sum(self_us for self_us, _, _, _ in entries)
+    lines = [f"== {target}: {total_us / 1000:.1f} ms import time, {len(entries)} modules"]
+    packages = {}
+    for self_us, _, _, module in entries:
+        root = module.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    lines.append("  heaviest packages (sum of self time):")
+    for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"    {us / 1000:9.1f} ms  {name}")
+    lines.append("  slowest modules (self time):")
+    for self_us, _, _, module in sorted(entries, reverse=True)[:top]:
+        lines.append(f"    {self_us / 1000:9.1f} ms  {module}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--deferred", action="store_true", help="Also load modules deferred by src.lazy")
+    args = parser.parse_args(argv)
+    for target in args.targets:
+        print(report(target, profile(target, args.deferred), args.top))
+        print()
+
+
+if __name__ == "__main__":
+    main()
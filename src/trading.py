@@ -1,12 +1,40 @@
-from upstox_client import OrderApi, PortfolioApi
-from upstox_client.rest import ApiException
 from . import auth
+from . import accounts
 from . import market_data
+from . import metrics
+from . import log
+from . import lazy
+from . import cache
+from . import market_hours
+from . import orders
+from . import risk
+
+upstox_client = lazy.lazy_import("upstox_client")
+
+logger = log.get_logger(__name__)
+
+# Holdings from get_portfolio() per account; dropped whenever that account places an order
+_holdings_cache = cache.TTLCache("holdings", maxsize=256, ttl=60)
+
+# Seconds holdings stay cached while the market is open / closed
+HOLDINGS_TTL_OPEN = 60
+HOLDINGS_TTL_CLOSED = 1800
 
 class TradingAPI:
     def __init__(self, api_client):
-        self.api = OrderApi(api_client)
-        self.portfolio_api = PortfolioApi(api_client)
+        self.api = upstox_client.OrderApi(api_client)
+        self.portfolio_api = upstox_client.PortfolioApi(api_client)
+
+def _pre_trade_check(symbol, side, quantity, price, order_type, reference_price=None):
+    """Runs the risk checks; returns (reservation, None) or (None, error dict)"""
+    if reference_price is None:
+        reference_price = market_data.get_current_price(symbol)
+        if not isinstance(reference_price, (int, float)):
+            reference_price = None
+    try:
+        return risk.get_engine().check(symbol, side, quantity, price, reference_price, order_type), None
+    except risk.RiskError as e:
+        return None, {"error": f"Risk check failed: {e}", "rule": e.rule}
 
 def place_buy_order(symbol, quantity, price=0.0, order_type="MARKET"):
     """Place a buy order for a given symbol with a given quantity"""
@@ -14,18 +42,21 @@ def place_buy_order(symbol, quantity, price=0.0, order_type="MARKET"):
     if(order_type == "LIMIT"):
         price = market_data.get_current_price(symbol)
         if isinstance(price, dict) and "error" in price:
-            # Print the detailed error message from the function
-            print(f"❌ Failed to get current price: {price['error']}")
+            logger.warning("limit_price_unavailable", symbol=symbol, error=price['error'])
             return False
         # Check if price is a valid number before proceeding
         if not isinstance(price, (int, float)):
-            print(f"❌ Received invalid price data: {price}")
+            logger.warning("limit_price_invalid", symbol=symbol, price=price)
             return False
 
-    print(f"✅ Current price retrieved: ₹{price:.2f}") # Format price for display
     if not api_client:
         return {"error": "Authentication required"}
 
+    reservation, rejected = _pre_trade_check(symbol, "BUY", quantity, price, order_type,
+                                             reference_price=price if order_type == "LIMIT" else None)
+    if rejected:
+        return rejected
+
     trading_api = TradingAPI(api_client)
 
     try:
@@ -49,17 +80,29 @@ def place_buy_order(symbol, quantity, price=0.0, order_type="MARKET"):
         #else:
          #   order_request["price"] = 0.0
         total_cost = price * quantity
-        print(f"Total cost would be: ₹{total_cost:.2f}, {order_type} order")
+        logger.debug("order_cost", symbol=symbol, total_cost=total_cost, order_type=order_type)
         # Place order
-        response = trading_api.api.place_order(order_request, api_version="2.0")
+        with metrics.timer("upstox_request_seconds", endpoint="place_order"):
+            response = trading_api.api.place_order(order_request, api_version="2.0")
+        _holdings_cache.invalidate(accounts.current())
+        # Status changes and fills arrive on the order stream from here on
+        risk.get_engine().bind(reservation, response.data.order_id)
+        reservation = None
+        orders.get_book().register(response.data.order_id, instrument_token=symbol, transaction_type="BUY",
+                                   quantity=quantity, order_type=order_type, price=price)
+        orders.ensure_feed()
         return {
             "status": "success",
             "order_id": response.data.order_id,
             "message": f"Buy order placed for {quantity} shares of {symbol}"
         }
 
-    except ApiException as e:
+    except upstox_client.rest.ApiException as e:
         return {"error": f"Exception when calling TradingApi: {e}"}
+    finally:
+        # Not bound to an order id: the order wasn't placed (or its id never came back)
+        if reservation is not None:
+            risk.get_engine().release(reservation)
 
 def place_sell_order(symbol, quantity, price=None, order_type="MARKET"):
     """Place a sell order for a given symbol"""
@@ -67,6 +110,10 @@ def place_sell_order(symbol, quantity, price=None, order_type="MARKET"):
     if not api_client:
         return {"error": "Authentication required"}
 
+    reservation, rejected = _pre_trade_check(symbol, "SELL", quantity, price, order_type)
+    if rejected:
+        return rejected
+
     trading_api = TradingAPI(api_client)
 
     try:
@@ -88,18 +135,34 @@ def place_sell_order(symbol, quantity, price=None, order_type="MARKET"):
             order_request["price"] = price
 
         # Place order
-        response = trading_api.api.place_order(order_request, api_version="2.0")
+        with metrics.timer("upstox_request_seconds", endpoint="place_order"):
+            response = trading_api.api.place_order(order_request, api_version="2.0")
+        _holdings_cache.invalidate(accounts.current())
+        # Status changes and fills arrive on the order stream from here on
+        risk.get_engine().bind(reservation, response.data.order_id)
+        reservation = None
+        orders.get_book().register(response.data.order_id, instrument_token=symbol, transaction_type="SELL",
+                                   quantity=quantity, order_type=order_type, price=price)
+        orders.ensure_feed()
         return {
             "status": "success",
             "order_id": response.data.order_id,
             "message": f"Sell order placed for {quantity} shares of {symbol}"
         }
 
-    except ApiException as e:
+    except upstox_client.rest.ApiException as e:
         return {"error": f"Exception when calling TradingApi: {e}"}
+    finally:
+        # Not bound to an order id: the order wasn't placed (or its id never came back)
+        if reservation is not None:
+            risk.get_engine().release(reservation)
 
-def get_portfolio():
+def get_portfolio(refresh=False):
     """Get current portfolio holdings"""
+    holdings = None if refresh else _holdings_cache.get(accounts.current())
+    if holdings is not None:
+        return list(holdings)
+
     api_client = auth.get_upstox_client()
     if not api_client:
         return {"error": "Authentication required"}
@@ -107,7 +170,8 @@ def get_portfolio():
     trading_api = TradingAPI(api_client)
 
     try:
-        response = trading_api.portfolio_api.get_holdings(api_version="2.0")
+        with metrics.timer("upstox_request_seconds", endpoint="get_holdings"):
+            response = trading_api.portfolio_api.get_holdings(api_version="2.0")
         holdings = []
 
         for holding in response.data:
@@ -117,10 +181,13 @@ def get_portfolio():
                 "average_price": holding.average_price,
                 "last_price": holding.last_price,
                 "pnl": holding.pnl,
-                "exchange": holding.exchange
+                "exchange": holding.exchange,
+                "instrument_token": holding.instrument_token
             })
 
-        return holdings
+        ttl = HOLDINGS_TTL_CLOSED if market_hours.phase() == "closed" else HOLDINGS_TTL_OPEN
+        _holdings_cache.set(accounts.current(), holdings, ttl=ttl)
+        return list(holdings)
 
-    except ApiException as e:
+    except upstox_client.rest.ApiException as e:
         return {"error": f"Exception when calling PortfolioApi: {e}"} 
\ No newline at end of file
@@ -0,0 +1,131 @@
+# tests/test_alerts.py
+"""Alert crossing, persistence, per-account polling and market-hours gating."""
+import time
+
+import pytest
+
+from src import accounts, alerts, market_hours
+
+
+class Quotes:
+    """Quote source returning fixed prices and recording which account asked."""
+
+    def __init__(self, prices=None):
+        self.prices = prices or {}
+        self.calls = []
+
+    def __call__(self, keys):
+        self.calls.append((accounts.current(), sorted(keys)))
+        return {key: {"last_price": self.prices[key]} for key in keys if key in self.prices}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / "alerts.json")
+
+
+def test_book_fires_only_crossed_thresholds():
+    book = alerts.AlertBook()
+    book.add("above", 110.0, "a110")
+    book.add("above", 105.0, "a105")
+    book.add("below", 90.0, "b90")
+    book.add("below", 95.0, "b95")
+    assert book.crossed(100.0) == []
+    assert sorted(book.crossed(105.0)) == ["a105"]
+    assert sorted(book.crossed(95.0)) == ["b95"]
+    assert sorted(book.crossed(200.0)) == ["a110"]
+    assert len(book) == 1
+    assert book.crossed(1.0) == ["b90"]
+    assert len(book) == 0
+
+
+def test_book_remove_picks_the_right_id_among_equal_prices():
+    book = alerts.AlertBook()
+    book.add("above", 100.0, "x")
+    book.add("above", 100.0, "y")
+    assert book.remove("above", 100.0, "y")
+    assert not book.remove("above", 100.0, "y")
+    assert book.crossed(100.0) == ["x"]
+
+
+def test_engine_triggers_and_notifies(store):
+    engine = alerts.AlertEngine(path=store, quote_source=Quotes())
+    fired = []
+    engine.listeners.append(fired.append)
+    up = engine.add("NSE_EQ|A", 1500, "above", symbol="INFY")
+    down = engine.add("NSE_EQ|A", 1400, "below")
+
+    assert engine.on_price("NSE_EQ|A", 1450.0) == []
+    triggered = engine.on_price("NSE_EQ|A", 1500.0)
+    assert [a["id"] for a in triggered] == [up["id"]]
+    assert triggered[0]["status"] == "triggered" and triggered[0]["triggered_price"] == 1500.0
+    assert fired == triggered
+    # Fired once only
+    assert engine.on_price("NSE_EQ|A", 1600.0) == []
+    assert [a["id"] for a in engine.list()] == [down["id"]]
+    assert [a["id"] for a in engine.list("triggered")] == [up["id"]]
+
+
+def test_add_validates(store):
+    engine = alerts.AlertEngine(path=store, quote_source=Quotes())
+    with pytest.raises(ValueError):
+        engine.add("NSE_EQ|A", 100, "sideways")
+    with pytest.raises(ValueError):
+        engine.add("NSE_EQ|A", 0, "above")
+
+
+def test_alerts_survive_a_restart(store):
+    engine = alerts.AlertEngine(path=store, quote_source=Quotes())
+    kept = engine.add("NSE_EQ|A", 100, "above")
+    gone = engine.add("NSE_EQ|B", 50, "below")
+    engine.cancel(gone["id"])
+    engine.flush()
+
+    reloaded = alerts.AlertEngine(path=store, quote_source=Quotes())
+    assert [a["id"] for a in reloaded.list()] == [kept["id"]]
+    assert [a["id"] for a in reloaded.list("cancelled")] == [gone["id"]]
+    assert [a["id"] for a in reloaded.on_price("NSE_EQ|A", 101.0)] == [kept["id"]]
+
+
+def test_accounts_see_and_cancel_only_their_alerts(store):
+    engine = alerts.AlertEngine(path=store, quote_source=Quotes())
+    with accounts.use_account("alice"):
+        mine = engine.add("NSE_EQ|A", 100, "above")
+    with accounts.use_account("bob"):
+        assert engine.list() == []
+        assert engine.cancel(mine["id"]) is None
+    with accounts.use_account("alice"):
+        assert engine.cancel(mine["id"])["status"] == "cancelled"
+
+
+def test_check_polls_each_account_for_its_instruments(store):
+    quotes = Quotes({"NSE_EQ|A": 100.0, "NSE_EQ|B": 100.0})
+    engine = alerts.AlertEngine(path=store, quote_source=quotes)
+    engine.add("NSE_EQ|A", 99, "below")
+    with accounts.use_account("alice"):
+        hit = engine.add("NSE_EQ|B", 90, "above")
+        engine.add("NSE_EQ|A", 120, "above")
+    fired = engine.check()
+    assert [a["id"] for a in fired] == [hit["id"]]
+    # An instrument alerted by two accounts is fetched once
+    assert sorted(quotes.calls) == [("alice", ["NSE_EQ|B"]), (accounts.DEFAULT_ACCOUNT, ["NSE_EQ|A"])]
+
+
+def test_polling_waits_for_market_hours(store, monkeypatch):
+    quotes = Quotes({"NSE_EQ|A": 100.0})
+    engine = alerts.AlertEngine(path=store, interval=0.01, quote_source=quotes)
+    engine.add("NSE_EQ|A", 200, "above")
+    is_open = {"value": False}
+    monkeypatch.setattr(market_hours, "is_open", lambda now=None: is_open["value"])
+    monkeypatch.setattr(market_hours, "seconds_until_change", lambda now=None: 0.01)
+    engine.start()
+    try:
+        time.sleep(0.1)
+        assert quotes.calls == []
+        is_open["value"] = True
+        deadline = time.time() + 5
+        while not quotes.calls and time.time() < deadline:
+            time.sleep(0.01)
+        assert quotes.calls
+    finally:
+        engine.stop(timeout=5)
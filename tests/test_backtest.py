@@ -0,0 +1,91 @@
+# tests/test_backtest.py
+"""P&L math of backtest.simulate on hand-checkable price paths."""
+import numpy as np
+import pytest
+
+from src import backtest
+
+
+def ohlc(close, open_=None, high=None, low=None):
+    close = np.asarray(close, dtype=float)
+    open_ = close if open_ is None else np.asarray(open_, dtype=float)
+    high = np.maximum(open_, close) if high is None else np.asarray(high, dtype=float)
+    low = np.minimum(open_, close) if low is None else np.asarray(low, dtype=float)
+    return np.vstack([open_, high, low, close])
+
+
+def test_long_trade_without_fees():
+    prices = ohlc([100, 100, 110, 121, 121])
+    # Enter on bar 1's close, exit on bar 3's close
+    result = backtest.simulate(prices, np.array([0, 1, 1, 0, 0]), fee_bps=0)
+    assert result["trades"] == 1
+    assert result["total_return_pct"] == 21.0
+    assert result["pnl"] == 21000.0
+    assert result["final_equity"] == 121000.0
+    assert result["avg_trade_pct"] == 21.0
+    assert result["win_rate_pct"] == 100.0
+    assert result["exposure_pct"] == 40.0
+    assert result["max_drawdown_pct"] == 0.0
+    assert result["buy_and_hold_pct"] == 21.0
+
+
+def test_fees_charged_on_entry_and_exit():
+    prices = ohlc([100, 100, 110, 121, 121])
+    result = backtest.simulate(prices, np.array([0, 1, 1, 0, 0]), fee_bps=10)
+    equity = 1.21 * 0.999 ** 2
+    assert result["final_equity"] == pytest.approx(100000 * equity, abs=0.01)
+    assert result["avg_trade_pct"] == round((equity - 1) * 100, 2)
+    # 0.1% of 100,000 on entry, 0.1% of the 120,879 held at the exit
+    assert result["fees_paid"] == pytest.approx(100 + 0.001 * 121000 * 0.999, abs=0.01)
+
+
+def test_losing_trade_and_drawdown():
+    prices = ohlc([100, 100, 80, 90])
+    result = backtest.simulate(prices, np.array([0, 1, 1, 1]), fee_bps=0)
+    # A signal still on at the end is closed on the last bar
+    assert result["trades"] == 1
+    assert result["total_return_pct"] == -10.0
+    assert result["max_drawdown_pct"] == -20.0
+    assert result["win_rate_pct"] == 0.0
+
+
+def test_stop_loss_exits_at_the_stop():
+    prices = ohlc([100, 100, 97, 120], low=[100, 100, 94, 97], open_=[100, 100, 99, 97])
+    result = backtest.simulate(prices, np.array([0, 1, 1, 1]), stop_loss=0.05, fee_bps=0)
+    assert result["stopped_trades"] == 1
+    assert result["total_return_pct"] == -5.0
+
+
+def test_stop_loss_gap_fills_at_the_open():
+    prices = ohlc([100, 100, 92, 120], low=[100, 100, 90, 92], open_=[100, 100, 91, 92])
+    result = backtest.simulate(prices, np.array([0, 1, 1, 1]), stop_loss=0.05, fee_bps=0)
+    assert result["total_return_pct"] == -9.0
+
+
+def test_take_profit_exits_at_the_target():
+    prices = ohlc([100, 100, 104, 100], high=[100, 100, 111, 104])
+    result = backtest.simulate(prices, np.array([0, 1, 1, 1]), take_profit=0.1, fee_bps=0)
+    assert result["stopped_trades"] == 1
+    assert result["total_return_pct"] == 10.0
+
+
+def test_several_trades_compound():
+    prices = ohlc([100, 100, 110, 110, 110, 121])
+    result = backtest.simulate(prices, np.array([1, 1, 0, 1, 1, 0]), fee_bps=0)
+    assert result["trades"] == 2
+    assert result["total_return_pct"] == 21.0
+    assert result["avg_trade_pct"] == 10.0
+
+
+def test_no_signal_means_no_trades():
+    result = backtest.simulate(ohlc([100, 120, 90]), np.zeros(3), fee_bps=0)
+    assert (result["trades"], result["pnl"], result["sharpe"]) == (0, 0.0, 0.0)
+
+
+def test_too_few_candles():
+    with pytest.raises(ValueError):
+        backtest.simulate(ohlc([100]), np.array([1]))
+
+
+def test_span_longer_than_one_request_is_rejected():
+    assert "error" in backtest.run_backtest("NSE_EQ|A", "sma_crossover", days=backtest.MAX_DAYS + 1)
@@ -0,0 +1,97 @@
+# tests/test_market_data.py
+"""Bar resampling and the base resolution get_bars builds from."""
+import datetime
+
+import pandas as pd
+import pytest
+
+from src import market_data
+
+
+def minute_candles(day, start="09:15", end="15:29"):
+    """One session of 1-minute candles; candle i opens at 100 + i and closes 0.5 higher."""
+    times = pd.date_range(f"{day} {start}", f"{day} {end}", freq="1min", tz="Asia/Kolkata")
+    rows = [[t.isoformat(), 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 10] for i, t in enumerate(times)]
+    return pd.DataFrame(rows, columns=market_data.CANDLE_COLUMNS)
+
+
+def daily_candles(days):
+    rows = [[f"{day}T00:00:00+05:30", 10.0 + i, 12.0 + i, 9.0 + i, 11.0 + i, 100 * (i + 1)]
+            for i, day in enumerate(days)]
+    return pd.DataFrame(rows, columns=market_data.CANDLE_COLUMNS)
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    for cache in (market_data._bar_cache, market_data._intraday_cache, market_data._merged_cache):
+        cache.invalidate()
+    yield
+
+
+def test_hourly_bars_start_with_the_session():
+    frame = pd.concat([minute_candles("2024-06-03"), minute_candles("2024-06-04")], ignore_index=True)
+    bars = market_data.resample(frame, "1hour")
+    hours = [ts[11:16] for ts in bars["timestamp"]]
+    assert hours == ["09:15", "10:15", "11:15", "12:15", "13:15", "14:15", "15:15"] * 2
+    first = bars.iloc[0]
+    assert (first["open"], first["high"], first["low"], first["close"], first["volume"]) == (100.0, 160.0, 99.0, 159.5, 600)
+    # 15:15-15:29 is a short last bar, not merged into the next day
+    assert bars.iloc[6]["volume"] == 150
+
+
+def test_minute_multiples_align_to_the_clock():
+    bars = market_data.resample(minute_candles("2024-06-03", end="09:44"), "15minute")
+    assert [ts[11:16] for ts in bars["timestamp"]] == ["09:15", "09:30"]
+    assert list(bars["volume"]) == [150, 150]
+
+
+def test_weekly_bars_run_monday_to_friday_and_skip_empty_weeks():
+    days = ["2024-06-03", "2024-06-04", "2024-06-07", "2024-06-10", "2024-06-14", "2024-06-24"]
+    bars = market_data.resample(daily_candles(days), "week")
+    assert [ts[:10] for ts in bars["timestamp"]] == ["2024-06-03", "2024-06-10", "2024-06-24"]
+    week = bars.iloc[0]
+    assert (week["open"], week["high"], week["low"], week["close"], week["volume"]) == (10.0, 14.0, 9.0, 13.0, 600)
+
+
+def test_monthly_bars_split_on_calendar_months():
+    days = ["2024-05-30", "2024-05-31", "2024-06-03", "2024-06-28", "2024-07-01"]
+    bars = market_data.resample(daily_candles(days), "month")
+    assert [ts[:10] for ts in bars["timestamp"]] == ["2024-05-30", "2024-06-03", "2024-07-01"]
+    assert list(bars["close"]) == [12.0, 14.0, 15.0]
+
+
+def test_daily_intervals_use_daily_candles(monkeypatch):
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=n)).isoformat() for n in range(365, -1, -1)]
+    calls = []
+    def fake_candles(symbol, interval="day", days=365, refresh=False):
+        calls.append((interval, days))
+        return frame
+    frame = daily_candles(dates)
+    monkeypatch.setattr(market_data, "get_candles", fake_candles)
+
+    bars = market_data.get_bars("NSE_EQ|A", "1d", days=30)
+    # The exchange's daily candles as they are, sliced to the span
+    assert len(bars) == 31
+    assert bars.iloc[-1]["close"] == frame.iloc[-1]["close"]
+    weekly = market_data.get_bars("NSE_EQ|A", "week", days=30)
+    assert 4 <= len(weekly) <= 6
+    assert set(calls) == {("day", market_data.DAILY_BASE_DAYS)}
+
+
+def test_intraday_intervals_include_todays_session(monkeypatch):
+    history = minute_candles("2024-06-03")
+    today = minute_candles("2024-06-04", end="10:14")
+    monkeypatch.setattr(market_data, "get_candles", lambda symbol, interval="day", days=365, refresh=False: history)
+    monkeypatch.setattr(market_data, "get_intraday_candles", lambda symbol, refresh=False: today)
+
+    bars = market_data.get_bars("NSE_EQ|A", "1h", days=5)
+    assert [ts[:16] for ts in bars["timestamp"]][-2:] == ["2024-06-03T15:15", "2024-06-04T09:15"]
+    # Switching interval over the same span reuses the merged candles
+    assert market_data._intraday_base("NSE_EQ|A", 5) is market_data._intraday_base("NSE_EQ|A", 5)
+
+
+def test_intraday_span_is_limited():
+    result = market_data.get_bars("NSE_EQ|A", "5m", days=market_data.INTRADAY_MAX_DAYS + 1)
+    assert "error" in result
+    assert "error" in market_data.get_bars("NSE_EQ|A", "3h")
@@ -0,0 +1,132 @@
+# tests/test_orders.py
+"""Order-book status transitions, partial fills and LocalOrderFeed."""
+import threading
+
+import pytest
+
+from src import accounts, orders
+
+
+@pytest.fixture
+def book():
+    return orders.OrderBook()
+
+
+def statuses(order):
+    return [t["status"] for t in order["transitions"]]
+
+
+def test_local_feed_acknowledges_then_fills_at_market(book):
+    feed = orders.LocalOrderFeed(book, price_source=lambda key: 250.5)
+    feed.start()
+    try:
+        book.register("o1", instrument_token="NSE_EQ|A", order_type="MARKET", quantity=4)
+        order = book.wait_for_fill("o1", timeout=5)
+    finally:
+        feed.stop()
+    assert order["status"] == "complete"
+    assert statuses(order) == [orders.SUBMITTED, "open", "complete"]
+    assert (order["filled_quantity"], order["pending_quantity"], order["average_price"]) == (4, 0, 250.5)
+    assert "closed_at" in order
+
+
+def test_local_feed_fills_limit_orders_at_their_price(book):
+    feed = orders.LocalOrderFeed(book, price_source=lambda key: 999.0)
+    feed.start()
+    try:
+        book.register("o1", instrument_token="NSE_EQ|A", order_type="LIMIT", price=101.25, quantity=2)
+        order = book.wait_for_fill("o1", timeout=5)
+    finally:
+        feed.stop()
+    assert order["average_price"] == 101.25
+
+
+def test_local_feed_rejects(book):
+    feed = orders.LocalOrderFeed(book, price_source=lambda key: 10.0,
+                                 reject=lambda order: "insufficient funds" if order["quantity"] > 5 else None)
+    feed.start()
+    try:
+        book.register("big", instrument_token="NSE_EQ|A", quantity=6)
+        order = book.wait_for_fill("big", timeout=5)
+    finally:
+        feed.stop()
+    assert order["status"] == "rejected"
+    assert order["status_message"] == "insufficient funds"
+    assert order["filled_quantity"] == 0
+
+
+def test_partial_fills_accumulate_until_complete(book):
+    book.register("o1", quantity=100)
+    book.on_update({"order_id": "o1", "status": "open", "filled_quantity": 0, "pending_quantity": 100})
+    book.on_update({"order_id": "o1", "status": "open", "filled_quantity": 30, "pending_quantity": 70,
+                    "average_price": 10.0})
+    partial = book.on_update({"order_id": "o1", "status": "open", "filled_quantity": 80, "pending_quantity": 20,
+                              "average_price": 10.2})
+    assert (partial["filled_quantity"], partial["pending_quantity"], partial["average_price"]) == (80, 20, 10.2)
+    # Repeated updates in one status record a single transition
+    assert statuses(partial) == [orders.SUBMITTED, "open"]
+
+    done = book.on_update(b'{"order_id": "o1", "status": "COMPLETE", "filled_quantity": 100, '
+                          b'"pending_quantity": 0, "average_price": 10.25}')
+    assert statuses(done) == [orders.SUBMITTED, "open", "complete"]
+    assert (done["filled_quantity"], done["average_price"]) == (100, 10.25)
+
+
+def test_late_updates_after_terminal_are_ignored(book):
+    book.register("o1", quantity=10)
+    book.on_update({"order_id": "o1", "status": "cancelled"})
+    assert book.on_update({"order_id": "o1", "status": "open"}) is None
+    assert book.get("o1")["status"] == "cancelled"
+
+
+def test_stream_can_beat_the_rest_response(book):
+    book.on_update({"order_id": "o1", "status": "open", "quantity": 10, "instrument_token": "NSE_EQ|A"})
+    order = book.register("o1", instrument_token="NSE_EQ|B", quantity=10)
+    # The stream's fields and status win over the registration
+    assert order["status"] == "open"
+    assert order["instrument_token"] == "NSE_EQ|A"
+
+
+def test_unparseable_and_non_order_messages_are_ignored(book):
+    assert book.on_update(b"not json") is None
+    assert book.on_update({"update_type": "position", "order_id": "o1", "status": "open"}) is None
+    assert book.on_update({"order_id": "o1"}) is None
+    assert len(book) == 0
+
+
+def test_wait_for_wakes_on_the_matching_update(book):
+    book.register("o1", quantity=1)
+    timer = threading.Timer(0.05, book.on_update, args=({"order_id": "o1", "status": "complete",
+                                                         "filled_quantity": 1},))
+    timer.start()
+    order = book.wait_for_fill("o1", timeout=5)
+    timer.join()
+    assert order["status"] == "complete"
+
+
+def test_wait_for_times_out_with_latest_state(book):
+    book.register("o1", quantity=1)
+    order = book.wait_for_fill("o1", timeout=0.01)
+    assert order["status"] == orders.SUBMITTED
+
+
+def test_orders_are_scoped_to_their_account(book):
+    with accounts.use_account("alice"):
+        book.register("o1", quantity=1)
+        assert book.get("o1")["account"] == "alice"
+    with accounts.use_account("bob"):
+        assert book.get("o1") is None
+        # Another account's order returns at once instead of waiting out the timeout
+        assert book.wait_for_fill("o1", timeout=30) is None
+        assert book.list() == []
+    assert book.get("o1", account="alice") is not None
+
+
+def test_trim_drops_finished_orders_first(book):
+    book.max_orders = 2
+    book.register("done", quantity=1)
+    book.on_update({"order_id": "done", "status": "complete"})
+    book.register("open1", quantity=1)
+    book.register("open2", quantity=1)
+    assert book.get("done") is None
+    assert book.get("open1") is not None and book.get("open2") is not None
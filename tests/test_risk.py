@@ -0,0 +1,160 @@
+# tests/test_risk.py
+"""Pre-trade limits, reservations settled by order updates, and the daily reset."""
+import datetime
+
+import pytest
+
+from src import accounts, market_hours, orders, risk
+
+MONDAY = datetime.datetime(2024, 6, 3, 10, 0, tzinfo=market_hours.IST)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    state = {"now": MONDAY}
+    monkeypatch.setattr(market_hours, "now_ist", lambda: state["now"])
+    return state
+
+
+@pytest.fixture
+def book():
+    previous = orders.get_book()
+    book = orders.OrderBook()
+    orders.set_book(book)
+    yield book
+    orders.set_book(previous)
+
+
+def make_engine(book, holdings=(), **limits):
+    engine = risk.RiskEngine(limits=limits, holdings_source=lambda account: list(holdings))
+    book.listeners.append(engine.on_order)
+    return engine
+
+
+def place(engine, book, order_id, side="BUY", quantity=10, price=100.0):
+    """Checks an order, registers it with the book and binds the reservation, like trading.place_order."""
+    reservation = engine.check("NSE_EQ|A", side, quantity, None, reference_price=price)
+    book.register(order_id, instrument_token="NSE_EQ|A", transaction_type=side, quantity=quantity)
+    engine.bind(reservation, order_id)
+    return reservation
+
+
+def update(book, order_id, status, **fields):
+    book.on_update({"order_id": order_id, "status": status, "account": accounts.current(), **fields})
+
+
+def test_order_value_limit(clock, book):
+    engine = make_engine(book, max_order_value=1000)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 11, None, reference_price=100.0)
+    assert e.value.rule == "max_order_value"
+    engine.check("NSE_EQ|A", "BUY", 10, None, reference_price=100.0)
+
+
+def test_quantity_must_be_whole(clock, book):
+    engine = make_engine(book)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 1.5, None, reference_price=100.0)
+    assert e.value.rule == "quantity"
+    # JSON tool arguments arrive as floats
+    engine.check("NSE_EQ|A", "BUY", 2.0, None, reference_price=100.0)
+
+
+def test_limit_price_band(clock, book):
+    engine = make_engine(book, price_band_pct=5)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 1, 120.0, reference_price=100.0, order_type="LIMIT")
+    assert e.value.rule == "price_band"
+    engine.check("NSE_EQ|A", "BUY", 1, 104.0, reference_price=100.0, order_type="LIMIT")
+
+
+def test_position_limit_counts_holdings_and_open_orders(clock, book):
+    holdings = [{"instrument_token": "NSE_EQ|A", "quantity": 50, "last_price": 100.0}]
+    engine = make_engine(book, holdings, max_position_value=8000)
+    engine.check("NSE_EQ|A", "BUY", 20, None, reference_price=100.0)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 20, None, reference_price=100.0)
+    assert e.value.rule == "max_position_value"
+    # Reducing the position is always allowed
+    engine.check("NSE_EQ|A", "SELL", 60, None, reference_price=100.0)
+
+
+def test_orders_per_minute(clock, book):
+    engine = make_engine(book, max_orders_per_minute=2)
+    engine.check("NSE_EQ|A", "BUY", 1, None, reference_price=100.0)
+    second = engine.check("NSE_EQ|A", "BUY", 1, None, reference_price=100.0)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 1, None, reference_price=100.0)
+    assert e.value.rule == "max_orders_per_minute"
+    # An order that was never placed gives its slot back
+    engine.release(second)
+    engine.check("NSE_EQ|A", "BUY", 1, None, reference_price=100.0)
+
+
+def test_fill_moves_reservation_into_position(clock, book):
+    engine = make_engine(book)
+    place(engine, book, "o1", quantity=10, price=100.0)
+    assert engine.snapshot()["positions"]["NSE_EQ|A"] == {"quantity": 0, "value": 0.0, "pending": 1000.0}
+
+    update(book, "o1", "complete", filled_quantity=10, average_price=101.0)
+    snap = engine.snapshot()
+    assert snap["positions"]["NSE_EQ|A"] == {"quantity": 10, "value": 1010.0, "pending": 0.0}
+    assert snap["open_orders"] == 0
+    assert snap["bought_today"] == 1010.0
+
+
+def test_partial_fill_then_cancel_releases_the_rest(clock, book):
+    engine = make_engine(book)
+    place(engine, book, "o1", quantity=100, price=10.0)
+    update(book, "o1", "open", filled_quantity=40, average_price=10.0)
+    position = engine.snapshot()["positions"]["NSE_EQ|A"]
+    assert (position["quantity"], position["value"], position["pending"]) == (40, 400.0, 600.0)
+
+    update(book, "o1", "cancelled", filled_quantity=40, average_price=10.0)
+    snap = engine.snapshot()
+    assert snap["positions"]["NSE_EQ|A"] == {"quantity": 40, "value": 400.0, "pending": 0.0}
+    assert snap["total_exposure"] == 400.0
+    assert snap["bought_today"] == 400.0
+
+
+def test_rejection_releases_reservation(clock, book):
+    engine = make_engine(book, max_total_exposure=1500)
+    place(engine, book, "o1", quantity=10, price=100.0)
+    with pytest.raises(risk.RiskError):
+        engine.check("NSE_EQ|B", "BUY", 10, None, reference_price=100.0)
+    update(book, "o1", "rejected", status_message="insufficient funds")
+    assert engine.snapshot()["total_exposure"] == 0.0
+    engine.check("NSE_EQ|B", "BUY", 10, None, reference_price=100.0)
+
+
+def test_daily_buy_limit_resets_each_ist_day(clock, book):
+    engine = make_engine(book, max_daily_buy_value=10000, max_orders_per_minute=1)
+    place(engine, book, "o1", quantity=60, price=100.0)
+    update(book, "o1", "complete", filled_quantity=60, average_price=100.0)
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "BUY", 50, None, reference_price=100.0)
+    # The rate limit is checked last, so the buy limit is what fails here
+    assert e.value.rule == "max_daily_buy_value"
+    # Sells don't count against the buy limit
+    with pytest.raises(risk.RiskError) as e:
+        engine.check("NSE_EQ|A", "SELL", 10, None, reference_price=100.0)
+    assert e.value.rule == "max_orders_per_minute"
+
+    clock["now"] = MONDAY + datetime.timedelta(days=1)
+    assert engine.snapshot()["bought_today"] == 0.0
+    assert engine.snapshot()["orders_last_minute"] == 0
+    engine.check("NSE_EQ|A", "BUY", 50, None, reference_price=100.0)
+
+
+def test_open_buys_carry_into_the_next_day(clock, book):
+    engine = make_engine(book, max_daily_buy_value=10000)
+    place(engine, book, "filled", quantity=30, price=100.0)
+    update(book, "filled", "complete", filled_quantity=30, average_price=100.0)
+    place(engine, book, "open", quantity=40, price=100.0)
+    assert engine.snapshot()["bought_today"] == 7000.0
+
+    clock["now"] = MONDAY + datetime.timedelta(days=1)
+    assert engine.snapshot()["bought_today"] == 4000.0
+    # Cancelling yesterday's order frees today's total
+    update(book, "open", "cancelled")
+    assert engine.snapshot()["bought_today"] == 0.0